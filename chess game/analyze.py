@@ -0,0 +1,260 @@
+# Bulk engine analysis of PGN archives.
+#
+# Games are streamed with pgn.open_games and every position of every game is
+# sent to a process pool, where each worker keeps a Searcher and searches to
+# a fixed depth or for a fixed time. At most --window positions are in flight
+# at once: when the window is full the oldest search is waited for before
+# another game is read, so memory stays flat however large the archive is.
+# Results come back in submission order and each game is written out as soon
+# as its last position is done, either as PGN with [%eval] comments and NAGs
+# on the weak moves, or as one row per move in a CSV file (or Parquet, when
+# pyarrow is installed).
+#
+# A move's loss is the best score before it minus the score after it, both
+# from the mover's side, with mate scores capped at MATE_CAP centipawns.
+#
+#   python analyze.py games.pgn -o annotated.pgn [--depth 4 | --movetime 0.5] [--workers 4]
+#   python analyze.py games.pgn -o moves.csv
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+
+from pgn import open_games, format_game
+from position import Position, move_text
+from search import Searcher, MATE_SCORE, MATE_BOUND, MAX_PLY
+from transposition import TranspositionTable
+
+MATE_CAP = 1000
+# (minimum loss in centipawns, label, NAG), worst first
+CLASSIFICATIONS = ((300, 'blunder', '$4'), (150, 'mistake', '$2'), (70, 'inaccuracy', '$6'))
+COLUMNS = ('game', 'ply', 'move_number', 'side', 'san', 'fen', 'best_move', 'eval_cp', 'loss_cp',
+           'classification', 'depth', 'nodes')
+ROW_GROUP = 10000 # Rows per Parquet row group
+
+_searcher = None
+
+
+def _worker_init(tt_size_mb):
+    global _searcher
+    _searcher = Searcher(TranspositionTable(tt_size_mb))
+
+
+def analyse_position(fen, depth, movetime):
+    # (score for the side to move, best move text or None, depth, nodes)
+    position = Position.from_fen(fen)
+    if not position.legal_moves():
+        return (-MATE_SCORE if position.in_check() else 0), None, 0, 0
+    result = _searcher.search(position, time_limit=movetime, max_depth=depth)
+    best = move_text(result.best_move) if result.best_move else None
+    return result.score, best, result.depth, result.nodes
+
+
+def capped(score):
+    return max(-MATE_CAP, min(MATE_CAP, score))
+
+
+def classify(loss):
+    for threshold, label, nag in CLASSIFICATIONS:
+        if loss >= threshold:
+            return label, nag
+    return '', ''
+
+
+def eval_text(score):
+    # [%eval] value from White's side: pawns, or '#n' for a mate in n moves
+    if score >= MATE_BOUND:
+        return f"#{(MATE_SCORE - score + 1) // 2}"
+    if score <= -MATE_BOUND:
+        return f"#-{(MATE_SCORE + score) // 2}"
+    return f"{score / 100:.2f}"
+
+
+class GameJob:
+    # One game on its way through the pool
+    def __init__(self, number, game, fens, sans):
+        self.number = number
+        self.game = game
+        self.fens = fens # Before every move, and the final position
+        self.sans = sans
+        self.results = [None] * len(fens)
+        self.missing = len(fens)
+
+    def rows(self):
+        rows = []
+        for ply, san in enumerate(self.sans):
+            score, best, depth, nodes = self.results[ply]
+            after = self.results[ply + 1][0]
+            loss = max(capped(score) + capped(after), 0) # -after is the played move's score for the mover
+            label, nag = classify(loss)
+            white = self.fens[ply].split()[1] == 'w'
+            white_after = -after if white else after
+            rows.append({'game': self.number, 'ply': ply + 1,
+                         'move_number': int(self.fens[ply].split()[5]), 'side': 'white' if white else 'black',
+                         'san': san, 'fen': self.fens[ply], 'best_move': best or '', 'eval_cp': white_after,
+                         'loss_cp': loss, 'classification': label, 'depth': depth, 'nodes': nodes, 'nag': nag})
+        return rows
+
+
+def _replay(game):
+    # (fens, sans) of a game's main line, stopping at the first unreadable move
+    fens, sans = [], []
+    position = None
+    try:
+        position = Position.from_fen(game.start_fen())
+        for position, _ in game.replay():
+            fens.append(position.fen())
+            sans.append(game.moves[len(sans)])
+    except ValueError as error:
+        print(f"game {game.headers.get('White', '?')} - {game.headers.get('Black', '?')}: {error}", file=sys.stderr)
+    if position is not None:
+        fens.append(position.fen()) # replay() has played every move it yielded
+    return fens, sans
+
+
+class PGNOutput:
+    def __init__(self, path):
+        self.stream = open(path, 'w', encoding='utf-8')
+
+    def write(self, job, rows):
+        tokens = []
+        for row in rows:
+            token = row['san'] + (' ' + row['nag'] if row['nag'] else '')
+            comment = f"[%eval {eval_text(row['eval_cp'])}]"
+            if row['classification']:
+                comment += f" {row['classification']}, best was {row['best_move']}"
+            tokens.append(f"{token} {{{comment}}}")
+        start_fen = job.game.start_fen()
+        position = Position.from_fen(start_fen)
+        headers = {name: value for name, value in job.game.headers.items() if name not in ('Result', 'SetUp', 'FEN')}
+        self.stream.write(format_game(headers, tokens, job.game.result, start_fen, position.fullmove_number,
+                                      position.turn == 'black'))
+
+    def close(self):
+        self.stream.close()
+
+
+class CSVOutput:
+    def __init__(self, path):
+        self.stream = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.stream, COLUMNS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, job, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.stream.close()
+
+
+class ParquetOutput:
+    # Buffers ROW_GROUP rows at a time, so the file is written in row groups
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow); use a .csv file instead") from None
+        self.pyarrow = pyarrow
+        self.writer = None
+        self.path = path
+        self.rows = []
+
+    def write(self, job, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= ROW_GROUP:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = self.pyarrow.table({name: [row[name] for row in self.rows] for name in COLUMNS})
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_output(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.pgn':
+        return PGNOutput(path)
+    if extension == '.parquet':
+        return ParquetOutput(path)
+    return CSVOutput(path)
+
+
+def analyse_archive(pgn_path, output, depth=None, movetime=None, workers=2, window=None, tt_size_mb=8,
+                    log=print):
+    window = window or workers * 4
+    context = multiprocessing.get_context('spawn')
+    pool = context.Pool(workers, initializer=_worker_init, initargs=(tt_size_mb,))
+    in_flight = deque() # (job, ply, AsyncResult) in submission order
+    games = deque() # Jobs not yet written, oldest first
+    positions = blunders = 0
+    start = time.monotonic()
+
+    def collect_oldest():
+        nonlocal positions, blunders
+        job, ply, pending = in_flight.popleft()
+        job.results[ply] = pending.get()
+        job.missing -= 1
+        positions += 1
+        while games and not games[0].missing:
+            done = games.popleft()
+            rows = done.rows()
+            blunders += sum(row['classification'] == 'blunder' for row in rows)
+            output.write(done, rows)
+            if done.number % 10 == 0:
+                elapsed = max(time.monotonic() - start, 1e-9)
+                log(f"{done.number} games, {positions} positions, {positions / elapsed:.1f} positions/sec")
+
+    try:
+        for number, game in enumerate(open_games(pgn_path), 1):
+            fens, sans = _replay(game)
+            job = GameJob(number, game, fens, sans)
+            games.append(job)
+            for ply, fen in enumerate(fens):
+                while len(in_flight) >= window:
+                    collect_oldest()
+                in_flight.append((job, ply, pool.apply_async(analyse_position, (fen, depth, movetime))))
+        while in_flight:
+            collect_oldest()
+    finally:
+        pool.terminate()
+        pool.join()
+    elapsed = max(time.monotonic() - start, 1e-9)
+    log(f"done: {positions} positions in {elapsed:.1f}s ({positions / elapsed:.1f} positions/sec), "
+        f"{blunders} blunders")
+    return positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotate PGN games with engine evaluations")
+    parser.add_argument('pgn')
+    parser.add_argument('-o', '--output', required=True, help=".pgn for annotated games, .csv or .parquet for rows")
+    parser.add_argument('--depth', type=int, help="fixed search depth (default 4 unless --movetime is given)")
+    parser.add_argument('--movetime', type=float, help="seconds per position")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--window', type=int, help="positions in flight at once (default 4 per worker)")
+    args = parser.parse_args()
+
+    depth = args.depth or (MAX_PLY if args.movetime else 4)
+    output = open_output(args.output)
+    try:
+        analyse_archive(args.pgn, output, depth, args.movetime, args.workers, args.window)
+    finally:
+        output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+# Vectorized move generation over many positions at once, with NumPy.
+#
+# A batch is N positions held as an (N, 12) uint64 array of piece bitboards,
+# indexed color * 6 + piece type (the order of BitboardPosition.pieces), plus
+# side to move, castling rights and en passant square per position. Every
+# function below works on whole columns of that array: sliding attacks use
+# Kogge-Stone occluded fills, one direction at a time, and all other pieces
+# are shifted bitboards, so the Python-level work does not grow with N.
+#
+# Per-piece counts never need a loop over pieces: within one direction the
+# rays of several sliders are disjoint, and every (piece, direction) pair
+# lands on its own square, so popcounts of the set-wise moves add up to the
+# per-piece totals. Pinned pieces are taken out of the sets and counted
+# along their pin lines, and en passant captures are checked by replaying
+# the capture on the occupancy, as Position does.
+#
+#   python batch.py [positions]    # checks against Position and compares speed
+
+import sys
+import time
+
+import numpy as np
+
+from bitboard import WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_TYPES
+
+NOT_A = 0xFEFEFEFEFEFEFEFE
+NOT_H = 0x7F7F7F7F7F7F7F7F
+NOT_AB = 0xFCFCFCFCFCFCFCFC
+NOT_GH = 0x3F3F3F3F3F3F3F3F
+FULL = 0xFFFFFFFFFFFFFFFF
+RANK_3 = 0xFF << 16
+RANK_6 = 0xFF << 40
+BACK_RANKS = 0xFF | 0xFF << 56
+
+# (shift, mask of squares a step may land on); the first four are rook
+# directions, the last four bishop directions, and d ^ 1 is the opposite of d
+DIRECTIONS = ((8, FULL), (-8, FULL), (1, NOT_A), (-1, NOT_H), (9, NOT_A), (-9, NOT_H), (7, NOT_H), (-7, NOT_A))
+KNIGHT_STEPS = ((17, NOT_A), (15, NOT_H), (10, NOT_AB), (6, NOT_GH), (-6, NOT_AB), (-10, NOT_GH),
+                (-15, NOT_A), (-17, NOT_H))
+# Castling: (rights bit, squares that must be empty, squares that must not be attacked, king, rook)
+CASTLING = ((1, 0x60, 0x70, 4, 7), (2, 0x0E, 0x1C, 4, 0), (4, 0x60 << 56, 0x70 << 56, 60, 63),
+            (8, 0x0E << 56, 0x1C << 56, 60, 56))
+
+
+def _shift(bb, shift):
+    return bb << np.uint64(shift) if shift > 0 else bb >> np.uint64(-shift)
+
+
+def _ray(gen, empty, direction):
+    # Squares attacked by sliders on `gen` in one direction, up to and
+    # including the first blocker
+    shift, mask = DIRECTIONS[direction]
+    empty = empty & np.uint64(mask)
+    gen = gen | (empty & _shift(gen, shift))
+    empty = empty & _shift(empty, shift)
+    gen = gen | (empty & _shift(gen, 2 * shift))
+    empty = empty & _shift(empty, 2 * shift)
+    gen = gen | (empty & _shift(gen, 4 * shift))
+    return _shift(gen, shift) & np.uint64(mask)
+
+
+def _pawn_captures(color, pawns):
+    # (left-side, right-side) capture targets
+    if color == WHITE:
+        return _shift(pawns, 7) & np.uint64(NOT_H), _shift(pawns, 9) & np.uint64(NOT_A)
+    return _shift(pawns, -9) & np.uint64(NOT_H), _shift(pawns, -7) & np.uint64(NOT_A)
+
+
+def _steps(bb, steps):
+    return [_shift(bb, shift) & np.uint64(mask) for shift, mask in steps]
+
+
+def _union(parts):
+    result = parts[0]
+    for part in parts[1:]:
+        result = result | part
+    return result
+
+
+def _count(bb):
+    return np.bitwise_count(bb).astype(np.int32)
+
+
+class Batch:
+    def __init__(self, bitboards, turn=None, castling=None, ep=None):
+        self.bitboards = np.ascontiguousarray(bitboards, dtype=np.uint64)
+        n = len(self.bitboards)
+        self.turn = np.zeros(n, np.uint8) if turn is None else np.asarray(turn, np.uint8) # 0 white, 1 black
+        self.castling = np.zeros(n, np.uint8) if castling is None else np.asarray(castling, np.uint8)
+        self.ep = np.full(n, -1, np.int8) if ep is None else np.asarray(ep, np.int8) # -1: none
+
+    def __len__(self):
+        return len(self.bitboards)
+
+    @classmethod
+    def from_positions(cls, positions):
+        bitboards = np.array([position.board.pieces[WHITE] + position.board.pieces[BLACK]
+                              for position in positions], dtype=np.uint64).reshape(-1, 12)
+        turn = [position.turn == 'black' for position in positions]
+        castling = [position.castling for position in positions]
+        ep = [-1 if position.ep_square is None else position.ep_square for position in positions]
+        return cls(bitboards, turn, castling, ep)
+
+    @classmethod
+    def from_mailbox(cls, boards, turn=None, castling=None, ep=None):
+        # boards: (N, 64) int8 in the Position.squares encoding, piece type + 1
+        # for White and its negation for Black
+        boards = np.asarray(boards, dtype=np.int8)
+        bits = np.uint64(1) << np.arange(64, dtype=np.uint64)
+        bitboards = np.empty((len(boards), 12), np.uint64)
+        for color, sign in ((WHITE, 1), (BLACK, -1)):
+            for ptype in range(6):
+                bitboards[:, color * 6 + ptype] = np.where(boards == sign * (ptype + 1), bits, 0).sum(axis=1,
+                                                                                                      dtype=np.uint64)
+        return cls(bitboards, turn, castling, ep)
+
+    def pieces(self, color):
+        # Six (N,) bitboard columns, pawn to king
+        return [self.bitboards[:, color * 6 + ptype] for ptype in range(6)]
+
+    def side_arrays(self):
+        # Columns for the side to move and the opponent, picked per position
+        black = self.turn.astype(bool)[:, None]
+        white, black_pieces = self.bitboards[:, :6], self.bitboards[:, 6:]
+        us = np.where(black, black_pieces, white)
+        them = np.where(black, white, black_pieces)
+        return [us[:, t] for t in range(6)], [them[:, t] for t in range(6)]
+
+
+def attacks_by(color, pieces, occupied):
+    # Squares attacked by one side's pieces (a list of six columns) with the
+    # given occupancy; color is WHITE, BLACK or a per-position array of them
+    empty = ~occupied
+    pawns = pieces[PAWN]
+    if np.ndim(color):
+        black = color.astype(bool)
+        white_left, white_right = _pawn_captures(WHITE, pawns)
+        black_left, black_right = _pawn_captures(BLACK, pawns)
+        attacked = np.where(black, black_left | black_right, white_left | white_right)
+    else:
+        left, right = _pawn_captures(color, pawns)
+        attacked = left | right
+    attacked = attacked | _union(_steps(pieces[KNIGHT], KNIGHT_STEPS))
+    attacked = attacked | _union(_steps(pieces[KING], DIRECTIONS))
+    rooks = pieces[ROOK] | pieces[QUEEN]
+    bishops = pieces[BISHOP] | pieces[QUEEN]
+    for direction in range(8):
+        attacked = attacked | _ray(rooks if direction < 4 else bishops, empty, direction)
+    return attacked
+
+
+def attack_maps(batch):
+    # (N, 2) uint64: every square attacked by White and by Black
+    occupied = np.bitwise_or.reduce(batch.bitboards, axis=1)
+    return np.stack([attacks_by(color, batch.pieces(color), occupied) for color in (WHITE, BLACK)], axis=1)
+
+
+def mobility(batch):
+    # (N, 2, 6) int32: pseudo-legal target squares per piece type and color,
+    # the counts evaluation.mobility works from (no castling or en passant)
+    occupied = np.bitwise_or.reduce(batch.bitboards, axis=1)
+    empty = ~occupied
+    counts = np.zeros((len(batch), 2, 6), np.int32)
+    for color in (WHITE, BLACK):
+        pieces = batch.pieces(color)
+        not_own = ~_union(pieces)
+        enemy = occupied & not_own
+        push = 8 if color == WHITE else -8
+        single = _shift(pieces[PAWN], push) & empty
+        double = _shift(single & np.uint64(RANK_3 if color == WHITE else RANK_6), push) & empty
+        left, right = _pawn_captures(color, pieces[PAWN])
+        counts[:, color, PAWN] = _count(single) + _count(double) + _count(left & enemy) + _count(right & enemy)
+        for ptype, steps in ((KNIGHT, KNIGHT_STEPS), (KING, DIRECTIONS)):
+            counts[:, color, ptype] = sum(_count(targets & not_own) for targets in _steps(pieces[ptype], steps))
+        for ptype, directions in ((BISHOP, range(4, 8)), (ROOK, range(4)), (QUEEN, range(8))):
+            counts[:, color, ptype] = sum(_count(_ray(pieces[ptype], empty, d) & not_own) for d in directions)
+    return counts
+
+
+def _pawn_move_count(turn_black, pawns, empty, enemy, allowed):
+    # Pawn moves landing on `allowed`, promotions counted once per piece
+    pushes = np.where(turn_black, _shift(pawns, -8), _shift(pawns, 8)) & empty
+    double_rank = np.where(turn_black, np.uint64(RANK_6), np.uint64(RANK_3))
+    doubles = np.where(turn_black, _shift(pushes & double_rank, -8), _shift(pushes & double_rank, 8)) & empty
+    white_left, white_right = _pawn_captures(WHITE, pawns)
+    black_left, black_right = _pawn_captures(BLACK, pawns)
+    left = np.where(turn_black, black_left, white_left) & enemy
+    right = np.where(turn_black, black_right, white_right) & enemy
+    total = _count(doubles & allowed)
+    for targets in (pushes, left, right):
+        targets = targets & allowed
+        total += _count(targets) + 3 * _count(targets & np.uint64(BACK_RANKS))
+    return total
+
+
+def _king_attackers(us_black, king, them, occupied):
+    # Enemy pieces (columns `them`) attacking the king squares
+    empty = ~occupied
+    # A king square "attacks" like a pawn of its own color would
+    white_left, white_right = _pawn_captures(WHITE, king)
+    black_left, black_right = _pawn_captures(BLACK, king)
+    pawn_reach = np.where(us_black, black_left | black_right, white_left | white_right)
+    attackers = (pawn_reach & them[PAWN]) | (_union(_steps(king, KNIGHT_STEPS)) & them[KNIGHT])
+    rooks = them[ROOK] | them[QUEEN]
+    bishops = them[BISHOP] | them[QUEEN]
+    for direction in range(8):
+        attackers = attackers | (_ray(king, empty, direction) & (rooks if direction < 4 else bishops))
+    return attackers
+
+
+def legal_move_counts(batch):
+    # (N,) int32: the number of legal moves for the side to move, the same
+    # as len(Position.legal_moves()) (a promotion counts as four moves)
+    us, them = batch.side_arrays()
+    us_black = batch.turn.astype(bool)
+    own = _union(us)
+    enemy = _union(them)
+    occupied = own | enemy
+    empty = ~occupied
+    king = us[KING]
+    zero = np.uint64(0)
+
+    checkers = _king_attackers(us_black, king, them, occupied)
+    check_count = _count(checkers)
+    check_mask = checkers
+    for direction in range(8):
+        ray = _ray(king, empty, direction)
+        check_mask = check_mask | np.where(ray & checkers, ray, zero)
+    check_mask = np.where(check_count == 0, np.uint64(FULL), np.where(check_count == 1, check_mask, zero))
+
+    # Pins: an own piece that is the first blocker from the king, with an
+    # enemy slider of the matching kind right behind it
+    pinned = zero
+    pin_lines = []
+    for direction in range(8):
+        sliders = them[QUEEN] | (them[ROOK] if direction < 4 else them[BISHOP])
+        near = _ray(king, empty, direction)
+        blocker = near & own
+        far = _ray(king, empty | blocker, direction)
+        pinned_here = np.where((far & ~near & sliders) != 0, blocker, zero)
+        pinned = pinned | pinned_here
+        pin_lines.append((pinned_here, far))
+
+    not_own = ~own
+    allowed = not_own & check_mask
+    free = [pieces & ~pinned for pieces in us]
+    total = _pawn_move_count(us_black, free[PAWN], empty, enemy, check_mask)
+    total += sum(_count(targets & allowed) for targets in _steps(free[KNIGHT], KNIGHT_STEPS))
+    for direction in range(8):
+        sliders = free[QUEEN] | (free[ROOK] if direction < 4 else free[BISHOP])
+        total += _count(_ray(sliders, empty, direction) & allowed)
+    for direction, (pinned_here, line) in enumerate(pin_lines):
+        # A pinned piece can only move along its pin line, which also covers
+        # capturing the pinner
+        sliders = pinned_here & (us[QUEEN] | (us[ROOK] if direction < 4 else us[BISHOP]))
+        along = _ray(sliders, empty, direction) | _ray(sliders, empty, direction ^ 1)
+        total += _count(along & allowed)
+        total += _pawn_move_count(us_black, pinned_here & us[PAWN], empty, enemy, check_mask & line)
+
+    # King steps onto squares the opponent does not attack once the king has left its square
+    danger = attacks_by(~us_black, them, occupied ^ king)
+    total += sum(_count(targets & not_own & ~danger) for targets in _steps(king, DIRECTIONS))
+
+    # Castling: rights, empty path, and no attacked square from the king's start to its target
+    for bit, path, safe, king_square, rook_square in CASTLING:
+        rook_here = (np.uint64(1 << rook_square) & us[ROOK]) != 0
+        king_here = (np.uint64(1 << king_square) & king) != 0
+        can = ((batch.castling & bit) != 0) & rook_here & king_here & ((occupied & np.uint64(path)) == 0) & \
+            ((danger & np.uint64(safe)) == 0)
+        total += can.astype(np.int32)
+
+    # En passant: make the capture on the occupancy and look for attacks on the king
+    has_ep = batch.ep >= 0
+    if has_ep.any():
+        ep_bit = np.where(has_ep, np.uint64(1) << batch.ep.clip(0).astype(np.uint64), zero)
+        captured = np.where(us_black, _shift(ep_bit, 8), _shift(ep_bit, -8)) & them[PAWN]
+        white_left, white_right = _pawn_captures(WHITE, ep_bit)
+        black_left, black_right = _pawn_captures(BLACK, ep_bit)
+        # Our pawns that attack the ep square stand where an enemy pawn on it would attack
+        for from_side in (np.where(us_black, white_left, black_left), np.where(us_black, white_right, black_right)):
+            capturer = from_side & us[PAWN]
+            after = occupied ^ capturer ^ captured | ep_bit
+            remaining = [pieces & ~captured if ptype == PAWN else pieces for ptype, pieces in enumerate(them)]
+            safe = _king_attackers(us_black, king, remaining, after) == 0
+            total += ((capturer != 0) & (captured != 0) & safe).astype(np.int32)
+    return total
+
+
+def in_check(batch):
+    us, them = batch.side_arrays()
+    occupied = _union(us) | _union(them)
+    return _king_attackers(batch.turn.astype(bool), us[KING], them, occupied) != 0
+
+
+def features(batch):
+    # Everything at once: attacked square counts (N, 2), mobility (N, 2, 6),
+    # legal move counts (N,) and whether the side to move is in check (N,)
+    return {
+        'attacked_squares': _count(attack_maps(batch)),
+        'mobility': mobility(batch),
+        'legal_moves': legal_move_counts(batch),
+        'in_check': in_check(batch),
+    }
+
+
+def scalar_features(position):
+    # The same features from Position, one position at a time
+    board = position.board
+    counts = [[0] * 6, [0] * 6]
+    for color_index, color in enumerate(('white', 'black')):
+        pieces, _ = position.pieces_and_locations(color)
+        for piece, targets in zip(pieces, position.options_for(color)):
+            counts[color_index][PIECE_TYPES[piece]] += targets.bit_count()
+    return {
+        'attacked_squares': [board.attacks_by(color, board.occupied).bit_count() for color in (WHITE, BLACK)],
+        'mobility': counts,
+        'legal_moves': len(position.legal_moves()),
+        'in_check': position.in_check(),
+    }
+
+
+
+def main():
+    from evaluation import sample_positions
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    positions = sample_positions(count)
+
+    start = time.perf_counter()
+    expected = [scalar_features(position) for position in positions]
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = Batch.from_positions(positions)
+    packed = time.perf_counter() - start
+    result = features(batch)
+    vectorized = time.perf_counter() - start
+
+    mismatches = 0
+    for i, want in enumerate(expected):
+        got = {'attacked_squares': result['attacked_squares'][i].tolist(), 'mobility': result['mobility'][i].tolist(),
+               'legal_moves': int(result['legal_moves'][i]), 'in_check': bool(result['in_check'][i])}
+        if got != want:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"mismatch at {positions[i].fen()}: {got} != {want}")
+    print(f"{count} positions, {mismatches} mismatches")
+    print(f"scalar loop: {scalar:.3f}s ({count / scalar:.0f} positions/sec)")
+    print(f"batch:       {vectorized:.3f}s ({count / vectorized:.0f} positions/sec, "
+          f"{packed:.3f}s of it building the arrays), {scalar / vectorized:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# Perft-style benchmark: bitboard move generation versus the original
+# list-scan generators that ChessGame.check_options used before bitboard.py.
+#
+#   python bench_movegen.py [depth]
+
+import sys
+import time
+
+from bitboard import BitboardPosition, WHITE
+
+
+class ListScanBoard:
+    # The pre-bitboard algorithm: every target square is tested with `in`
+    # against the lists of piece locations.
+    def __init__(self, white_pieces, white_locations, black_pieces, black_locations):
+        self.white_pieces = list(white_pieces)
+        self.white_locations = list(white_locations)
+        self.black_pieces = list(black_pieces)
+        self.black_locations = list(black_locations)
+
+    def get_enemies_friends(self, color):
+        if color == 'white':
+            return self.white_locations, self.black_locations
+        return self.black_locations, self.white_locations
+
+    def check_options(self, pieces, locations, color):
+        checks = {'pawn': self.check_pawn, 'rook': self.check_rook, 'knight': self.check_knight,
+                  'bishop': self.check_bishop, 'queen': self.check_queen, 'king': self.check_king}
+        return [checks[piece](location, color) for piece, location in zip(pieces, locations)]
+
+    def check_king(self, position, color):
+        moves_list = []
+        friends_list, _ = self.get_enemies_friends(color)
+        for dr in [-1, 0, 1]:
+            for dc in [-1, 0, 1]:
+                if dr == 0 and dc == 0:
+                    continue
+                target_row, target_col = position[1] + dr, position[0] + dc
+                if 0 <= target_row <= 7 and 0 <= target_col <= 7:
+                    target_pos = (target_col, target_row)
+                    if target_pos not in friends_list:
+                        moves_list.append(target_pos)
+        return moves_list
+
+    def check_queen(self, position, color):
+        moves_list = self.check_bishop(position, color)
+        moves_list.extend(self.check_rook(position, color))
+        return moves_list
+
+    def check_slider(self, position, color, directions):
+        moves_list = []
+        friends_list, enemies_list = self.get_enemies_friends(color)
+        for dr, dc in directions:
+            for i in range(1, 8):
+                target_row, target_col = position[1] + i * dr, position[0] + i * dc
+                if 0 <= target_row <= 7 and 0 <= target_col <= 7:
+                    target_pos = (target_col, target_row)
+                    if target_pos in friends_list:
+                        break
+                    moves_list.append(target_pos)
+                    if target_pos in enemies_list:
+                        break
+                else:
+                    break
+        return moves_list
+
+    def check_bishop(self, position, color):
+        return self.check_slider(position, color, [(-1, -1), (-1, 1), (1, -1), (1, 1)])
+
+    def check_rook(self, position, color):
+        return self.check_slider(position, color, [(-1, 0), (1, 0), (0, -1), (0, 1)])
+
+    def check_pawn(self, position, color):
+        moves_list = []
+        c, r = position
+        occupied = self.white_locations + self.black_locations
+        direction, start_row = (1, 1) if color == 'white' else (-1, 6)
+        _, enemies_list = self.get_enemies_friends(color)
+        if 0 <= r + direction <= 7 and (c, r + direction) not in occupied:
+            moves_list.append((c, r + direction))
+            if r == start_row and (c, r + 2 * direction) not in occupied:
+                moves_list.append((c, r + 2 * direction))
+        for dc in (-1, 1):
+            if 0 <= c + dc <= 7 and (c + dc, r + direction) in enemies_list:
+                moves_list.append((c + dc, r + direction))
+        return moves_list
+
+    def check_knight(self, position, color):
+        moves_list = []
+        friends_list, _ = self.get_enemies_friends(color)
+        r, c = position[1], position[0]
+        for dr, dc in [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]:
+            target_row, target_col = r + dr, c + dc
+            if 0 <= target_row <= 7 and 0 <= target_col <= 7:
+                target_pos = (target_col, target_row)
+                if target_pos not in friends_list:
+                    moves_list.append(target_pos)
+        return moves_list
+
+    def perft(self, color, depth):
+        if depth == 0:
+            return 1
+        if color == 'white':
+            pieces, locations = self.white_pieces, self.white_locations
+            opponent_pieces, opponent_locations = self.black_pieces, self.black_locations
+            next_color, last_row = 'black', 7
+        else:
+            pieces, locations = self.black_pieces, self.black_locations
+            opponent_pieces, opponent_locations = self.white_pieces, self.white_locations
+            next_color, last_row = 'white', 0
+        options = self.check_options(pieces, locations, color)
+        if depth == 1:
+            return sum(len(moves) for moves in options)
+        nodes = 0
+        for index, moves in enumerate(options):
+            start = locations[index]
+            piece = pieces[index]
+            for target in moves:
+                captured = None
+                if target in opponent_locations:
+                    captured_idx = opponent_locations.index(target)
+                    captured = (captured_idx, opponent_pieces.pop(captured_idx), opponent_locations.pop(captured_idx))
+                locations[index] = target
+                if piece == 'pawn' and target[1] == last_row:
+                    pieces[index] = 'queen'
+                nodes += self.perft(next_color, depth - 1)
+                pieces[index] = piece
+                locations[index] = start
+                if captured is not None:
+                    opponent_pieces.insert(captured[0], captured[1])
+                    opponent_locations.insert(captured[0], captured[2])
+        return nodes
+
+
+def start_lists():
+    back_rank = ['rook', 'knight', 'bishop', 'king', 'queen', 'bishop', 'knight', 'rook']
+    pieces = back_rank + ['pawn'] * 8
+    white_locations = [(col, 0) for col in range(8)] + [(col, 1) for col in range(8)]
+    black_locations = [(col, 7) for col in range(8)] + [(col, 6) for col in range(8)]
+    return list(pieces), white_locations, list(pieces), black_locations
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    lists = start_lists()
+
+    print(f"Perft from the start position (game rules), depth 1..{depth}")
+    print(f"{'depth':>5} {'nodes':>10} {'list-scan n/s':>15} {'bitboard n/s':>15} {'speedup':>8}")
+    for d in range(1, depth + 1):
+        list_nodes, list_time = timed(ListScanBoard(*lists).perft, 'white', d)
+        bb_nodes, bb_time = timed(BitboardPosition.from_lists(*lists).perft, WHITE, d)
+        if list_nodes != bb_nodes:
+            print(f"MISMATCH at depth {d}: list-scan {list_nodes}, bitboard {bb_nodes}")
+            sys.exit(1)
+        list_nps = list_nodes / max(list_time, 1e-9)
+        bb_nps = bb_nodes / max(bb_time, 1e-9)
+        print(f"{d:>5} {bb_nodes:>10} {list_nps:>15,.0f} {bb_nps:>15,.0f} {list_time / max(bb_time, 1e-9):>7.1f}x")
+
+    # The interactive path: regenerate both sides' options, as handle_click does after a move
+    repeats = 2000
+    board = ListScanBoard(*lists)
+    _, list_time = timed(lambda: [(board.check_options(board.white_pieces, board.white_locations, 'white'),
+                                   board.check_options(board.black_pieces, board.black_locations, 'black'))
+                                  for _ in range(repeats)])
+    def bitboard_options():
+        board = BitboardPosition.from_lists(*lists)
+        return board.options(lists[0], lists[1], 'white'), board.options(lists[2], lists[3], 'black')
+    _, bb_time = timed(lambda: [bitboard_options() for _ in range(repeats)])
+    print(f"check_options for both sides: list-scan {list_time / repeats * 1e6:.1f} us, "
+          f"bitboard {bb_time / repeats * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
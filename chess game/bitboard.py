@@ -0,0 +1,343 @@
+# Bitboard position representation and move generation for the chess game.
+#
+# Squares are numbered 0..63 from a1 to h8 (rank * 8 + file). The Tk board in
+# game.py stores pieces as (col, row) tuples with White on row 0 and the h-file
+# in col 0, so square_of() / coords_of() translate between the two.
+
+WHITE = 0
+BLACK = 1
+COLOR_NAMES = ('white', 'black')
+COLORS = {'white': WHITE, 'black': BLACK}
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_NAMES = ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')
+PIECE_TYPES = {name: index for index, name in enumerate(PIECE_NAMES)}
+
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_8 = RANK_1 << 56
+
+
+def square_of(col, row):
+    return (row << 3) | (7 - col)
+
+
+def coords_of(square):
+    return (7 - (square & 7), square >> 3)
+
+
+def iter_bits(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def _step_targets(square, deltas):
+    file, rank = square & 7, square >> 3
+    bb = 0
+    for df, dr in deltas:
+        f, r = file + df, rank + dr
+        if 0 <= f <= 7 and 0 <= r <= 7:
+            bb |= 1 << (r * 8 + f)
+    return bb
+
+
+def _ray_walk(square, occupied, directions):
+    # Slow reference walk, only used while the lookup tables are built
+    file, rank = square & 7, square >> 3
+    bb = 0
+    for df, dr in directions:
+        f, r = file + df, rank + dr
+        while 0 <= f <= 7 and 0 <= r <= 7:
+            bit = 1 << (r * 8 + f)
+            bb |= bit
+            if occupied & bit:
+                break
+            f, r = f + df, r + dr
+    return bb
+
+
+def _line_mask(square, df, dr):
+    # Squares on the line through `square` that can block a slider, i.e. the
+    # line without its two end squares
+    bb = 0
+    for sign in (1, -1):
+        f, r = (square & 7) + sign * df, (square >> 3) + sign * dr
+        while 0 <= f + sign * df <= 7 and 0 <= r + sign * dr <= 7:
+            bb |= 1 << (r * 8 + f)
+            f, r = f + sign * df, r + sign * dr
+    return bb | (1 << square)
+
+
+KNIGHT_DELTAS = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+KING_DELTAS = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+
+# Lookup tables built once at import; the generators below and in
+# position.py index these instead of doing coordinate arithmetic per call.
+SQUARE_COORDS = [coords_of(sq) for sq in range(64)] # Shared (col, row) tuples
+COORDS_SQUARE = {coords: sq for sq, coords in enumerate(SQUARE_COORDS)}
+
+KNIGHT_ATTACKS = [_step_targets(sq, KNIGHT_DELTAS) for sq in range(64)]
+KING_ATTACKS = [_step_targets(sq, KING_DELTAS) for sq in range(64)]
+PAWN_ATTACKS = ([_step_targets(sq, [(-1, 1), (1, 1)]) for sq in range(64)],
+                [_step_targets(sq, [(-1, -1), (1, -1)]) for sq in range(64)])
+PAWN_PUSHES = ([1 << (sq + 8) if sq < 56 else 0 for sq in range(64)],
+               [1 << (sq - 8) if sq >= 8 else 0 for sq in range(64)])
+PAWN_DOUBLE_PUSHES = ([1 << (sq + 16) if 8 <= sq < 16 else 0 for sq in range(64)],
+                      [1 << (sq - 16) if 48 <= sq < 56 else 0 for sq in range(64)])
+
+
+def _ray_squares(square, df, dr):
+    squares = []
+    f, r = (square & 7) + df, (square >> 3) + dr
+    while 0 <= f <= 7 and 0 <= r <= 7:
+        squares.append(r * 8 + f)
+        f, r = f + df, r + dr
+    return squares
+
+
+# Rays in the eight directions, ordered outwards from the square
+DIRECTIONS = KING_DELTAS
+RAY_SQUARES = [[_ray_squares(sq, df, dr) for sq in range(64)] for df, dr in DIRECTIONS]
+RAYS = [[sum(1 << s for s in squares) for squares in per_square] for per_square in RAY_SQUARES]
+ROOK_RAYS = [RAYS[0][sq] | RAYS[2][sq] | RAYS[4][sq] | RAYS[6][sq] for sq in range(64)]
+BISHOP_RAYS = [RAYS[1][sq] | RAYS[3][sq] | RAYS[5][sq] | RAYS[7][sq] for sq in range(64)]
+
+# Sliding attacks use "kindergarten" lookups: the blockers on a line are
+# collapsed into a 6-bit index (shift for ranks, a multiplication for files and
+# diagonals) which selects a precomputed attack set for that square.
+_FILE_MAGIC = 0x0004081020408000
+_DIAG_MAGIC = 0x0202020202020202
+_A_FILE_INNER = 0x0001010101010100
+
+
+def _rank_index(square, occupied):
+    return (occupied >> ((square & ~7) + 1)) & 63
+
+
+def _file_index(square, occupied):
+    return ((((occupied >> (square & 7)) & _A_FILE_INNER) * _FILE_MAGIC) & FULL) >> 58
+
+
+def _diag_index(mask, occupied):
+    return (((occupied & mask) * _DIAG_MAGIC) & FULL) >> 58
+
+
+DIAG_MASKS = [_line_mask(sq, 1, 1) & ~(FILE_A | FILE_H) for sq in range(64)]
+ANTI_MASKS = [_line_mask(sq, -1, 1) & ~(FILE_A | FILE_H) for sq in range(64)]
+
+
+def _build_table(square, mask, index_of, directions):
+    table = [0] * 64
+    subset = 0
+    while True:
+        table[index_of(subset)] = _ray_walk(square, subset, directions)
+        subset = (subset - mask) & mask
+        if not subset:
+            return table
+
+
+RANK_TABLE = [_build_table(sq, _line_mask(sq, 1, 0), lambda occ, sq=sq: _rank_index(sq, occ),
+                           [(1, 0), (-1, 0)]) for sq in range(64)]
+FILE_TABLE = [_build_table(sq, _line_mask(sq, 0, 1), lambda occ, sq=sq: _file_index(sq, occ),
+                           [(0, 1), (0, -1)]) for sq in range(64)]
+DIAG_TABLE = [_build_table(sq, DIAG_MASKS[sq], lambda occ, sq=sq: _diag_index(DIAG_MASKS[sq], occ),
+                           [(1, 1), (-1, -1)]) for sq in range(64)]
+ANTI_TABLE = [_build_table(sq, ANTI_MASKS[sq], lambda occ, sq=sq: _diag_index(ANTI_MASKS[sq], occ),
+                           [(-1, 1), (1, -1)]) for sq in range(64)]
+
+
+def rook_attacks(square, occupied):
+    return (RANK_TABLE[square][(occupied >> ((square & ~7) + 1)) & 63] |
+            FILE_TABLE[square][((((occupied >> (square & 7)) & _A_FILE_INNER) * _FILE_MAGIC) & FULL) >> 58])
+
+
+def bishop_attacks(square, occupied):
+    return (DIAG_TABLE[square][(((occupied & DIAG_MASKS[square]) * _DIAG_MAGIC) & FULL) >> 58] |
+            ANTI_TABLE[square][(((occupied & ANTI_MASKS[square]) * _DIAG_MAGIC) & FULL) >> 58])
+
+
+def queen_attacks(square, occupied):
+    return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+
+
+def _between_table():
+    # BETWEEN[a][b]: squares strictly between two squares on a shared line, else 0
+    table = [[0] * 64 for _ in range(64)]
+    for per_square in RAY_SQUARES:
+        for a, squares in enumerate(per_square):
+            between = 0
+            for b in squares:
+                table[a][b] = between
+                between |= 1 << b
+    return table
+
+
+BETWEEN = _between_table()
+
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+
+def pawn_attack_span(color, pawns):
+    # All squares attacked by a set of pawns at once
+    if color == WHITE:
+        return (((pawns & ~FILE_A) << 7) | ((pawns & ~FILE_H) << 9)) & FULL
+    return ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+
+
+class BitboardPosition:
+    __slots__ = ('pieces', 'colors', 'occupied')
+
+    def __init__(self):
+        self.pieces = [[0] * 6, [0] * 6] # pieces[color][piece_type]
+        self.colors = [0, 0]
+        self.occupied = 0
+
+    @classmethod
+    def from_lists(cls, white_pieces, white_locations, black_pieces, black_locations):
+        board = cls()
+        for color, pieces, locations in ((WHITE, white_pieces, white_locations),
+                                         (BLACK, black_pieces, black_locations)):
+            for piece, loc in zip(pieces, locations):
+                board.put(color, PIECE_TYPES[piece], square_of(*loc))
+        return board
+
+    def put(self, color, piece_type, square):
+        bit = 1 << square
+        self.pieces[color][piece_type] |= bit
+        self.colors[color] |= bit
+        self.occupied |= bit
+
+    def remove(self, color, piece_type, square):
+        mask = ~(1 << square)
+        self.pieces[color][piece_type] &= mask
+        self.colors[color] &= mask
+        self.occupied &= mask
+
+    def piece_at(self, square):
+        bit = 1 << square
+        if not self.occupied & bit:
+            return None
+        color = WHITE if self.colors[WHITE] & bit else BLACK
+        for piece_type in range(6):
+            if self.pieces[color][piece_type] & bit:
+                return color, piece_type
+        return None
+
+    def attackers_to(self, square, color, occupied):
+        # Pieces of `color` attacking `square` with the given occupancy
+        p = self.pieces[color]
+        return ((PAWN_ATTACKS[color ^ 1][square] & p[PAWN]) |
+                (KNIGHT_ATTACKS[square] & p[KNIGHT]) |
+                (KING_ATTACKS[square] & p[KING]) |
+                (bishop_attacks(square, occupied) & (p[BISHOP] | p[QUEEN])) |
+                (rook_attacks(square, occupied) & (p[ROOK] | p[QUEEN])))
+
+    def attacks_by(self, color, occupied):
+        # Every square attacked by `color` with the given occupancy
+        p = self.pieces[color]
+        attacked = pawn_attack_span(color, p[PAWN])
+        for square in iter_bits(p[KNIGHT]):
+            attacked |= KNIGHT_ATTACKS[square]
+        for square in iter_bits(p[BISHOP] | p[QUEEN]):
+            attacked |= bishop_attacks(square, occupied)
+        for square in iter_bits(p[ROOK] | p[QUEEN]):
+            attacked |= rook_attacks(square, occupied)
+        for square in iter_bits(p[KING]):
+            attacked |= KING_ATTACKS[square]
+        return attacked
+
+    def targets(self, color, piece_type, square):
+        # Pseudo-legal destination squares; castling and en passant are added
+        # by Position.legal_moves
+        if piece_type == PAWN:
+            return self.pawn_targets(color, square)
+        if piece_type == KNIGHT:
+            attacks = KNIGHT_ATTACKS[square]
+        elif piece_type == BISHOP:
+            attacks = bishop_attacks(square, self.occupied)
+        elif piece_type == ROOK:
+            attacks = rook_attacks(square, self.occupied)
+        elif piece_type == QUEEN:
+            attacks = queen_attacks(square, self.occupied)
+        else:
+            attacks = KING_ATTACKS[square]
+        return attacks & ~self.colors[color]
+
+    def pawn_targets(self, color, square):
+        occupied = self.occupied
+        targets = PAWN_ATTACKS[color][square] & self.colors[color ^ 1]
+        if not PAWN_PUSHES[color][square] & occupied:
+            targets |= PAWN_PUSHES[color][square] | (PAWN_DOUBLE_PUSHES[color][square] & ~occupied)
+        return targets
+
+    def reach(self, color, piece_type, square):
+        # Every square whose contents can change this piece's targets: its
+        # attack rays up to and including the first blocker of either colour,
+        # plus the push squares for pawns
+        if piece_type == PAWN:
+            return PAWN_PUSHES[color][square] | PAWN_DOUBLE_PUSHES[color][square] | PAWN_ATTACKS[color][square]
+        if piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[square]
+        if piece_type == BISHOP:
+            return bishop_attacks(square, self.occupied)
+        if piece_type == ROOK:
+            return rook_attacks(square, self.occupied)
+        if piece_type == QUEEN:
+            return queen_attacks(square, self.occupied)
+        return KING_ATTACKS[square]
+
+    def options(self, pieces, locations, color):
+        # Same shape as ChessGame.check_options: one list of (col, row) per piece
+        color_index = COLORS[color]
+        all_moves_list = []
+        for piece, loc in zip(pieces, locations):
+            targets = self.targets(color_index, PIECE_TYPES[piece], square_of(*loc))
+            all_moves_list.append([coords_of(sq) for sq in iter_bits(targets)])
+        return all_moves_list
+
+    def generate_moves(self, color):
+        moves = []
+        own = self.pieces[color]
+        for piece_type in range(6):
+            for from_sq in iter_bits(own[piece_type]):
+                for to_sq in iter_bits(self.targets(color, piece_type, from_sq)):
+                    moves.append((from_sq, to_sq))
+        return moves
+
+    def make_move(self, color, from_sq, to_sq):
+        moved = self.piece_at(from_sq)[1]
+        captured = self.piece_at(to_sq)
+        if captured is not None:
+            self.remove(captured[0], captured[1], to_sq)
+        self.remove(color, moved, from_sq)
+        placed = moved
+        if moved == PAWN and (to_sq >= 56 or to_sq < 8):
+            placed = QUEEN
+        self.put(color, placed, to_sq)
+        return (color, from_sq, to_sq, moved, placed, captured)
+
+    def unmake_move(self, undo):
+        color, from_sq, to_sq, moved, placed, captured = undo
+        self.remove(color, placed, to_sq)
+        self.put(color, moved, from_sq)
+        if captured is not None:
+            self.put(captured[0], captured[1], to_sq)
+
+    def perft(self, color, depth):
+        if depth == 0:
+            return 1
+        moves = self.generate_moves(color)
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for from_sq, to_sq in moves:
+            undo = self.make_move(color, from_sq, to_sq)
+            nodes += self.perft(color ^ 1, depth - 1)
+            self.unmake_move(undo)
+        return nodes
@@ -0,0 +1,155 @@
+# Retained-mode drawing of the board canvas for ChessGame.
+#
+# The 64 squares are created once. Piece images, the selection and check
+# outlines and the valid-move dots are canvas items that are kept between
+# frames: render() diffs the new board against what is on the canvas and only
+# moves, re-images, shows or hides the items that changed. Items that are no
+# longer needed go to a pool and are reused instead of deleted.
+#
+#   python board_view.py [moves]   # frame time of delete-and-redraw vs retained, needs a display
+
+import sys
+import time
+
+
+class BoardView:
+    def __init__(self, canvas, images, square_size, light, dark, valid_color):
+        self.canvas = canvas
+        self.images = images # "white_pawn" -> PhotoImage
+        self.square_size = square_size
+        self.valid_color = valid_color
+        self.pieces = {} # (col, row) -> (item, image key) currently shown
+        self.free_pieces = [] # Hidden piece items ready for reuse
+        self.dots = [] # Valid-move ovals; the first `dots_shown` are visible
+        self.dots_shown = 0
+
+        for row in range(8):
+            for col in range(8):
+                x1, y1 = col * square_size, row * square_size
+                canvas.create_rectangle(x1, y1, x1 + square_size, y1 + square_size,
+                                        fill=light if (row + col) % 2 == 0 else dark, outline="black", tags="square")
+        self.selection_item = canvas.create_rectangle(0, 0, 0, 0, width=3, state='hidden', tags="highlight")
+        self.check_item = canvas.create_rectangle(0, 0, 0, 0, width=3, state='hidden', tags="check")
+
+    def _center(self, coords):
+        half = self.square_size // 2
+        return coords[0] * self.square_size + half, coords[1] * self.square_size + half
+
+    def _outline(self, item, coords, color):
+        # Show a square outline at coords, or hide it when coords is None
+        if coords is None:
+            self.canvas.itemconfigure(item, state='hidden')
+            return
+        size = self.square_size
+        self.canvas.coords(item, coords[0] * size + 2, coords[1] * size + 2,
+                           (coords[0] + 1) * size - 2, (coords[1] + 1) * size - 2)
+        self.canvas.itemconfigure(item, outline=color, state='normal')
+        self.canvas.tag_raise(item)
+
+    def render(self, placement, selection=None, selection_color=None, valid_moves=(), check=None, check_color=None):
+        # placement: (col, row) -> image key for every piece on the board
+        canvas = self.canvas
+        old = self.pieces
+        # Squares whose piece left or changed free their item first, so a
+        # moving piece usually reuses its own item and only gets new coords
+        for coords in [c for c, (_, key) in old.items() if placement.get(c) != key]:
+            item, key = old.pop(coords)
+            canvas.itemconfigure(item, state='hidden')
+            self.free_pieces.append((item, key))
+        for coords, key in placement.items():
+            if coords in old:
+                continue
+            if self.free_pieces:
+                item, item_key = self.free_pieces.pop()
+                canvas.coords(item, *self._center(coords))
+                if item_key != key:
+                    canvas.itemconfigure(item, image=self.images[key])
+                canvas.itemconfigure(item, state='normal')
+            else:
+                item = canvas.create_image(*self._center(coords), image=self.images[key], tags="piece")
+            old[coords] = (item, key)
+
+        self._outline(self.selection_item, selection, selection_color)
+        self._outline(self.check_item, check, check_color)
+
+        for i, coords in enumerate(valid_moves):
+            x, y = self._center(coords)
+            if i == len(self.dots):
+                self.dots.append(canvas.create_oval(x - 5, y - 5, x + 5, y + 5,
+                                                    fill=self.valid_color, tags="valid"))
+            else:
+                canvas.coords(self.dots[i], x - 5, y - 5, x + 5, y + 5)
+                if i >= self.dots_shown:
+                    canvas.itemconfigure(self.dots[i], state='normal')
+            canvas.tag_raise(self.dots[i])
+        for item in self.dots[len(valid_moves):self.dots_shown]:
+            canvas.itemconfigure(item, state='hidden')
+        self.dots_shown = len(valid_moves)
+
+
+def _redraw_all(canvas, images, square_size, placement, valid_moves):
+    # The previous update_ui: delete everything and create it again
+    canvas.delete("all")
+    for row in range(8):
+        for col in range(8):
+            x1, y1 = col * square_size, row * square_size
+            canvas.create_rectangle(x1, y1, x1 + square_size, y1 + square_size,
+                                    fill="#D3D3D3" if (row + col) % 2 == 0 else "#808080", outline="black")
+    half = square_size // 2
+    for (col, row), key in placement.items():
+        canvas.create_image(col * square_size + half, row * square_size + half, image=images[key], tags="piece")
+    for col, row in valid_moves:
+        x, y = col * square_size + half, row * square_size + half
+        canvas.create_oval(x - 5, y - 5, x + 5, y + 5, fill="#00FF00", tags="valid")
+
+
+def main():
+    # Replays a random game and times one frame per move (including the Tk
+    # redraw from update_idletasks) for both renderers
+    import random
+    import tkinter as tk
+
+    from position import Position
+
+    moves = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    root = tk.Tk()
+    size = 70
+    canvas = tk.Canvas(root, width=8 * size, height=8 * size)
+    canvas.pack()
+    images = {}
+    for color, fill in (('white', '#FFFFFF'), ('black', '#000000')):
+        for piece in ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king'):
+            image = tk.PhotoImage(width=50, height=50)
+            image.put(fill, to=(5, 5, 45, 45))
+            images[f"{color}_{piece}"] = image
+
+    position = Position.starting_position()
+    rng = random.Random(0)
+    frames = []
+    for _ in range(moves):
+        legal = position.legal_moves()
+        if not legal:
+            break
+        position.make_move(rng.choice(legal))
+        placement = {loc: f"white_{piece}" for piece, loc in zip(position.white_pieces, position.white_locations)}
+        placement.update({loc: f"black_{piece}" for piece, loc in zip(position.black_pieces, position.black_locations)})
+        frames.append((placement, [move[1] for move in position.legal_moves()[:8]]))
+
+    def timed(draw):
+        start = time.perf_counter()
+        for placement, dots in frames:
+            draw(placement, dots)
+            root.update_idletasks()
+        return (time.perf_counter() - start) / len(frames)
+
+    redraw = timed(lambda placement, dots: _redraw_all(canvas, images, size, placement, dots))
+    canvas.delete("all")
+    view = BoardView(canvas, images, size, "#D3D3D3", "#808080", "#00FF00")
+    retained = timed(lambda placement, dots: view.render(placement, valid_moves=dots))
+    root.destroy()
+    print(f"{len(frames)} frames: delete-and-redraw {redraw * 1e3:.2f} ms/frame, "
+          f"retained {retained * 1e3:.2f} ms/frame ({redraw / max(retained, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
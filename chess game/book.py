@@ -0,0 +1,197 @@
+# Polyglot opening books.
+#
+# A .bin book is a sorted array of 16-byte big-endian entries
+#   key (8 bytes)  move (2)  weight (2)  learn (4)
+# OpeningBook memory-maps the file and binary-searches it by position key, so
+# only the pages around the probed key are ever read. build_book() makes a
+# book from PGN games, streaming them with pgn.open_games.
+#
+#   python book.py build games.pgn [more.pgn ...] -o book.bin [--plies 20] [--min-games 2]
+#   python book.py probe book.bin [--fen "<fen>"]
+
+import argparse
+import mmap
+import os
+import random
+import struct
+from collections import defaultdict
+
+from bitboard import WHITE, BLACK, PAWN, PAWN_ATTACKS, SQUARE_COORDS, COORDS_SQUARE, iter_bits
+from pgn import open_games
+from polyglot_keys import POLYGLOT_RANDOM
+from position import Position, START_FEN, move_text
+
+ENTRY = struct.Struct('>QHHI')
+ENTRY_SIZE = ENTRY.size # 16
+CASTLING_OFFSET = 768
+EP_OFFSET = 772
+TURN_OFFSET = 780
+PROMOTION_CODES = {None: 0, 'knight': 1, 'bishop': 2, 'rook': 3, 'queen': 4}
+PROMOTION_NAMES = {code: name for name, code in PROMOTION_CODES.items()}
+# Castling is stored as the king capturing its own rook
+CASTLING_ROOKS = {(4, 6): 7, (4, 2): 0, (60, 62): 63, (60, 58): 56}
+CASTLING_KINGS = {(king_from, rook): king_to for (king_from, king_to), rook in CASTLING_ROOKS.items()}
+DEFAULT_BOOK = os.path.join('assets', 'book.bin')
+
+
+def polyglot_key(position):
+    board = position.board
+    key = 0
+    for color in (WHITE, BLACK):
+        for ptype in range(6):
+            kind = 2 * ptype + (color == WHITE)
+            for sq in iter_bits(board.pieces[color][ptype]):
+                key ^= POLYGLOT_RANDOM[64 * kind + sq]
+    for bit in range(4): # K, Q, k, q in both formats
+        if position.castling >> bit & 1:
+            key ^= POLYGLOT_RANDOM[CASTLING_OFFSET + bit]
+    # The en passant file only counts when a pawn of the side to move could
+    # capture, which is also when Position keeps ep_square
+    ep = position.ep_square
+    us = WHITE if position.turn == 'white' else BLACK
+    if ep is not None and PAWN_ATTACKS[us ^ 1][ep] & board.pieces[us][PAWN]:
+        key ^= POLYGLOT_RANDOM[EP_OFFSET + (ep & 7)]
+    if position.turn == 'white':
+        key ^= POLYGLOT_RANDOM[TURN_OFFSET]
+    return key
+
+
+def encode_book_move(position, move):
+    start, end, promotion = move
+    from_sq, to_sq = COORDS_SQUARE[start], COORDS_SQUARE[end]
+    if position.piece_at(start)[1] == 'king' and (from_sq, to_sq) in CASTLING_ROOKS:
+        to_sq = CASTLING_ROOKS[from_sq, to_sq]
+    return (to_sq & 7) | (to_sq >> 3) << 3 | (from_sq & 7) << 6 | (from_sq >> 3) << 9 | PROMOTION_CODES[promotion] << 12
+
+
+def decode_book_move(position, code):
+    # The legal move a book entry stands for, or None
+    to_sq = (code & 7) | ((code >> 3) & 7) << 3
+    from_sq = ((code >> 6) & 7) | ((code >> 9) & 7) << 3
+    promotion = PROMOTION_NAMES.get(code >> 12)
+    piece = position.piece_at(SQUARE_COORDS[from_sq])
+    if piece is not None and piece[1] == 'king' and (from_sq, to_sq) in CASTLING_KINGS:
+        to_sq = CASTLING_KINGS[from_sq, to_sq]
+    move = (SQUARE_COORDS[from_sq], SQUARE_COORDS[to_sq], promotion)
+    return move if move in position.legal_moves() else None
+
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_BOOK):
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // ENTRY_SIZE
+        # mmap refuses empty files; an empty book simply has no entries
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b''
+
+    def close(self):
+        if self.count:
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _key_at(self, index):
+        return struct.unpack_from('>Q', self.data, index * ENTRY_SIZE)[0]
+
+    def entries(self, position):
+        # [(move, weight, learn)] for the position, best weight first
+        key = polyglot_key(position)
+        low, high = 0, self.count
+        while low < high: # First entry with a key >= key
+            mid = (low + high) // 2
+            if self._key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        found = []
+        index = low
+        while index < self.count:
+            entry_key, code, weight, learn = ENTRY.unpack_from(self.data, index * ENTRY_SIZE)
+            if entry_key != key:
+                break
+            move = decode_book_move(position, code)
+            if move is not None:
+                found.append((move, weight, learn))
+            index += 1
+        found.sort(key=lambda entry: entry[1], reverse=True)
+        return found
+
+    def choose(self, position, rng=random):
+        # A book move picked with probability proportional to its weight, or None
+        candidates = [(move, weight) for move, weight, _ in self.entries(position) if weight > 0]
+        if not candidates:
+            return None
+        pick = rng.randrange(sum(weight for _, weight in candidates))
+        for move, weight in candidates:
+            if pick < weight:
+                return move
+            pick -= weight
+        return candidates[-1][0]
+
+
+def build_book(pgn_paths, out_path, plies=20, min_games=2):
+    # Weight of a move = 2 per win and 1 per draw for the side that played
+    # it, as in Polyglot's own book builder; moves seen in fewer than
+    # min_games games are dropped
+    stats = defaultdict(lambda: [0, 0]) # (key, move code) -> [games, score]
+    games = 0
+    for path in pgn_paths:
+        for game in open_games(path):
+            if game.start_fen() != START_FEN:
+                continue
+            games += 1
+            points = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}.get(game.result, (0, 0))
+            try:
+                for ply, (position, move) in enumerate(game.replay()):
+                    if ply >= plies:
+                        break
+                    entry = stats[polyglot_key(position), encode_book_move(position, move)]
+                    entry[0] += 1
+                    entry[1] += points[0] if position.turn == 'white' else points[1]
+            except ValueError:
+                continue # Keep the moves before an unreadable one
+    entries = sorted((key, code, score) for (key, code), (count, score) in stats.items() if count >= min_games)
+    top = max((score for _, _, score in entries), default=0)
+    scale = 0xFFFF / top if top > 0xFFFF else 1 # Weights are 16-bit
+    with open(out_path, 'wb') as out:
+        for key, code, score in entries:
+            weight = int(score * scale)
+            if weight:
+                out.write(ENTRY.pack(key, code, weight, 0))
+    return games, len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or probe a Polyglot opening book")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build')
+    build.add_argument('pgn', nargs='+')
+    build.add_argument('-o', '--output', default=DEFAULT_BOOK)
+    build.add_argument('--plies', type=int, default=20, help="book depth in half-moves")
+    build.add_argument('--min-games', type=int, default=2)
+    probe = commands.add_parser('probe')
+    probe.add_argument('book')
+    probe.add_argument('--fen', default=START_FEN)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        games, count = build_book(args.pgn, args.output, args.plies, args.min_games)
+        print(f"{games} games, {count} entries written to {args.output}")
+    else:
+        position = Position.from_fen(args.fen)
+        with OpeningBook(args.book) as book:
+            entries = book.entries(position)
+        print(f"key {polyglot_key(position):016x}: {len(entries)} book moves")
+        total = sum(weight for _, weight, _ in entries) or 1
+        for move, weight, _ in entries:
+            print(f"  {move_text(move):6} weight {weight:5} ({weight / total:.0%})")
+
+
+if __name__ == "__main__":
+    main()
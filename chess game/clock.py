@@ -0,0 +1,145 @@
+# Chess clock for the game in game.py, the match runner and the engine's time
+# manager. Times are seconds measured with time.monotonic, so changes to the
+# wall clock never add or remove thinking time.
+#
+# press() ends the running side's move: the time since its start() or the
+# previous press() is charged to that side, then it receives its increment,
+#   fischer    the full increment after every move
+#   bronstein  the time the move took, up to the increment
+# and the other side's clock starts. A side whose time runs out before it
+# presses has flagged; the clock stops and `flagged` holds its color.
+# time_for_move, the per-move budget shared with the UCI front-end, lives
+# here too, so the clock does not depend on the engine.
+#
+#   python clock.py 3+2 [bronstein]    # runs a clock in the terminal, Enter presses it
+
+import math
+import sys
+import time
+
+FISCHER, BRONSTEIN = 'fischer', 'bronstein'
+TENTHS_BELOW = 10.0 # Seconds left below which tenths are shown
+
+
+def time_for_move(time_left, increment=0.0, moves_to_go=None):
+    # Seconds to spend on one move with `time_left` on the clock: an even
+    # share of the time until the next time control (or of about 30 more
+    # moves) plus most of the increment, never more than half the clock
+    share = time_left / (moves_to_go if moves_to_go else 30) + increment * 0.8
+    return max(min(share, time_left / 2), 0.01)
+
+
+def parse_time_control(text):
+    # 'minutes+increment seconds', e.g. '5+3' or '0.5+0'; (seconds, increment)
+    base, _, increment = text.strip().partition('+')
+    try:
+        seconds, increment = float(base) * 60, float(increment or 0)
+    except ValueError:
+        raise ValueError(f"bad time control {text!r}, expected minutes+increment such as 5+3") from None
+    if seconds <= 0 or increment < 0:
+        raise ValueError(f"bad time control {text!r}")
+    return seconds, increment
+
+
+def format_clock(seconds):
+    # '4:59', '1:02:00', or '0:09.4' under TENTHS_BELOW; never negative
+    seconds = max(seconds, 0.0)
+    if seconds < TENTHS_BELOW:
+        return f"0:{math.floor(seconds * 10) / 10:04.1f}"
+    whole = math.floor(seconds)
+    hours, rest = divmod(whole, 3600)
+    if hours:
+        return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+    return f"{whole // 60}:{whole % 60:02d}"
+
+
+def until_next_change(seconds):
+    # Seconds until format_clock(seconds) shows a different text, so a display
+    # only has to wake up when there is something new to draw
+    step = 0.1 if seconds < TENTHS_BELOW else 1.0
+    return seconds % step or step
+
+
+class ChessClock:
+    def __init__(self, initial, increment=0.0, mode=FISCHER, timer=time.monotonic):
+        if mode not in (FISCHER, BRONSTEIN):
+            raise ValueError(f"unknown increment mode {mode!r}")
+        self.initial = initial
+        self.increment = increment
+        self.mode = mode
+        self.timer = timer
+        self.remaining = {'white': initial, 'black': initial} # At the start of the running move
+        self.running = None # Color whose time is counting down
+        self.started = 0.0 # timer() when the running move began
+        self.flagged = None # Color that ran out of time
+
+    def start(self, color):
+        # Starts (or resumes) `color`'s time without touching the other side's
+        self.running = color
+        self.started = self.timer()
+
+    def stop(self):
+        if self.running is not None:
+            self.remaining[self.running] -= self.timer() - self.started
+            self.running = None
+
+    def time_left(self, color):
+        if color == self.running:
+            return self.remaining[color] - (self.timer() - self.started)
+        return self.remaining[color]
+
+    def check_flag(self):
+        # The running side's color if it has run out of time (the clock stops)
+        if self.running is not None and self.time_left(self.running) <= 0:
+            self.flagged = self.running
+            self.stop()
+        return self.flagged
+
+    def press(self):
+        # Ends the running side's move and returns the seconds it took
+        color = self.running
+        if color is None:
+            return 0.0
+        used = self.timer() - self.started
+        self.remaining[color] -= used
+        if self.remaining[color] <= 0:
+            self.flagged = color
+            self.running = None
+            return used
+        self.remaining[color] += self.increment if self.mode == FISCHER else min(used, self.increment)
+        self.start('black' if color == 'white' else 'white')
+        return used
+
+    def move_time(self, color, moves_to_go=None, overhead=0.0):
+        # Search budget for `color`'s next move; a Bronstein delay is treated
+        # like an increment, since a move shorter than it costs nothing
+        return time_for_move(max(self.time_left(color) - overhead, 0.0), self.increment, moves_to_go)
+
+    def text(self, color):
+        return format_clock(self.time_left(color))
+
+    def pgn_time_control(self):
+        # TimeControl header value (seconds+increment), as in the PGN standard
+        return f"{self.initial:g}+{self.increment:g}"
+
+
+def main():
+    seconds, increment = parse_time_control(sys.argv[1] if len(sys.argv) > 1 else '3+2')
+    mode = sys.argv[2] if len(sys.argv) > 2 else FISCHER
+    clock = ChessClock(seconds, increment, mode)
+    clock.start('white')
+    print("Press Enter to end a move, Ctrl-D to stop")
+    while clock.running is not None:
+        color = clock.running
+        try:
+            input(f"{color:5} {clock.text(color)}  (other side {clock.text('black' if color == 'white' else 'white')}) ")
+        except EOFError:
+            break
+        used = clock.press()
+        print(f"{color} took {used:.2f}s, now {clock.text(color)}")
+    if clock.flagged:
+        print(f"{clock.flagged} lost on time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# Training-data export: positions sampled from games, written as fixed-width
+# binary records in shards that can be memory-mapped and indexed directly.
+#
+# Games come from PGN files (streamed with pgn.open_games) or from self-play
+# with the Searcher at a fixed depth after a few random opening moves. A
+# record is RECORD_SIZE bytes:
+#   board     32  mailbox, one nibble per square (Position.squares code + 6), a1 first
+#   flags      1  bit 0 black to move, bits 1-4 castling rights (KQkq)
+#   ep         1  en passant square + 1, or 0
+#   halfmove   1  fifty-move clock, capped at 255
+#   result     1  game result for White: 1, 0 or -1
+#   eval       2  centipawns for White, or EVAL_NONE
+#   ply        2  half-moves played in the game before this position
+#   game       4  game number within the export
+# Shards are plain concatenations of records, so record i of a shard is at
+# byte i * RECORD_SIZE and the whole file maps onto NUMPY_DTYPE. index.json
+# lists the shards and their record counts; Dataset finds any record across
+# shards by binary search over the running totals.
+#
+#   python dataset.py export games.pgn [more.pgn ...] -o data [--sample 0.25] [--skip-plies 8] [--eval-depth 2]
+#   python dataset.py selfplay -o data [--games 100] [--depth 2] [--random-plies 6]
+#   python dataset.py info data [--show 5]
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+
+from pgn import open_games
+from position import Position, PACKED_SIZE
+from search import Searcher, MATE_BOUND
+
+RECORD = struct.Struct('<32sBBBbhHI')
+RECORD_SIZE = RECORD.size # 44
+EVAL_NONE = -32768
+EVAL_LIMIT = 32000 # Evals, mate scores included, are clamped to +/- this
+SHARD_RECORDS = 1 << 20
+INDEX_NAME = 'index.json'
+FORMAT_VERSION = 1
+NUMPY_DTYPE = [('board', 'u1', 32), ('flags', 'u1'), ('ep', 'u1'), ('halfmove', 'u1'), ('result', 'i1'),
+               ('eval', '<i2'), ('ply', '<u2'), ('game', '<u4')]
+RESULT_SCORES = {'1-0': 1, '0-1': -1, '1/2-1/2': 0}
+
+
+def pack_board(squares):
+    # 64 signed codes -> 32 bytes, two squares per byte (low nibble first)
+    return bytes(((squares[sq] + 6) | (squares[sq + 1] + 6) << 4) for sq in range(0, 64, 2))
+
+
+def unpack_board(data):
+    squares = array('b', bytes(64))
+    for i, byte in enumerate(data):
+        squares[2 * i] = (byte & 15) - 6
+        squares[2 * i + 1] = (byte >> 4) - 6
+    return squares
+
+
+def encode_record(position, result, score, ply, game):
+    # score: centipawns for White, or None
+    ep = position.ep_square + 1 if position.ep_square is not None else 0
+    flags = (position.turn == 'black') | position.castling << 1
+    score = EVAL_NONE if score is None else max(-EVAL_LIMIT, min(EVAL_LIMIT, score))
+    return RECORD.pack(pack_board(position.squares), flags, ep, min(position.halfmove_clock, 255), result,
+                       score, min(ply, 0xFFFF), game)
+
+
+class Record:
+    __slots__ = ('squares', 'turn', 'castling', 'ep_square', 'halfmove_clock', 'result', 'eval', 'ply', 'game')
+
+    def __init__(self, data):
+        board, flags, ep, self.halfmove_clock, self.result, score, self.ply, self.game = RECORD.unpack(data)
+        self.squares = unpack_board(board)
+        self.turn = 'black' if flags & 1 else 'white'
+        self.castling = flags >> 1 & 15
+        self.ep_square = ep - 1 if ep else None
+        self.eval = None if score == EVAL_NONE else score
+
+    def position(self):
+        # The full Position; the move number is not stored, so it is taken from the ply
+        data = (self.squares.tobytes() +
+                bytes((self.turn == 'black', self.castling, self.ep_square + 1 if self.ep_square is not None else 0,
+                       self.halfmove_clock)) +
+                (self.ply // 2 + 1).to_bytes(4, 'little'))
+        assert len(data) == PACKED_SIZE
+        return Position.from_packed(data)
+
+
+class ShardWriter:
+    def __init__(self, directory, shard_records=SHARD_RECORDS):
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, INDEX_NAME)):
+            raise FileExistsError(f"{directory} already holds a dataset")
+        self.directory = directory
+        self.shard_records = shard_records
+        self.shards = [] # [file name, record count]
+        self.file = None
+        self.count = 0
+
+    def write(self, record):
+        if self.file is None or self.shards[-1][1] == self.shard_records:
+            if self.file is not None:
+                self.file.close()
+            name = f"shard-{len(self.shards):05d}.bin"
+            self.file = open(os.path.join(self.directory, name), 'wb')
+            self.shards.append([name, 0])
+        self.file.write(record)
+        self.shards[-1][1] += 1
+        self.count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        index = {'version': FORMAT_VERSION, 'record_size': RECORD_SIZE, 'records': self.count,
+                 'fields': [field[0] for field in NUMPY_DTYPE],
+                 'shards': [{'file': name, 'records': count} for name, count in self.shards]}
+        temporary = os.path.join(self.directory, INDEX_NAME + '.tmp')
+        with open(temporary, 'w') as out:
+            json.dump(index, out, indent=1)
+        os.replace(temporary, os.path.join(self.directory, INDEX_NAME)) # Readers never see half an index
+
+
+class Dataset:
+    # Random access to every record of an exported dataset
+    def __init__(self, directory):
+        with open(os.path.join(directory, INDEX_NAME)) as stream:
+            index = json.load(stream)
+        if index['version'] != FORMAT_VERSION or index['record_size'] != RECORD_SIZE:
+            raise ValueError(f"{directory} was written in an unknown format")
+        self.directory = directory
+        self.paths = [os.path.join(directory, shard['file']) for shard in index['shards']]
+        self.starts = [] # Global index of each shard's first record
+        total = 0
+        for shard in index['shards']:
+            self.starts.append(total)
+            total += shard['records']
+        self.count = total
+        self.files = []
+        self.maps = []
+        for path in self.paths:
+            file = open(path, 'rb')
+            self.files.append(file)
+            self.maps.append(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size
+                             else b'')
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        shard = bisect.bisect_right(self.starts, index) - 1
+        offset = (index - self.starts[shard]) * RECORD_SIZE
+        return self.maps[shard][offset:offset + RECORD_SIZE]
+
+    def __getitem__(self, index):
+        return Record(self.raw(index))
+
+    def arrays(self):
+        # One numpy.memmap per shard with NUMPY_DTYPE fields; needs NumPy
+        import numpy as np
+
+        dtype = np.dtype(NUMPY_DTYPE)
+        return [np.memmap(path, dtype=dtype, mode='r') for path, data in zip(self.paths, self.maps) if len(data)]
+
+    def close(self):
+        for data in self.maps:
+            if data:
+                data.close()
+        for file in self.files:
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def pgn_games(paths):
+    # (result for White, iterator of (position, None) per ply) per game; the
+    # position object is reused, so it is only valid during the iteration.
+    # An unreadable move raises ValueError from the iterator
+    for path in paths:
+        for game in open_games(path):
+            result = RESULT_SCORES.get(game.result)
+            if result is None:
+                continue # Unfinished games have no label
+            yield result, ((position, None) for position, _ in game.replay())
+
+
+def selfplay_games(games, depth=2, random_plies=6, max_plies=300, seed=0):
+    # Engine games at a fixed depth from a few random opening moves; the
+    # search score of each position is kept as its eval
+    rng = random.Random(seed)
+    searcher = Searcher()
+    for _ in range(games):
+        position = Position.starting_position()
+        played = [] # (packed position, eval for White)
+        result = 0
+        for ply in range(max_plies):
+            moves = position.legal_moves()
+            if not moves:
+                break
+            if ply < random_plies:
+                move, score = rng.choice(moves), None
+            else:
+                found = searcher.search(position, time_limit=None, max_depth=depth)
+                move = found.best_move
+                score = found.score if position.turn == 'white' else -found.score
+            played.append((position.packed(), score))
+            position.make_move(move)
+            if position.check_game_over():
+                result = {'white': 1, 'black': -1}.get(position.winner, 0)
+                break
+        yield result, ((Position.from_packed(packed), score) for packed, score in played)
+
+
+def export(games, writer, sample=1.0, skip_plies=0, skip_checks=False, eval_depth=0, seed=0, log=print):
+    # Writes sampled positions of `games` (as yielded by pgn_games or
+    # selfplay_games) and returns the number of records
+    rng = random.Random(seed)
+    searcher = Searcher() if eval_depth else None
+    start = time.perf_counter()
+    for game_number, (result, plies) in enumerate(games):
+        try:
+            for ply, (position, score) in enumerate(plies):
+                if ply < skip_plies or rng.random() >= sample:
+                    continue
+                if skip_checks and position.in_check():
+                    continue
+                if searcher is not None and score is None and position.legal_moves():
+                    found = searcher.search(position, time_limit=None, max_depth=eval_depth)
+                    score = found.score if position.turn == 'white' else -found.score
+                if score is not None and abs(score) >= MATE_BOUND:
+                    score = EVAL_LIMIT if score > 0 else -EVAL_LIMIT
+                writer.write(encode_record(position, result, score, ply, game_number))
+        except ValueError as error:
+            print(f"game {game_number}: {error}", file=sys.stderr) # Keep the plies before it
+        if (game_number + 1) % 100 == 0:
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            log(f"{game_number + 1} games, {writer.count} records ({writer.count / elapsed:.0f} records/sec)")
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    log(f"done: {writer.count} records in {len(writer.shards)} shards, {elapsed:.1f}s "
+        f"({writer.count / elapsed:.0f} records/sec)")
+    return writer.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export positions as fixed-width training records")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('export', 'selfplay'):
+        command = commands.add_parser(name)
+        if name == 'export':
+            command.add_argument('pgn', nargs='+')
+        else:
+            command.add_argument('--games', type=int, default=100)
+            command.add_argument('--depth', type=int, default=2)
+            command.add_argument('--random-plies', type=int, default=6)
+        command.add_argument('-o', '--output', required=True, help="dataset directory")
+        command.add_argument('--sample', type=float, default=1.0, help="fraction of positions kept")
+        command.add_argument('--skip-plies', type=int, default=0, help="opening plies never sampled")
+        command.add_argument('--skip-checks', action='store_true')
+        command.add_argument('--eval-depth', type=int, default=0, help="search positions without an eval")
+        command.add_argument('--shard-records', type=int, default=SHARD_RECORDS)
+        command.add_argument('--seed', type=int, default=0)
+    info = commands.add_parser('info')
+    info.add_argument('directory')
+    info.add_argument('--show', type=int, default=0, help="print this many random records")
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        with Dataset(args.directory) as dataset:
+            print(f"{len(dataset)} records of {RECORD_SIZE} bytes in {len(dataset.paths)} shards")
+            rng = random.Random()
+            for _ in range(min(args.show, len(dataset))):
+                record = dataset[rng.randrange(len(dataset))]
+                print(f"game {record.game} ply {record.ply} result {record.result:+d} eval {record.eval}: "
+                      f"{record.position().fen()}")
+        return
+
+    if args.command == 'export':
+        games = pgn_games(args.pgn)
+    else:
+        games = selfplay_games(args.games, args.depth, args.random_plies, seed=args.seed)
+    writer = ShardWriter(args.output, args.shard_records)
+    try:
+        export(games, writer, args.sample, args.skip_plies, args.skip_checks, args.eval_depth, args.seed)
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Runs the chess search in a separate process so the Tk mainloop never blocks.
+#
+# The GUI talks to the worker through two queues. Requests are
+#   ('search', request_id, packed, key_history, moves, time_limit)   time_limit None = until stopped
+#   ('quit',)
+# and the worker answers with
+#   ('info', request_id, depth, score, nodes, nps, pv)
+#   ('bestmove', request_id, move, ponder_move, score, depth, nodes, nps)
+# A search is cancelled by raising the shared `cancelled` counter to its id, so
+# a stop can never be lost to a request that is still waiting in the queue.
+# A search request carries a snapshot taken when it is made, Position.packed()
+# and a copy of the repetition counts, not the GUI's Position: the queue
+# pickles on a feeder thread, by which time the GUI may already be making and
+# unmaking moves on its own object.
+# The worker keeps one Searcher, and with it one transposition table, for its
+# whole life: a ponder search on the opponent's time warms the table for the
+# real search that follows. The worker opens the tablebases in
+# assets/tablebases for its own search; the GUI maps them separately, and only
+# when the player has asked for tablebase draws to be adjudicated.
+
+import multiprocessing
+import queue
+
+from position import Position
+from search import Searcher, TT_SIZE_MB
+from tablebase import open_tablebases
+
+
+class _Cancelled:
+    def __init__(self, cancelled, request_id):
+        self.cancelled = cancelled
+        self.request_id = request_id
+
+    def is_set(self):
+        return self.cancelled.value >= self.request_id
+
+
+def worker_main(requests, responses, cancelled, tt_size_mb):
+    searcher = Searcher(tablebases=open_tablebases())
+    if tt_size_mb != TT_SIZE_MB:
+        from transposition import TranspositionTable
+        searcher.tt = TranspositionTable(tt_size_mb)
+    while True:
+        request = requests.get()
+        if request[0] == 'quit':
+            break
+        _, request_id, packed, key_history, moves, time_limit = request
+        if cancelled.value >= request_id:
+            responses.put(('bestmove', request_id, None, None, 0, 0, 0, 0))
+            continue
+        position = Position.from_packed(packed)
+        position.key_history = key_history # Earlier occurrences, for repetition draws in the search
+        for move in moves:
+            position.make_move(move)
+
+        def send_info(result, request_id=request_id):
+            responses.put(('info', request_id, result.depth, result.score, result.nodes, result.nps, result.pv))
+
+        searcher.stop_flag = _Cancelled(cancelled, request_id)
+        result = searcher.search(position, time_limit=time_limit, info_callback=send_info)
+        ponder_move = result.pv[1] if len(result.pv) > 1 else None
+        responses.put(('bestmove', request_id, result.best_move, ponder_move, result.score,
+                       result.depth, result.nodes, result.nps))
+
+
+class EngineProcess:
+    def __init__(self, tt_size_mb=TT_SIZE_MB):
+        context = multiprocessing.get_context('spawn') # Never fork a process that owns a Tk root
+        self.requests = context.Queue()
+        self.responses = context.Queue()
+        self.cancelled = context.Value('i', 0)
+        self.request_id = 0
+        self.process = context.Process(target=worker_main, daemon=True,
+                                       args=(self.requests, self.responses, self.cancelled, tt_size_mb))
+        self.process.start()
+
+    def start_search(self, position, time_limit=None, moves=()):
+        # Returns the id that tags every response to this request
+        self.request_id += 1
+        self.requests.put(('search', self.request_id, position.packed(), dict(position.key_history), list(moves),
+                           time_limit))
+        return self.request_id
+
+    def stop(self, request_id=None):
+        # Cancel the given search (default: everything sent so far); the worker
+        # still answers with the best move found before the stop
+        with self.cancelled.get_lock():
+            self.cancelled.value = max(self.cancelled.value, request_id or self.request_id)
+
+    def poll(self):
+        # Non-blocking: every response that has arrived since the last poll
+        messages = []
+        while True:
+            try:
+                messages.append(self.responses.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self):
+        self.stop()
+        self.requests.put(('quit',))
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,346 @@
+# Static evaluation: a tapered blend of middlegame and endgame scores.
+#
+# Material and piece-square tables (PSQT) are kept incrementally by Position
+# in psqt_mg / psqt_eg / phase, so evaluate() only adds the terms that depend
+# on the whole board: pawn structure, king safety and mobility. Pawn structure
+# is looked up by Position.pawn_key in a bounded PawnTable, since the pawns
+# change on few moves and most nodes share their pawn skeleton with their
+# parent. All scores are
+# centipawns from White's point of view until evaluate() flips them for the
+# side to move.
+#
+#   python evaluation.py [positions]    # evaluations/sec, and incremental vs from-scratch PSQT
+
+import random
+import sys
+import time
+from array import array
+
+from bitboard import (WHITE, BLACK, PAWN, KING, FILE_A, PIECE_TYPES, KING_ATTACKS,
+                      iter_bits, lsb)
+
+MATERIAL_MG = (82, 337, 365, 477, 1025, 0)
+MATERIAL_EG = (94, 281, 297, 512, 936, 0)
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+MAX_PHASE = 24 # Phase of the starting material; the middlegame weight
+
+# Piece-square tables as seen from White, rank 8 first and a-file first so
+# they read like a board diagram
+_PAWN_MG = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0)
+_PAWN_EG = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     80,  80,  80,  80,  80,  80,  80,  80,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     30,  30,  30,  30,  30,  30,  30,  30,
+     15,  15,  15,  15,  15,  15,  15,  15,
+      5,   5,   5,   5,   5,   5,   5,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+      0,   0,   0,   0,   0,   0,   0,   0)
+_KNIGHT = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50)
+_BISHOP = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20)
+_ROOK = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0)
+_QUEEN = (
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20)
+_KING_MG = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20)
+_KING_EG = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50)
+
+_TABLES_MG = (_PAWN_MG, _KNIGHT, _BISHOP, _ROOK, _QUEEN, _KING_MG)
+_TABLES_EG = (_PAWN_EG, _KNIGHT, _BISHOP, _ROOK, _QUEEN, _KING_EG)
+
+
+def _psqt(tables, material):
+    # PSQT[color][piece_type][square], material included and signed for the
+    # colour, so a position's total is a plain sum. White reads the diagram
+    # upside down (sq ^ 56); Black's table is White's mirrored.
+    return tuple(tuple(tuple(sign * (material[ptype] + tables[ptype][sq ^ 56 if color == WHITE else sq])
+                             for sq in range(64))
+                       for ptype in range(6))
+                 for color, sign in ((WHITE, 1), (BLACK, -1)))
+
+
+PSQT_MG = _psqt(_TABLES_MG, MATERIAL_MG)
+PSQT_EG = _psqt(_TABLES_EG, MATERIAL_EG)
+
+# Pawn structure
+FILES = [FILE_A << f for f in range(8)]
+ADJACENT_FILES = [(FILES[f - 1] if f > 0 else 0) | (FILES[f + 1] if f < 7 else 0) for f in range(8)]
+
+
+def _front_span(color, sq):
+    # Squares ahead of `sq` on its file and the two adjacent files
+    files = FILES[sq & 7] | ADJACENT_FILES[sq & 7]
+    rank = sq >> 3
+    if color == WHITE:
+        return files & ~((1 << ((rank + 1) * 8)) - 1)
+    return files & ((1 << (rank * 8)) - 1)
+
+
+PASSED_MASKS = [[_front_span(color, sq) for sq in range(64)] for color in (WHITE, BLACK)]
+PASSED_MG = (0, 5, 10, 15, 25, 40, 60, 0) # By rank from the pawn's own side
+PASSED_EG = (0, 10, 15, 25, 45, 70, 100, 0)
+DOUBLED_MG, DOUBLED_EG = 10, 20
+ISOLATED_MG, ISOLATED_EG = 10, 15
+
+# Mobility per reachable square, by piece type
+MOBILITY_MG = (0, 4, 3, 2, 1, 0)
+MOBILITY_EG = (0, 4, 3, 4, 2, 0)
+
+# King safety: attack units per enemy piece hitting the king zone
+KING_ATTACK_UNITS = (0, 2, 2, 3, 5, 0)
+KING_DANGER_CAP = 500
+SHIELD_BONUS = 12
+
+
+def _shield(color, sq):
+    # Squares one and two ranks in front of a king, on its file and the adjacent ones
+    files = FILES[sq & 7] | ADJACENT_FILES[sq & 7]
+    rank = sq >> 3
+    ranks = 0
+    for r in ((rank + 1, rank + 2) if color == WHITE else (rank - 1, rank - 2)):
+        if 0 <= r <= 7:
+            ranks |= 0xFF << (r * 8)
+    return files & ranks
+
+
+SHIELD_MASKS = [[_shield(color, sq) for sq in range(64)] for color in (WHITE, BLACK)]
+
+
+def psqt_totals(board):
+    # Material + PSQT and game phase from scratch; Position keeps these up to
+    # date incrementally after setup
+    mg = eg = phase = 0
+    for color in (WHITE, BLACK):
+        for ptype in range(6):
+            for sq in iter_bits(board.pieces[color][ptype]):
+                mg += PSQT_MG[color][ptype][sq]
+                eg += PSQT_EG[color][ptype][sq]
+                phase += PHASE_WEIGHTS[ptype]
+    return mg, eg, phase
+
+
+def pawn_structure(white_pawns, black_pawns):
+    # (mg, eg) for doubled, isolated and passed pawns, White minus Black
+    mg = eg = 0
+    for color, own, enemy, sign in ((WHITE, white_pawns, black_pawns, 1), (BLACK, black_pawns, white_pawns, -1)):
+        for f in range(8):
+            count = (own & FILES[f]).bit_count()
+            if count > 1:
+                mg -= sign * DOUBLED_MG * (count - 1)
+                eg -= sign * DOUBLED_EG * (count - 1)
+            if count and not own & ADJACENT_FILES[f]:
+                mg -= sign * ISOLATED_MG * count
+                eg -= sign * ISOLATED_EG * count
+        for sq in iter_bits(own):
+            if not enemy & PASSED_MASKS[color][sq]:
+                rank = sq >> 3 if color == WHITE else 7 - (sq >> 3)
+                mg += sign * PASSED_MG[rank]
+                eg += sign * PASSED_EG[rank]
+    return mg, eg
+
+
+class PawnTable:
+    # Fixed-size, direct-mapped cache of pawn_structure() results keyed by the
+    # pawn Zobrist key. Key 0 (no pawns) maps to a zero score, which is also
+    # what the empty slots hold, so it needs no special case.
+    def __init__(self, entries=1 << 14):
+        entries = 1 << (max(entries, 1).bit_length() - 1) # Power of two, so the index is a mask
+        self.mask = entries - 1
+        self.keys = array('Q', bytes(8 * entries))
+        self.scores = array('i', bytes(8 * entries)) # mg, eg pairs
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        self.keys = array('Q', bytes(8 * len(self.keys)))
+        self.scores = array('i', bytes(4 * len(self.scores)))
+        self.probes = self.hits = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def score(self, pawn_key, white_pawns, black_pawns):
+        self.probes += 1
+        index = pawn_key & self.mask
+        if self.keys[index] == pawn_key:
+            self.hits += 1
+            return self.scores[2 * index], self.scores[2 * index + 1]
+        mg, eg = pawn_structure(white_pawns, black_pawns)
+        self.keys[index] = pawn_key
+        self.scores[2 * index] = mg
+        self.scores[2 * index + 1] = eg
+        return mg, eg
+
+
+PAWN_TABLE = PawnTable() # Per process; shared by every search in it
+
+
+def king_safety(position, color):
+    # Middlegame penalty for enemy pieces bearing on the king's zone, less a
+    # bonus for pawns sheltering a king still on its first two ranks
+    board = position.board
+    king = lsb(board.pieces[color][KING])
+    zone = KING_ATTACKS[king] | (1 << king)
+    enemy = 'black' if color == WHITE else 'white'
+    pieces, _ = position.pieces_and_locations(enemy)
+    units = attackers = 0
+    for piece, reach in zip(pieces, position.reach_for(enemy)):
+        if reach & zone and KING_ATTACK_UNITS[PIECE_TYPES[piece]]:
+            units += KING_ATTACK_UNITS[PIECE_TYPES[piece]]
+            attackers += 1
+    penalty = min(units * units * attackers // 2, KING_DANGER_CAP) if attackers > 1 else 0
+    relative_rank = king >> 3 if color == WHITE else 7 - (king >> 3)
+    if relative_rank <= 1:
+        penalty -= SHIELD_BONUS * (SHIELD_MASKS[color][king] & board.pieces[color][PAWN]).bit_count()
+    return penalty
+
+
+def mobility(position, color_name):
+    # (mg, eg) bonus for the squares each piece can move to
+    mg = eg = 0
+    pieces, _ = position.pieces_and_locations(color_name)
+    for piece, targets in zip(pieces, position.options_for(color_name)):
+        ptype = PIECE_TYPES[piece]
+        if MOBILITY_MG[ptype]:
+            count = targets.bit_count()
+            mg += MOBILITY_MG[ptype] * count
+            eg += MOBILITY_EG[ptype] * count
+    return mg, eg
+
+
+def evaluate(position, pawn_table=PAWN_TABLE):
+    # Tapered score from the point of view of the side to move
+    board = position.board
+    mg, eg = position.psqt_mg, position.psqt_eg
+    pawn_mg, pawn_eg = pawn_table.score(position.pawn_key, board.pieces[WHITE][PAWN], board.pieces[BLACK][PAWN])
+    white_mg, white_eg = mobility(position, 'white')
+    black_mg, black_eg = mobility(position, 'black')
+    mg += pawn_mg + white_mg - black_mg - king_safety(position, WHITE) + king_safety(position, BLACK)
+    eg += pawn_eg + white_eg - black_eg
+    phase = min(position.phase, MAX_PHASE)
+    score = (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+    return score if position.turn == 'white' else -score
+
+
+def sample_positions(count, seed=0):
+    # Positions from random games, for benchmarking
+    from position import Position
+
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        position = Position.starting_position()
+        for _ in range(rng.randint(10, 80)):
+            moves = position.legal_moves()
+            if not moves:
+                break
+            position.make_move(rng.choice(moves))
+        positions.append(position)
+    return positions
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    positions = sample_positions(count)
+    repeats = max(1, 20000 // count)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for position in positions:
+            evaluate(position)
+    elapsed = time.perf_counter() - start
+    print(f"evaluate: {count * repeats / elapsed:,.0f} evals/sec over {count} positions")
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for position in positions:
+            board = position.board
+            pawn_structure(board.pieces[WHITE][PAWN], board.pieces[BLACK][PAWN])
+    print(f"pawn structure uncached: {(time.perf_counter() - start) / (count * repeats) * 1e6:.1f} us each")
+
+    # Hit rate as the search sees it: evaluations of sibling and child nodes
+    PAWN_TABLE.clear()
+    for position in positions:
+        for move in position.legal_moves():
+            position.make_move(move)
+            evaluate(position)
+            position.unmake_move()
+    print(f"pawn table hit rate over the children of each position: {PAWN_TABLE.hit_rate:.1%} "
+          f"({PAWN_TABLE.hits}/{PAWN_TABLE.probes})")
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for position in positions:
+            psqt_totals(position.board)
+    scratch = time.perf_counter() - start
+    print(f"material + PSQT recomputed from scratch: {scratch / (count * repeats) * 1e6:.1f} us each, "
+          f"which evaluate() saves by reading Position's incremental totals")
+
+    # Incremental upkeep cost: make/unmake of every legal move in each position
+    moves = 0
+    start = time.perf_counter()
+    for position in positions:
+        for move in position.legal_moves():
+            position.make_move(move)
+            position.unmake_move()
+            moves += 1
+    print(f"make/unmake with incremental PSQT: {moves / (time.perf_counter() - start):,.0f} moves/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,18 @@ from openpyxl.styles import Font # Import Font for styling
 from PIL import Image, ImageTk
 from openpyxl.utils import get_column_letter
 
+from position import Position, START_FEN
+from engine_worker import EngineProcess
+from notation import move_san
+from pgn import write_game
+from board_view import BoardView
+from bitboard import SQUARE_COORDS
+from book import OpeningBook, DEFAULT_BOOK
+from tablebase import open_tablebases
+from clock import ChessClock, FISCHER, BRONSTEIN, parse_time_control, until_next_change
+from replay import GameHistory
+from move_list import MoveListView
+
 class ChessGame:
     def __init__(self, root):
         self.root = root
@@ -21,6 +33,9 @@ class ChessGame:
         self.INFO_PANEL_WIDTH = 200
         self.BUTTON_WIDTH = 10
         self.BUTTON_HEIGHT = 2
+        self.ENGINE_TIME_LIMIT = 2.0 # Seconds the computer may think per move
+        self.ENGINE_POLL_MS = 50 # How often the Tk loop collects engine output
+        self.CLOCK_MOVE_OVERHEAD = 0.2 # Seconds of the computer's clock kept back for queue and poll latency
 
         # Colors
         self.LIGHT_SQUARE = "#D3D3D3"
@@ -42,25 +57,34 @@ class ChessGame:
         # Game variables
         self.player_white_name = ""
         self.player_black_name = ""
+        self.vs_computer = False # Single-player mode: the computer plays Black
+        self.engine = None # Search worker process, started with the first single-player game
+        self.engine_request = None # Id of the search whose best move we are waiting for
+        self.ponder_request = None # Id of the search running on the player's time
+        self.book = None # Opening book, opened with the engine if assets/book.bin exists
+        self.book_move = None # Book reply waiting to be played
+        self.adjudicate_tablebase_draws = False # End the game as soon as the tablebases call it a draw
+        self.tablebases = None # Opened for adjudication only; None unless assets/tablebases holds tables
         self.game_start_time = None
+        self.time_control = None # (seconds, increment, FISCHER or BRONSTEIN), None for untimed games
+        self.clock = None # ChessClock of the current game
+        self.clock_tick = None # Pending root.after id of tick_clock
+        self.clock_texts = {} # Text each clock label shows, so a tick only redraws what changed
         self.total_moves_count = 0
         # self.counter = 0 # Removed, no longer needed
-        self.white_pieces = []
-        self.white_locations = []
-        self.black_pieces = []
-        self.black_locations = []
-        self.captured_pieces_white = [] # Stores names of pieces captured by white
-        self.captured_pieces_black = [] # Stores names of pieces captured by black
+        self.position = Position() # Pieces, captures and move rules live in position.py
+        self.start_fen = START_FEN # Position new games start from
+        self.history = None # GameHistory: the moves in SAN, for the move list, replay and the PGN record
+        self.view_ply = None # Ply shown while browsing the move list, None for the live position
+        self.pgn_saved = False
         self.turn_step = 0 # 0,1 for white; 2,3 for black
         self.selection = 100 # Index of selected piece, 100 for none
         self.valid_moves = []
         self.winner = '' # 'white' or 'black'
         self.game_over = False
-        self.white_options = []
-        self.black_options = []
         self.piece_list = ['pawn', 'queen', 'king', 'knight', 'rook', 'bishop'] # Keep for reference
-        self.white_promotions = ['bishop', 'knight', 'rook', 'queen'] # For future promotion logic
-        self.black_promotions = ['bishop', 'knight', 'rook', 'queen'] # For future promotion logic
+        self.white_promotions = ['bishop', 'knight', 'rook', 'queen'] # Offered by ask_promotion
+        self.black_promotions = ['bishop', 'knight', 'rook', 'queen']
         self.game_end_condition = "Unknown"
 
         # Load images
@@ -123,6 +147,36 @@ class ChessGame:
         self.black_entry = tk.Entry(self.home_frame, font=self.status_font)
         self.black_entry.pack(pady=5)
 
+        self.vs_computer_var = tk.BooleanVar(value=self.vs_computer)
+        tk.Checkbutton(self.home_frame, text="Play against the computer (Black)", variable=self.vs_computer_var,
+                       bg="#333333", fg="white", selectcolor="#333333", activebackground="#333333",
+                       font=self.status_font).pack(pady=5)
+
+        self.adjudicate_var = tk.BooleanVar(value=self.adjudicate_tablebase_draws)
+        tk.Checkbutton(self.home_frame, text="Adjudicate tablebase draws", variable=self.adjudicate_var,
+                       bg="#333333", fg="white", selectcolor="#333333", activebackground="#333333",
+                       font=self.status_font).pack(pady=5)
+
+        tk.Label(self.home_frame, text="Start position (FEN, optional):", bg="#333333", fg="white",
+                 font=self.status_font).pack(pady=5)
+        self.fen_entry = tk.Entry(self.home_frame, font=self.status_font, width=50)
+        if self.start_fen != START_FEN:
+            self.fen_entry.insert(0, self.start_fen)
+        self.fen_entry.pack(pady=5)
+
+        tk.Label(self.home_frame, text="Time control (minutes+increment, optional):", bg="#333333", fg="white",
+                 font=self.status_font).pack(pady=5)
+        self.time_control_entry = tk.Entry(self.home_frame, font=self.status_font)
+        self.bronstein_var = tk.BooleanVar(value=False)
+        if self.time_control is not None:
+            seconds, increment, mode = self.time_control
+            self.time_control_entry.insert(0, f"{seconds / 60:g}+{increment:g}")
+            self.bronstein_var.set(mode == BRONSTEIN)
+        self.time_control_entry.pack(pady=5)
+        tk.Checkbutton(self.home_frame, text="Bronstein delay instead of Fischer increment",
+                       variable=self.bronstein_var, bg="#333333", fg="white", selectcolor="#333333",
+                       activebackground="#333333", font=self.status_font).pack(pady=5)
+
         tk.Button(self.home_frame, text="Start Game", command=self.start_game,
                   bg="#ADD8E6", fg="black", font=self.button_font,
                   width=self.BUTTON_WIDTH + 5, height=self.BUTTON_HEIGHT-1).pack(pady=20)
@@ -139,9 +193,33 @@ class ChessGame:
     def start_game(self):
         white_name = self.white_entry.get().strip()
         black_name = self.black_entry.get().strip()
+        self.vs_computer = self.vs_computer_var.get()
+        if self.vs_computer and not black_name:
+            black_name = "Computer"
+        fen = self.fen_entry.get().strip() or START_FEN
+        try:
+            Position.from_fen(fen)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid FEN: {e}")
+            return
+        self.start_fen = fen
+        time_control = self.time_control_entry.get().strip()
+        try:
+            self.time_control = (parse_time_control(time_control) +
+                                 (BRONSTEIN if self.bronstein_var.get() else FISCHER,)) if time_control else None
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
         if white_name and black_name:
             self.player_white_name = white_name
             self.player_black_name = black_name
+            self.adjudicate_tablebase_draws = self.adjudicate_var.get()
+            if self.adjudicate_tablebase_draws and self.tablebases is None:
+                self.tablebases = open_tablebases()
+            if self.vs_computer and self.engine is None:
+                self.engine = EngineProcess()
+                if os.path.exists(DEFAULT_BOOK):
+                    self.book = OpeningBook(DEFAULT_BOOK)
             self.clear_screen()
             self.setup_ui()
             self.setup_new_game() # This will set game_start_time
@@ -156,6 +234,8 @@ class ChessGame:
         self.board_canvas = tk.Canvas(self.main_frame, width=self.BOARD_SIZE * self.SQUARE_SIZE,
                                       height=self.BOARD_SIZE * self.SQUARE_SIZE, bg="#333333", highlightthickness=0)
         self.board_canvas.grid(row=0, column=0, padx=(0, 10))
+        self.board_view = BoardView(self.board_canvas, self.image_dict, self.SQUARE_SIZE,
+                                    self.LIGHT_SQUARE, self.DARK_SQUARE, self.VALID_MOVE_COLOR)
 
         self.side_panel = tk.Frame(self.main_frame, width=self.INFO_PANEL_WIDTH,
                                    height=self.BOARD_SIZE * self.SQUARE_SIZE, bg=self.PANEL_COLOR,
@@ -177,6 +257,27 @@ class ChessGame:
                                              fg="white", font=self.status_font, wraplength=self.INFO_PANEL_WIDTH-20)
         self.captured_black_pieces.grid(row=3, column=0, padx=5, sticky="w")
 
+        self.move_list = MoveListView(self.side_panel, self.INFO_PANEL_WIDTH - 40, 200, ("Courier", 11),
+                                      self.PANEL_COLOR, "white", "#806000", on_select=self.show_ply)
+        self.move_list.frame.grid(row=6, column=0, pady=(20, 0), padx=5, sticky="w")
+        replay_buttons = tk.Frame(self.side_panel, bg=self.PANEL_COLOR)
+        replay_buttons.grid(row=7, column=0, pady=5, padx=5, sticky="w")
+        for text, command in (("|<", lambda: self.show_ply(0)), ("<", lambda: self.step_ply(-1)),
+                              (">", lambda: self.step_ply(1)), (">|", lambda: self.show_ply(None))):
+            tk.Button(replay_buttons, text=text, command=command, bg=self.RESTART_COLOR, fg="black",
+                      font=self.button_font, width=3).pack(side=tk.LEFT, padx=1)
+        self.root.bind("<Left>", lambda event: self.step_ply(-1))
+        self.root.bind("<Right>", lambda event: self.step_ply(1))
+        self.root.bind("<Home>", lambda event: self.show_ply(0))
+        self.root.bind("<End>", lambda event: self.show_ply(None))
+
+        clock_font = font.Font(family="Courier", size=20, weight="bold")
+        self.clock_labels = {}
+        for row, color in ((4, 'black'), (5, 'white')): # Black's clock on top, as the board is drawn
+            label = tk.Label(self.side_panel, text="", bg=self.PANEL_COLOR, fg="white", font=clock_font)
+            label.grid(row=row, column=0, pady=(20, 0), padx=5, sticky="w")
+            self.clock_labels[color] = label
+
         self.bottom_panel = tk.Frame(self.root, width=self.BOARD_SIZE * self.SQUARE_SIZE + self.INFO_PANEL_WIDTH + 10,
                                      height=100, bg=self.PANEL_COLOR, highlightbackground=self.BORDER_COLOR,
                                      highlightthickness=5)
@@ -200,115 +301,95 @@ class ChessGame:
                                         width=self.BUTTON_WIDTH, height=self.BUTTON_HEIGHT)
         self.restart_button.pack(side=tk.RIGHT, padx=(0,5))
 
+        if self.vs_computer:
+            self.move_now_button = tk.Button(self.button_frame, text="MOVE NOW", command=self.engine_move_now,
+                                             bg=self.RESTART_COLOR, fg="black", font=self.button_font,
+                                             width=self.BUTTON_WIDTH, height=self.BUTTON_HEIGHT)
+            self.move_now_button.pack(side=tk.RIGHT, padx=(0,5))
+
+        self.fen_button = tk.Button(self.button_frame, text="COPY FEN", command=self.copy_fen,
+                                    bg=self.RESTART_COLOR, fg="black", font=self.button_font,
+                                    width=self.BUTTON_WIDTH, height=self.BUTTON_HEIGHT)
+        self.fen_button.pack(side=tk.RIGHT, padx=(0,5))
+
 
         self.board_canvas.bind("<Button-1>", self.handle_click)
 
     def setup_new_game(self):
-        self.white_pieces = ['rook', 'knight', 'bishop', 'king', 'queen', 'bishop', 'knight', 'rook',
-                             'pawn', 'pawn', 'pawn', 'pawn', 'pawn', 'pawn', 'pawn', 'pawn']
-        self.white_locations = [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0), (5, 0), (6, 0), (7, 0),
-                                (0, 1), (1, 1), (2, 1), (3, 1), (4, 1), (5, 1), (6, 1), (7, 1)]
-        self.black_pieces = ['rook', 'knight', 'bishop', 'king', 'queen', 'bishop', 'knight', 'rook',
-                             'pawn', 'pawn', 'pawn', 'pawn', 'pawn', 'pawn', 'pawn', 'pawn']
-        self.black_locations = [(0, 7), (1, 7), (2, 7), (3, 7), (4, 7), (5, 7), (6, 7), (7, 7),
-                                (0, 6), (1, 6), (2, 6), (3, 6), (4, 6), (5, 6), (6, 6), (7, 6)]
-        self.captured_pieces_white = []
-        self.captured_pieces_black = []
-        self.turn_step = 0
+        self.cancel_engine()
+        self.position.set_fen(self.start_fen) # Also recalculates options for the new board setup
+        self.turn_step = 0 if self.position.turn == 'white' else 2
         self.selection = 100
         self.valid_moves = []
         self.winner = ''
         self.game_over = False
         self.game_start_time = time.time() # Game starts now
         self.total_moves_count = 0
+        self.history = GameHistory(self.position)
+        self.view_ply = None
+        self.move_list.set_moves(self.history.sans, self.history.black_first, self.history.first_move_number)
+        self.pgn_saved = False
         self.game_end_condition = "Ongoing" # Or "Not Started Yet" if preferred
-        # Recalculate options for the new board setup
-        self.black_options = self.check_options(self.black_pieces, self.black_locations, 'black')
-        self.white_options = self.check_options(self.white_pieces, self.white_locations, 'white')
+        self.stop_clock()
+        self.clock = ChessClock(*self.time_control) if self.time_control is not None else None
+        if self.clock is not None:
+            self.clock.start(self.position.turn)
+        self.draw_clocks()
+        self.restart_clock_tick()
+        if self.computer_to_move(): # A FEN start with Black to move
+            self.root.after(0, self.request_computer_move)
         # self.update_ui() # update_ui is usually called after setup_new_game by the caller
 
-    def draw_board(self):
-        self.board_canvas.delete("all") # Clear previous drawings
-        for row in range(self.BOARD_SIZE):
-            for col in range(self.BOARD_SIZE):
-                x1 = col * self.SQUARE_SIZE
-                y1 = row * self.SQUARE_SIZE
-                x2 = x1 + self.SQUARE_SIZE
-                y2 = y1 + self.SQUARE_SIZE
-                color = self.LIGHT_SQUARE if (row + col) % 2 == 0 else self.DARK_SQUARE
-                self.board_canvas.create_rectangle(x1, y1, x2, y2, fill=color, outline="black")
+    def shown_position(self):
+        # The live position, or the one picked in the move list while browsing
+        return self.position if self.view_ply is None else self.history.position
 
     def draw_pieces(self):
-        # Delete only piece-specific tags, not "all" which is done by draw_board
-        self.board_canvas.delete("piece", "highlight", "valid", "check")
-
-        for i, (piece, loc) in enumerate(zip(self.white_pieces, self.white_locations)):
-            x_center = loc[0] * self.SQUARE_SIZE + self.SQUARE_SIZE // 2
-            y_center = loc[1] * self.SQUARE_SIZE + self.SQUARE_SIZE // 2
-            self.board_canvas.create_image(x_center, y_center, image=self.image_dict[f"white_{piece}"], tags="piece")
-            if self.turn_step < 2 and self.selection == i: # White's turn and this piece is selected
-                self.board_canvas.create_rectangle(loc[0] * self.SQUARE_SIZE + 2, loc[1] * self.SQUARE_SIZE + 2,
-                                                   (loc[0] + 1) * self.SQUARE_SIZE - 2, (loc[1] + 1) * self.SQUARE_SIZE - 2,
-                                                   outline=self.HIGHLIGHT_WHITE, width=3, tags="highlight")
-
-        for i, (piece, loc) in enumerate(zip(self.black_pieces, self.black_locations)):
-            x_center = loc[0] * self.SQUARE_SIZE + self.SQUARE_SIZE // 2
-            y_center = loc[1] * self.SQUARE_SIZE + self.SQUARE_SIZE // 2
-            self.board_canvas.create_image(x_center, y_center, image=self.image_dict[f"black_{piece}"], tags="piece")
-            if self.turn_step >= 2 and self.selection == i: # Black's turn and this piece is selected
-                self.board_canvas.create_rectangle(loc[0] * self.SQUARE_SIZE + 2, loc[1] * self.SQUARE_SIZE + 2,
-                                                   (loc[0] + 1) * self.SQUARE_SIZE - 2, (loc[1] + 1) * self.SQUARE_SIZE - 2,
-                                                   outline=self.HIGHLIGHT_BLACK, width=3, tags="highlight")
-        
-        if self.selection != 100 and not self.game_over: # Only show valid moves if a piece is selected and game not over
-            # self.valid_moves = self.check_valid_moves() # Already calculated or should be updated when selection changes
-            for move in self.valid_moves:
-                x_center = move[0] * self.SQUARE_SIZE + self.SQUARE_SIZE // 2
-                y_center = move[1] * self.SQUARE_SIZE + self.SQUARE_SIZE // 2
-                self.board_canvas.create_oval(x_center - 5, y_center - 5, x_center + 5, y_center + 5,
-                                              fill=self.VALID_MOVE_COLOR, tags="valid")
-        self.draw_check() # Draw check status
+        # Pieces, selection, valid moves and check; the board view only touches
+        # the canvas items that changed since the last frame
+        position = self.shown_position()
+        placement = {}
+        for color in ('white', 'black'):
+            pieces, locations = position.pieces_and_locations(color)
+            for piece, loc in zip(pieces, locations):
+                placement[loc] = f"{color}_{piece}"
+
+        selection = None
+        selection_color = self.HIGHLIGHT_WHITE if self.turn_step < 2 else self.HIGHLIGHT_BLACK
+        _, locations = self.position.pieces_and_locations('white' if self.turn_step < 2 else 'black')
+        if self.view_ply is None and self.selection != 100 and self.selection < len(locations):
+            selection = locations[self.selection]
+        # Only show valid moves if a piece is selected and game not over
+        valid_moves = self.valid_moves if selection is not None and not self.game_over else ()
+
+        check = None
+        check_color = self.HIGHLIGHT_CHECK_WHITE if position.turn == 'white' else self.HIGHLIGHT_CHECK_BLACK
+        if position.in_check(): # Only the side to move can be in check now that moves are legal
+            check = SQUARE_COORDS[position.king_square(position.turn)]
+
+        self.board_view.render(placement, selection, selection_color, valid_moves, check, check_color)
 
     def draw_captured(self):
-        white_captured_display = " ".join([p[0].upper() for p in self.captured_pieces_white])
-        black_captured_display = " ".join([p[0].upper() for p in self.captured_pieces_black])
+        position = self.shown_position()
+        white_captured_display = " ".join([p[0].upper() for p in position.captured_pieces_white])
+        black_captured_display = " ".join([p[0].upper() for p in position.captured_pieces_black])
         self.captured_white_pieces.config(text=white_captured_display)
         self.captured_black_pieces.config(text=black_captured_display)
 
-    def draw_check(self):
-        self.board_canvas.delete("check") # Clear previous check highlights
-        # Show check for White King (if it's White's turn or for general display)
-        if 'king' in self.white_pieces:
-            king_idx = self.white_pieces.index('king')
-            king_loc = self.white_locations[king_idx]
-            for options_list in self.black_options: # black_options are lists of moves for each black piece
-                if king_loc in options_list:
-                    self.board_canvas.create_rectangle(king_loc[0] * self.SQUARE_SIZE + 2, king_loc[1] * self.SQUARE_SIZE + 2,
-                                                       (king_loc[0] + 1) * self.SQUARE_SIZE - 2, (king_loc[1] + 1) * self.SQUARE_SIZE - 2,
-                                                       outline=self.HIGHLIGHT_CHECK_WHITE, width=3, tags="check")
-                    break # King is in check, no need to check other black pieces
-        
-        # Show check for Black King
-        if 'king' in self.black_pieces:
-            king_idx = self.black_pieces.index('king')
-            king_loc = self.black_locations[king_idx]
-            for options_list in self.white_options:
-                if king_loc in options_list:
-                    self.board_canvas.create_rectangle(king_loc[0] * self.SQUARE_SIZE + 2, king_loc[1] * self.SQUARE_SIZE + 2,
-                                                       (king_loc[0] + 1) * self.SQUARE_SIZE - 2, (king_loc[1] + 1) * self.SQUARE_SIZE - 2,
-                                                       outline=self.HIGHLIGHT_CHECK_BLACK, width=3, tags="check")
-                    break
-
     def process_game_over_prompt(self):
+        if not self.game_over or self.game_start_time is None:
+            return # Restarted or left before the prompt came up
         winner_name = ""
         if self.winner == 'white':
             winner_name = self.player_white_name
         elif self.winner == 'black':
             winner_name = self.player_black_name
-        else: # Should not happen if self.winner is set
-            winner_name = "Nobody"
 
-        response = messagebox.askyesno("Game Over", f"{winner_name} won!\nDo you want to play another game?")
+        if winner_name:
+            result_text = f"{winner_name} won by {self.game_end_condition.lower()}!"
+        else:
+            result_text = f"Draw by {self.game_end_condition.lower()}."
+        response = messagebox.askyesno("Game Over", f"{result_text}\nDo you want to play another game?")
 
         if response:  # User clicked "Yes"
             self.game_end_condition = "Finished"
@@ -324,169 +405,50 @@ class ChessGame:
         if not hasattr(self, 'board_canvas') or not self.board_canvas.winfo_exists():
              return # UI not ready or destroyed
 
-        self.draw_board() # Redraws squares
-        self.draw_pieces() # Redraws pieces, highlights, valid moves, and check
+        self.draw_pieces() # Updates pieces, highlights, valid moves, and check
         self.draw_captured()
         current_turn_text = ""
-        if not self.game_over:
+        if self.view_ply is not None:
+            if self.view_ply == 0:
+                current_turn_text = "Viewing the start position"
+            else:
+                current_turn_text = (f"Viewing {self.history.move_label(self.view_ply - 1)} "
+                                     f"{self.history.sans[self.view_ply - 1]}")
+        elif not self.game_over:
             current_turn_text = f"{self.player_white_name}'s Turn (White)" if self.turn_step < 2 else f"{self.player_black_name}'s Turn (Black)"
         elif self.winner:
              winner_player = self.player_white_name if self.winner == 'white' else self.player_black_name
              current_turn_text = f"Game Over! {winner_player} won."
         else:
-             current_turn_text = "Game Over!" # e.g. if draw condition met in future
+             current_turn_text = f"Game Over! Draw by {self.game_end_condition.lower()}."
         self.turn_label.config(text=current_turn_text)
-        self.root.update_idletasks() # Process pending Tkinter operations
-        # self.root.update() # Can sometimes cause issues or be unnecessary
-
-    def check_options(self, pieces, locations, color):
-        all_moves_list = []
-        for i in range(len(pieces)):
-            location = locations[i]
-            piece = pieces[i]
-            current_piece_moves = []
-            if piece == 'pawn':
-                current_piece_moves = self.check_pawn(location, color)
-            elif piece == 'rook':
-                current_piece_moves = self.check_rook(location, color)
-            elif piece == 'knight':
-                current_piece_moves = self.check_knight(location, color)
-            elif piece == 'bishop':
-                current_piece_moves = self.check_bishop(location, color)
-            elif piece == 'queen':
-                current_piece_moves = self.check_queen(location, color)
-            elif piece == 'king':
-                current_piece_moves = self.check_king(location, color)
-            all_moves_list.append(current_piece_moves)
-        return all_moves_list
-
-    def get_enemies_friends(self, color):
-        if color == 'white':
-            friends_list = self.white_locations
-            enemies_list = self.black_locations
-        else: # color == 'black'
-            friends_list = self.black_locations
-            enemies_list = self.white_locations
-        return friends_list, enemies_list
-
-    def check_king(self, position, color):
-        moves_list = []
-        friends_list, _ = self.get_enemies_friends(color) # King cannot move to a square occupied by a friendly piece
-        # King moves one square in any direction
-        for dr in [-1, 0, 1]:
-            for dc in [-1, 0, 1]:
-                if dr == 0 and dc == 0:
-                    continue # Skip current position
-                target_row, target_col = position[1] + dr, position[0] + dc # row is y (pos[1]), col is x (pos[0])
-                if 0 <= target_row <= 7 and 0 <= target_col <= 7:
-                    target_pos = (target_col, target_row)
-                    if target_pos not in friends_list:
-                        moves_list.append(target_pos)
-        return moves_list
-
-    def check_queen(self, position, color):
-        moves_list = self.check_bishop(position, color)
-        moves_list.extend(self.check_rook(position, color))
-        return moves_list
-
-    def check_bishop(self, position, color):
-        moves_list = []
-        friends_list, enemies_list = self.get_enemies_friends(color)
-        # Directions: diagonal
-        for dr, dc in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
-            for i in range(1, 8): # Max 7 steps
-                target_row, target_col = position[1] + i * dr, position[0] + i * dc
-                if 0 <= target_row <= 7 and 0 <= target_col <= 7:
-                    target_pos = (target_col, target_row)
-                    if target_pos in friends_list: # Blocked by a friendly piece
-                        break
-                    moves_list.append(target_pos)
-                    if target_pos in enemies_list: # Can capture enemy, but cannot move further in this direction
-                        break
-                else: # Off board
-                    break
-        return moves_list
-
-    def check_rook(self, position, color):
-        moves_list = []
-        friends_list, enemies_list = self.get_enemies_friends(color)
-        # Directions: horizontal and vertical
-        for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            for i in range(1, 8):
-                target_row, target_col = position[1] + i * dr, position[0] + i * dc
-                if 0 <= target_row <= 7 and 0 <= target_col <= 7:
-                    target_pos = (target_col, target_row)
-                    if target_pos in friends_list:
-                        break
-                    moves_list.append(target_pos)
-                    if target_pos in enemies_list:
-                        break
-                else:
-                    break
-        return moves_list
-
-    def check_pawn(self, position, color):
-        moves_list = []
-        # friends_list, enemies_list = self.get_enemies_friends(color) # Not directly needed here, using white/black locations
-        r, c = position[1], position[0] # row, col for clarity
-
-        if color == 'white':
-            direction = 1 # White pawns move from row 1 towards row 7
-            start_row = 1
-            # Single step forward
-            if r + direction <= 7 and (c, r + direction) not in self.white_locations and (c, r + direction) not in self.black_locations:
-                moves_list.append((c, r + direction))
-                # Double step from start
-                if r == start_row and (c, r + 2 * direction) not in self.white_locations and (c, r + 2 * direction) not in self.black_locations:
-                    moves_list.append((c, r + 2 * direction))
-            # Captures
-            if c - 1 >= 0 and r + direction <= 7 and (c - 1, r + direction) in self.black_locations:
-                moves_list.append((c - 1, r + direction))
-            if c + 1 <= 7 and r + direction <= 7 and (c + 1, r + direction) in self.black_locations:
-                moves_list.append((c + 1, r + direction))
-        else: # color == 'black'
-            direction = -1 # Black pawns move from row 6 towards row 0
-            start_row = 6
-            # Single step forward
-            if r + direction >= 0 and (c, r + direction) not in self.black_locations and (c, r + direction) not in self.white_locations:
-                moves_list.append((c, r + direction))
-                # Double step from start
-                if r == start_row and (c, r + 2 * direction) not in self.black_locations and (c, r + 2 * direction) not in self.white_locations:
-                    moves_list.append((c, r + 2 * direction))
-            # Captures
-            if c - 1 >= 0 and r + direction >= 0 and (c - 1, r + direction) in self.white_locations:
-                moves_list.append((c - 1, r + direction))
-            if c + 1 <= 7 and r + direction >= 0 and (c + 1, r + direction) in self.white_locations:
-                moves_list.append((c + 1, r + direction))
-        return moves_list
-    
-    def check_knight(self, position, color):
-        moves_list = []
-        friends_list, _ = self.get_enemies_friends(color)
-        r, c = position[1], position[0]
-        # Possible L-shaped moves for a knight
-        knight_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                        (1, -2), (1, 2), (2, -1), (2, 1)]
-        for dr, dc in knight_moves:
-            target_row, target_col = r + dr, c + dc
-            if 0 <= target_row <= 7 and 0 <= target_col <= 7:
-                target_pos = (target_col, target_row)
-                if target_pos not in friends_list:
-                    moves_list.append(target_pos)
-        return moves_list
+        # The canvas is redrawn by the event loop once the click handler returns
 
     def check_valid_moves(self): # Get valid moves for the currently selected piece
         if self.selection == 100 or self.game_over: # No piece selected or game is over
             return []
 
-        if self.turn_step < 2: # White's turn
-            if self.selection < len(self.white_options):
-                return self.white_options[self.selection]
-        else: # Black's turn
-            if self.selection < len(self.black_options):
-                return self.black_options[self.selection]
+        _, locations = self.position.pieces_and_locations(self.position.turn)
+        if self.selection < len(locations):
+            return self.position.legal_targets(locations[self.selection])
         return []
 
+    def ask_promotion(self, color):
+        # Modal chooser for the piece a pawn promotes to
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Promote pawn")
+        dialog.configure(bg=self.PANEL_COLOR)
+        dialog.transient(self.root)
+        choice = tk.StringVar(value='queen')
+        promotions = self.white_promotions if color == 'white' else self.black_promotions
+        for piece in reversed(promotions): # Queen first
+            tk.Button(dialog, image=self.image_dict[f"{color}_{piece}"], bg=self.LIGHT_SQUARE,
+                      command=lambda piece=piece: (choice.set(piece), dialog.destroy())).pack(side=tk.LEFT, padx=5, pady=5)
+        dialog.protocol("WM_DELETE_WINDOW", dialog.destroy) # Closing the window keeps the queen
+        dialog.grab_set()
+        self.root.wait_window(dialog)
+        return choice.get()
+
 
     def format_duration(self, seconds):
         s = int(seconds)
@@ -594,12 +556,55 @@ class ChessGame:
             print(f"Error saving to Excel: {e}")
             messagebox.showerror("Excel Save Error", f"Could not save game data: {e}")
 
+        self.save_game_to_pgn()
+
+    def save_game_to_pgn(self):
+        # Appends the game's moves to assets/Chess_games.pgn, once per game
+        if self.pgn_saved or self.game_start_time is None:
+            return
+        if self.winner == 'white':
+            result = '1-0'
+        elif self.winner == 'black':
+            result = '0-1'
+        elif self.game_over:
+            result = '1/2-1/2'
+        else:
+            result = '*' # Quit or reset before the end
+        headers = {
+            "Event": "Casual game",
+            "Site": "Chess Game",
+            "Date": datetime.datetime.fromtimestamp(self.game_start_time).strftime("%Y.%m.%d"),
+            "Round": "-",
+            "White": self.player_white_name,
+            "Black": self.player_black_name,
+            "Termination": self.game_end_condition,
+        }
+        if self.clock is not None:
+            headers["TimeControl"] = self.clock.pgn_time_control()
+        filename = os.path.join('assets', "Chess_games.pgn")
+        try:
+            with open(filename, 'a', encoding='utf-8') as stream:
+                write_game(stream, headers, self.history.sans, result, self.start_fen)
+            self.pgn_saved = True
+            print(f"Game moves saved to {filename}.")
+        except OSError as e:
+            print(f"Error saving PGN: {e}")
+            messagebox.showerror("PGN Save Error", f"Could not save game moves: {e}")
+
+    def copy_fen(self):
+        fen = self.shown_position().fen()
+        self.root.clipboard_clear()
+        self.root.clipboard_append(fen)
+        print(f"FEN copied to clipboard: {fen}")
+
     def return_to_home(self, from_game_end_decline=False):
         if not from_game_end_decline and self.game_start_time is not None and not self.game_over:
             # Only save as "Quit" if game was active and not just finished & declined continuation
             self.game_end_condition = "Quit"
             self.save_game_to_excel()
         
+        self.cancel_engine()
+        self.stop_clock()
         self.clear_screen()
         self.show_home_screen() # This also resets game_start_time, winner, game_over
 
@@ -607,6 +612,13 @@ class ChessGame:
         if self.game_start_time is not None and not self.game_over:
             self.game_end_condition = "Quit_From_App_Close" # Or just "Quit"
             self.save_game_to_excel()
+        self.stop_clock()
+        if self.engine is not None:
+            self.engine.close()
+        if self.book is not None:
+            self.book.close()
+        if self.tablebases is not None:
+            self.tablebases.close()
         self.root.destroy()
 
     def restart_game(self):
@@ -618,7 +630,10 @@ class ChessGame:
         self.update_ui()
 
     def handle_click(self, event):
-        if self.game_over:
+        if self.view_ply is not None: # Browsing: a click on the board goes back to the game
+            self.show_ply(None)
+            return
+        if self.game_over or self.computer_to_move():
             return
 
         click_col = event.x // self.SQUARE_SIZE
@@ -629,28 +644,13 @@ class ChessGame:
         if not (0 <= click_col < self.BOARD_SIZE and 0 <= click_row < self.BOARD_SIZE):
             return
 
-        current_player_pieces = []
-        current_player_locations = []
-        opponent_pieces = []
-        opponent_locations = []
-        player_color_string = ""
-
-        if self.turn_step < 2: # White's turn (steps 0 or 1)
-            current_player_pieces = self.white_pieces
-            current_player_locations = self.white_locations
-            opponent_pieces = self.black_pieces
-            opponent_locations = self.black_locations
-            player_color_string = 'white'
-        else: # Black's turn (steps 2 or 3)
-            current_player_pieces = self.black_pieces
-            current_player_locations = self.black_locations
-            opponent_pieces = self.white_pieces
-            opponent_locations = self.white_locations
-            player_color_string = 'black'
-            
+        player_color_string = 'white' if self.turn_step < 2 else 'black' # White's turn is steps 0 or 1
+        _, current_player_locations = self.position.pieces_and_locations(player_color_string)
+
         if self.turn_step % 2 == 0:
-            if click_coords in current_player_locations:
-                self.selection = current_player_locations.index(click_coords)
+            clicked_index = self.position.index_at(click_coords, player_color_string)
+            if clicked_index is not None:
+                self.selection = clicked_index
                 self.valid_moves = self.check_valid_moves()
                 self.turn_step += 1
             else:
@@ -660,45 +660,20 @@ class ChessGame:
         else: # turn_step is 1 or 3
             if self.selection != 100: 
                 if click_coords in self.valid_moves:
-                    # Move the piece
-                    moved_piece_index = self.selection
-                    current_player_locations[moved_piece_index] = click_coords
-                    self.total_moves_count += 1
-
-                    # Check for capture
-                    if click_coords in opponent_locations:
-                        captured_idx = opponent_locations.index(click_coords)
-                        captured_piece_type = opponent_pieces.pop(captured_idx)
-                        opponent_locations.pop(captured_idx)
-                        if player_color_string == 'white':
-                            self.captured_pieces_white.append(captured_piece_type)
-                        else:
-                            self.captured_pieces_black.append(captured_piece_type)
-                        
-                        if captured_piece_type == 'king':
-                            self.winner = player_color_string
-                            self.game_over = True
-                            self.game_end_condition = "King_Capture"
-                            self.save_game_to_excel()
-                            self.update_ui()
-                            return
-                    else:
-                        if current_player_pieces[moved_piece_index] == 'pawn':
-                            if (player_color_string == 'white' and click_coords[1] == 7) or \
-                                (player_color_string == 'black' and click_coords[1] == 0):
-                                current_player_pieces[moved_piece_index] = 'queen'
-
-                    # Update all piece options for both players
-                    self.white_options = self.check_options(self.white_pieces, self.white_locations, 'white')
-                    self.black_options = self.check_options(self.black_pieces, self.black_locations, 'black')
-                    
-                    # Switch turn
-                    self.turn_step = (self.turn_step + 1) % 4 # Cycles 0->1->2->3->0
-                    self.selection = 100 # Deselect piece
-                    self.valid_moves = []
-
-                elif click_coords in current_player_locations: # Clicked another of own pieces
-                    self.selection = current_player_locations.index(click_coords) # Select new piece
+                    start = current_player_locations[self.selection]
+                    promotion = 'queen'
+                    if self.position.is_promotion(start, click_coords):
+                        promotion = self.ask_promotion(player_color_string)
+                    move = self.position.move_for(start, click_coords, promotion)
+                    if not self.apply_move(move):
+                        return # Game over: saved, drawn and the prompt is on its way
+                    self.update_ui()
+                    if self.computer_to_move():
+                        self.request_computer_move() # After update_ui, which would overwrite its label
+                    return
+
+                elif self.position.index_at(click_coords, player_color_string) is not None: # Clicked another of own pieces
+                    self.selection = self.position.index_at(click_coords, player_color_string) # Select new piece
                     self.valid_moves = self.check_valid_moves()
                     # Keep turn_step as 1 or 3 (still this player's turn to make a move)
                 else: # Clicked an invalid square (empty or unmovable)
@@ -708,12 +683,192 @@ class ChessGame:
             else: # No piece was selected, but turn_step was 1 or 3 (should not happen with proper logic)
                 self.turn_step -=1 # Revert to selection state
 
-        if self.game_over: # If king was captured
-            self.update_ui() # Show the final move and capture
-            self.process_game_over_prompt() # Then ask to continue
+        self.update_ui()
+
+    def apply_move(self, move):
+        # Move the piece; captures, promotion and options are handled by the position.
+        # Returns False if the move ended the game.
+        if self.clock is not None and self.clock.check_flag():
+            self.flag_fall() # Ran out before the next tick noticed
+            return False
+        san = move_san(self.position, move)
+        self.position.make_move(move)
+        self.history.push(move, san, self.position)
+        self.total_moves_count += 1
+        self.view_ply = None # A new move always brings the board back to the game
+        self.move_list.moves_changed()
+        if self.clock is not None:
+            self.clock.press()
+            if self.clock.flagged:
+                self.flag_fall()
+                return False
+            self.draw_clocks()
+            self.restart_clock_tick()
+
+        if self.position.check_game_over(): # Mate, stalemate, repetition, fifty moves or dead material
+            self.end_game(self.position.winner, self.position.end_condition)
+            return False
+        if (self.adjudicate_tablebase_draws and self.tablebases is not None and
+                self.tablebases.probe(self.position) == 0):
+            # Neither side can force mate any more: adjudicate the draw
+            self.end_game('', "Tablebase")
+            return False
+
+        # Switch turn
+        self.turn_step = 0 if self.position.turn == 'white' else 2
+        self.selection = 100 # Deselect piece
+        self.valid_moves = []
+        return True
+
+    def end_game(self, winner, condition):
+        # Every way a game can end goes through here, whoever made the last move
+        self.winner = winner
+        self.game_over = True
+        self.game_end_condition = condition
+        self.selection = 100
+        self.valid_moves = []
+        self.stop_clock()
+        self.cancel_engine() # Stop any ponder search on the finished game
+        self.save_game_to_excel()
+        self.update_ui() # Show the final move and capture
+        # Then ask to continue, once the caller has returned: the answer may rebuild or close the board
+        self.root.after(0, self.process_game_over_prompt)
+
+    def show_ply(self, ply):
+        # Shows the position after `ply` moves of the game, or the live game
+        # for None or once `ply` reaches its end
+        if self.history is None or self.game_start_time is None:
+            return # Keys are bound on the root, so they also arrive on the home screen
+        ply = len(self.history) if ply is None else max(0, min(ply, len(self.history)))
+        if ply == len(self.history):
+            self.view_ply = None
+        else:
+            self.view_ply = ply
+            self.history.seek(ply)
+        self.move_list.set_current(ply)
+        self.update_ui()
+
+    def step_ply(self, delta):
+        if self.history is None:
+            return
+        current = len(self.history) if self.view_ply is None else self.view_ply
+        self.show_ply(current + delta)
+
+    def flag_fall(self):
+        # The side to move ran out of time: it loses, unless the opponent
+        # could never mate, in which case the game is drawn
+        flagged = self.clock.flagged
+        other = 'black' if flagged == 'white' else 'white'
+        if self.position.has_mating_material(other):
+            self.end_game(other, "Time Forfeit")
         else:
+            self.end_game('', "Timeout vs Insufficient Material")
+
+    def draw_clocks(self):
+        # Both clock labels; the side to move is highlighted
+        if not hasattr(self, 'clock_labels'):
+            return
+        self.clock_texts = {}
+        for color, label in self.clock_labels.items():
+            if self.clock is None:
+                label.config(text="")
+                continue
+            text = self.clock.text(color)
+            label.config(text=f"{color[0].upper()} {text}",
+                         fg=self.BORDER_COLOR if color == self.clock.running else "white")
+            self.clock_texts[color] = text
+
+    def tick_clock(self):
+        # Redraws only the running clock, and only when its text changes; the
+        # next tick is scheduled for when the shown time will next change
+        self.clock_tick = None
+        if self.clock is None or self.clock.running is None or self.game_over:
+            return
+        if self.clock.check_flag():
+            self.flag_fall()
+            return
+        color = self.clock.running
+        seconds = self.clock.time_left(color)
+        text = self.clock.text(color)
+        if self.clock_texts.get(color) != text:
+            self.clock_labels[color].config(text=f"{color[0].upper()} {text}")
+            self.clock_texts[color] = text
+        self.clock_tick = self.root.after(int(until_next_change(seconds) * 1000) + 1, self.tick_clock)
+
+    def restart_clock_tick(self):
+        if self.clock_tick is not None:
+            self.root.after_cancel(self.clock_tick)
+            self.clock_tick = None
+        self.tick_clock()
+
+    def stop_clock(self):
+        if self.clock_tick is not None:
+            self.root.after_cancel(self.clock_tick)
+            self.clock_tick = None
+        if self.clock is not None:
+            self.clock.stop()
+
+    def computer_to_move(self):
+        return self.vs_computer and self.position.turn == 'black'
+
+    def request_computer_move(self):
+        # The search runs in the worker process; poll_engine picks up the answer
+        if self.ponder_request is not None:
+            self.engine.stop(self.ponder_request) # The player's move is in, stop pondering
+            self.ponder_request = None
+        if self.book is not None:
+            self.book_move = self.book.choose(self.position)
+            if self.book_move is not None:
+                # No search needed; played from the event loop so the board redraws first
+                self.root.after(self.ENGINE_POLL_MS, self.play_book_move)
+                return
+        time_limit = self.ENGINE_TIME_LIMIT
+        if self.clock is not None:
+            time_limit = self.clock.move_time('black', overhead=self.CLOCK_MOVE_OVERHEAD)
+        self.engine_request = self.engine.start_search(self.position, time_limit=time_limit)
+        self.turn_label.config(text=f"{self.player_black_name} is thinking...")
+        self.root.after(self.ENGINE_POLL_MS, self.poll_engine)
+
+    def poll_engine(self):
+        if self.engine is None or self.engine_request is None:
+            return
+        for message in self.engine.poll():
+            if message[1] != self.engine_request:
+                continue # Output of a cancelled or ponder search
+            if message[0] == 'info':
+                _, _, depth, score, nodes, nps, pv = message
+                self.turn_label.config(text=f"{self.player_black_name} is thinking... "
+                                            f"depth {depth}, score {score}, {nps} nodes/sec")
+            elif message[0] == 'bestmove':
+                _, _, move, ponder_move, score, depth, nodes, nps = message
+                print(f"Computer searched {nodes} nodes to depth {depth} ({nps} nodes/sec), score {score}")
+                self.engine_request = None
+                if move is not None and self.apply_move(move):
+                    self.update_ui()
+                    if ponder_move is not None:
+                        # Think about the expected reply while the player is thinking
+                        self.ponder_request = self.engine.start_search(self.position, time_limit=None,
+                                                                       moves=[ponder_move])
+                return
+        self.root.after(self.ENGINE_POLL_MS, self.poll_engine)
+
+    def play_book_move(self):
+        move, self.book_move = self.book_move, None
+        if move is not None and self.apply_move(move): # None if the game was reset meanwhile
+            print("Computer played a book move")
             self.update_ui()
 
+    def engine_move_now(self):
+        if self.engine is not None and self.engine_request is not None:
+            self.engine.stop(self.engine_request) # The worker still replies with its best move so far
+
+    def cancel_engine(self):
+        if self.engine is not None:
+            self.engine.stop()
+        self.engine_request = None
+        self.ponder_request = None
+        self.book_move = None
+
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,369 @@
+# Headless engine-vs-engine matches, to tell whether a change makes the
+# engine stronger.
+#
+# Both players are UCI engines started as subprocesses (uci.py by default, so
+# an older checkout can be pitted against the working tree). Every opening is
+# played twice with colors swapped; the games are spread over a process pool
+# in which each worker keeps its own pair of engines running. Position is the
+# referee: it checks every move and ends the game by its rules, and a
+# clock.ChessClock keeps each game's time. Finished games are appended to a
+# PGN file as they come in, and the running score is reported as an Elo
+# difference with a 95% error bar. With --sprt the match stops as soon as the sequential
+# probability ratio test accepts either hypothesis.
+#
+#   python match.py --games 200 --tc 10+0.1 --workers 4 --pgn match.pgn
+#   python match.py --engine1 "python uci.py" --engine2 "python ../old/chess game/uci.py" \
+#                   --sprt 0 10 --openings openings.pgn --opening-plies 8
+
+import argparse
+import atexit
+import math
+import multiprocessing
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+from clock import ChessClock
+from notation import move_san
+from pgn import open_games, write_game
+from position import Position
+
+DEFAULT_ENGINE = f"{shlex.quote(sys.executable)} uci.py"
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__)) # Engines run here, so their assets/ resolve
+DEFAULT_OPENINGS = [
+    "e2e4 e7e5 g1f3 b8c6", "e2e4 c7c5 g1f3 d7d6", "e2e4 e7e6 d2d4 d7d5", "e2e4 c7c6 d2d4 d7d5",
+    "d2d4 d7d5 c2c4 e7e6", "d2d4 g8f6 c2c4 g7g6", "d2d4 g8f6 c2c4 e7e6", "c2c4 e7e5 b1c3 g8f6",
+    "g1f3 d7d5 g2g3 g8f6", "e2e4 d7d5 e4d5 d8d5", "d2d4 d7d5 c2c4 c7c6", "e2e4 g7g6 d2d4 f8g7",
+]
+Z_95 = 1.96
+
+
+class EngineError(RuntimeError):
+    pass
+
+
+class UCIClient:
+    # A UCI engine subprocess driven line by line
+    def __init__(self, command, cwd=ENGINE_DIR):
+        self.command = command
+        self.process = subprocess.Popen(shlex.split(command), cwd=cwd, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.name = command
+        self.send('uci')
+        for line in self.lines_until('uciok'):
+            if line.startswith('id name '):
+                self.name = line[len('id name '):]
+
+    def send(self, line):
+        self.process.stdin.write(line + '\n')
+        self.process.stdin.flush()
+
+    def lines_until(self, keyword):
+        # Engine output up to and including the line that starts with keyword
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise EngineError(f"{self.command!r} exited")
+            line = line.strip()
+            yield line
+            if line.split(' ', 1)[0] == keyword:
+                return
+
+    def new_game(self):
+        self.send('ucinewgame')
+        self.send('isready')
+        for _ in self.lines_until('readyok'):
+            pass
+
+    def go(self, start_fen, moves, limits):
+        # (best move text, nodes, nps) for the position after `moves`
+        self.send(f"position fen {start_fen}" + (" moves " + " ".join(moves) if moves else ""))
+        self.send("go " + " ".join(f"{name} {value}" for name, value in limits.items()))
+        stats = {'nodes': 0, 'nps': 0} # From the last info line that has them
+        for line in self.lines_until('bestmove'):
+            words = line.split()
+            if words[0] == 'bestmove':
+                return words[1], stats['nodes'], stats['nps']
+            for name in stats:
+                if name in words[:-1]:
+                    stats[name] = int(words[words.index(name) + 1])
+
+    def close(self):
+        try:
+            self.send('quit')
+            self.process.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+def parse_tc(text):
+    # '10+0.1' -> (10.0, 0.1) seconds; '40/60+1' is read as 60+1
+    base, _, increment = text.split('/')[-1].partition('+')
+    return float(base), float(increment or 0)
+
+
+def load_openings(path, plies):
+    # Start FENs: the position after `plies` half-moves of each game in a PGN
+    # file, or one FEN / EPD per line of any other file
+    if path is None:
+        fens = []
+        for line in DEFAULT_OPENINGS:
+            position = Position.starting_position()
+            for text in line.split():
+                position.make_move(position.parse_move(text))
+            fens.append(position.fen())
+        return fens
+    if path.lower().endswith('.pgn'):
+        fens = []
+        for game in open_games(path):
+            position = None
+            try:
+                for ply, (position, _) in enumerate(game.replay()):
+                    if ply == plies:
+                        break
+            except ValueError:
+                continue
+            if position is not None:
+                fens.append(position.fen())
+        return fens
+    fens = []
+    with open(path) as stream:
+        for line in stream:
+            fields = line.split()
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                fens.append(' '.join(fields[:6]))
+            elif len(fields) >= 4:
+                fens.append(' '.join(fields[:4] + ['0', '1'])) # EPD: no move counters, maybe opcodes
+    return fens
+
+
+class MatchStats:
+    # Results from engine 1's point of view
+    def __init__(self):
+        self.wins = self.losses = self.draws = 0
+
+    @property
+    def games(self):
+        return self.wins + self.losses + self.draws
+
+    def add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def mean_and_variance(self):
+        n = self.games
+        mean = (self.wins + 0.5 * self.draws) / n
+        variance = (self.wins * (1 - mean) ** 2 + self.losses * mean ** 2 + self.draws * (0.5 - mean) ** 2) / n
+        return mean, variance
+
+    def elo(self):
+        # (Elo difference, 95% margin); infinite while one side has every point
+        if not self.games:
+            return 0.0, math.inf
+        mean, variance = self.mean_and_variance()
+        if variance == 0:
+            return score_to_elo(mean), math.inf
+        error = Z_95 * math.sqrt(variance / self.games)
+        low, high = score_to_elo(mean - error), score_to_elo(mean + error)
+        return score_to_elo(mean), (high - low) / 2
+
+    def llr(self, elo0, elo1):
+        # Log-likelihood ratio of H1 (elo1) against H0 (elo0), normal approximation
+        if not self.games:
+            return 0.0
+        mean, variance = self.mean_and_variance()
+        if variance == 0:
+            return 0.0
+        s0, s1 = elo_to_score(elo0), elo_to_score(elo1)
+        return self.games * (s1 - s0) * (2 * mean - s0 - s1) / (2 * variance)
+
+
+def score_to_elo(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_to_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def sprt_bounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+_engines = None # (engine 1, engine 2) of this pool worker
+
+
+def _close_engines():
+    for engine in _engines:
+        engine.close()
+
+
+def _worker_init(commands):
+    global _engines
+    _engines = tuple(UCIClient(command) for command in commands)
+    if _engines[0].name == _engines[1].name:
+        for number, engine in enumerate(_engines, 1):
+            engine.name += f" ({number})" # Tell them apart in the PGN
+    atexit.register(_close_engines)
+
+
+def play_game(job):
+    # job: (game number, start FEN, engine 1 plays White, tc, depth, movetime,
+    # max plies); returns a dict describing the game, with `score` the points
+    # engine 1 took from it
+    number, start_fen, engine1_white, tc, depth, movetime, max_plies = job
+    players = _engines if engine1_white else _engines[::-1]
+    for engine in players:
+        engine.new_game()
+    position = Position.from_fen(start_fen)
+    first = 0 if position.turn == 'white' else 1 # Index into players of the side to move first
+    clock = ChessClock(*tc) if tc else None
+    moves, sans = [], []
+    nodes, nps = [0, 0], [[], []] # Per engine
+    result, termination = '1/2-1/2', "Max plies"
+    for ply in range(max_plies):
+        side = (first + ply) % 2 # 0 = White
+        engine = players[side]
+        limits = {}
+        if depth:
+            limits['depth'] = depth
+        if movetime:
+            limits['movetime'] = int(movetime * 1000)
+        if clock is not None:
+            limits.update(wtime=int(clock.time_left('white') * 1000), btime=int(clock.time_left('black') * 1000),
+                          winc=int(tc[1] * 1000), binc=int(tc[1] * 1000))
+            clock.start(position.turn) # Only the engine's own thinking is charged, not the referee's work
+        text, move_nodes, move_nps = engine.go(start_fen, moves, limits)
+        owner = side if engine1_white else 1 - side # Engine 1 or 2
+        nodes[owner] += move_nodes
+        if move_nps:
+            nps[owner].append(move_nps)
+        if clock is not None:
+            clock.press()
+            clock.stop() # Paused until the next engine is asked for its move
+            if clock.flagged:
+                if not position.has_mating_material('black' if side == 0 else 'white'):
+                    termination = "Time forfeit vs insufficient material" # Stays a draw
+                else:
+                    result, termination = ('0-1', "Time forfeit") if side == 0 else ('1-0', "Time forfeit")
+                break
+        move = position.parse_move(text)
+        if move is None:
+            result, termination = ('0-1', "Illegal move") if side == 0 else ('1-0', "Illegal move")
+            break
+        sans.append(move_san(position, move))
+        moves.append(text)
+        position.make_move(move)
+        if position.check_game_over():
+            if position.winner:
+                result = '1-0' if position.winner == 'white' else '0-1'
+            termination = position.end_condition
+            break
+    white_score = {'1-0': 1, '0-1': 0}.get(result, 0.5)
+    return {
+        'number': number, 'start_fen': start_fen, 'engine1_white': engine1_white,
+        'white': players[0].name, 'black': players[1].name, 'result': result, 'termination': termination,
+        'sans': sans, 'score': white_score if engine1_white else 1 - white_score,
+        'nodes': nodes, 'nps': [sum(v) / len(v) if v else 0 for v in nps],
+    }
+
+
+def run_match(engine_commands, openings, games, workers=2, tc=None, depth=None, movetime=None,
+              max_plies=400, sprt=None, pgn_path=None, log=print):
+    # Plays up to `games` games; sprt is None or (elo0, elo1, alpha, beta)
+    jobs = [(number, openings[number // 2 % len(openings)], number % 2 == 0, tc, depth, movetime, max_plies)
+            for number in range(games)]
+    stats = MatchStats()
+    speed = [[], []]
+    bounds = sprt_bounds(*sprt[2:]) if sprt else None
+    decision = None
+    context = multiprocessing.get_context('spawn')
+    pgn = open(pgn_path, 'a', encoding='utf-8') if pgn_path else None
+    start = time.monotonic()
+    pool = context.Pool(workers, initializer=_worker_init, initargs=(engine_commands,))
+    try:
+        for game in pool.imap_unordered(play_game, jobs):
+            stats.add(game['score'])
+            for owner in (0, 1):
+                if game['nps'][owner]:
+                    speed[owner].append(game['nps'][owner])
+            if pgn is not None:
+                write_game(pgn, {'Event': "Engine match", 'Round': game['number'] + 1,
+                                 'White': game['white'], 'Black': game['black'],
+                                 'Termination': game['termination']},
+                           game['sans'], game['result'], game['start_fen'])
+                pgn.flush()
+            elo, margin = stats.elo()
+            line = (f"game {stats.games}/{games}: {game['result']} ({game['termination']})  "
+                    f"+{stats.wins} -{stats.losses} ={stats.draws}  elo {elo:+.1f} +/- {margin:.1f}")
+            if sprt:
+                llr = stats.llr(sprt[0], sprt[1])
+                line += f"  llr {llr:.2f} [{bounds[0]:.2f}, {bounds[1]:.2f}]"
+                if llr <= bounds[0]:
+                    decision = 'H0'
+                elif llr >= bounds[1]:
+                    decision = 'H1'
+            log(line)
+            if decision:
+                break
+    finally:
+        pool.terminate() # Engines exit when their stdin closes with the worker
+        pool.join()
+        if pgn is not None:
+            pgn.close()
+    elapsed = time.monotonic() - start
+    elo, margin = stats.elo()
+    log(f"{stats.games} games in {elapsed:.0f}s: +{stats.wins} -{stats.losses} ={stats.draws}, "
+        f"elo {elo:+.1f} +/- {margin:.1f}")
+    for owner in (0, 1):
+        if speed[owner]:
+            log(f"engine {owner + 1} averaged {sum(speed[owner]) / len(speed[owner]):.0f} nodes/sec")
+    if sprt:
+        verdict = {'H1': f"accepted H1: engine 1 is at least {sprt[1]} Elo stronger",
+                   'H0': f"accepted H0: engine 1 is not more than {sprt[0]} Elo stronger"}
+        log(f"SPRT: {verdict.get(decision, 'no decision')}")
+    return stats, decision
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play an engine-vs-engine match")
+    parser.add_argument('--engine1', default=DEFAULT_ENGINE, help="UCI command of the engine under test")
+    parser.add_argument('--engine2', default=DEFAULT_ENGINE, help="UCI command of the baseline")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="concurrent games (each runs two engines)")
+    parser.add_argument('--tc', help="time control in seconds, base+increment, e.g. 10+0.1")
+    parser.add_argument('--depth', type=int)
+    parser.add_argument('--movetime', type=float, help="seconds per move")
+    parser.add_argument('--max-plies', type=int, default=400, help="adjudicate a draw after this many plies")
+    parser.add_argument('--openings', help="PGN file, or a file with one FEN/EPD per line")
+    parser.add_argument('--opening-plies', type=int, default=8)
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'))
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--pgn', help="append finished games to this PGN file")
+    args = parser.parse_args()
+
+    tc = parse_tc(args.tc) if args.tc else None
+    if not (tc or args.depth or args.movetime):
+        tc = (10.0, 0.1)
+    openings = load_openings(args.openings, args.opening_plies)
+    if not openings:
+        parser.error("no openings found")
+    sprt = (args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+    run_match((args.engine1, args.engine2), openings, args.games, args.workers, tc, args.depth, args.movetime,
+              args.max_plies, sprt, args.pgn)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# Virtualized move list for ChessGame's side panel.
+#
+# One row per full move ('12.  Nf3  Nc6'). Only the rows that fit in the
+# canvas exist as canvas items: a fixed pool of text items is created once
+# and scrolling just gives them the texts of other rows, skipping items whose
+# text has not changed. Drawing cost therefore depends on the height of the
+# widget, not on the length of the game. The scrollbar talks to yview() the
+# way it would to a Listbox. Clicking a move calls on_select with the number
+# of plies up to and including it.
+#
+#   python move_list.py [plies]   # append and scroll timing for a long game, needs a display
+
+import sys
+import time
+import tkinter as tk
+
+ROW_HEIGHT = 20
+NUMBER_WIDTH = 44 # Pixels for the move number column; the two move columns share the rest
+
+
+class MoveListView:
+    def __init__(self, parent, width, height, font, bg, fg, highlight, on_select=None):
+        self.frame = tk.Frame(parent, bg=bg)
+        self.canvas = tk.Canvas(self.frame, width=width, height=height, bg=bg, highlightthickness=0)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.canvas.pack(side=tk.LEFT)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.on_select = on_select
+        self.sans = []
+        self.black_first = False
+        self.first_move_number = 1
+        self.first_row = 0 # Row shown at the top
+        self.current = 0 # Plies played up to the highlighted move; 0 highlights nothing
+        self.visible_rows = max(height // ROW_HEIGHT, 1)
+        self.move_width = (width - NUMBER_WIDTH) // 2
+
+        self.highlight_item = self.canvas.create_rectangle(0, 0, 0, 0, fill=highlight, outline='', state='hidden')
+        self.slots = [] # Per visible row: [number item, white item, black item]
+        self.slot_texts = [] # Text each item shows, so unchanged items are not touched
+        for slot in range(self.visible_rows):
+            y = slot * ROW_HEIGHT + ROW_HEIGHT // 2
+            items = [self.canvas.create_text(4, y, anchor='w', font=font, fill=fg)]
+            for column in range(2):
+                x = NUMBER_WIDTH + column * self.move_width + 4
+                items.append(self.canvas.create_text(x, y, anchor='w', font=font, fill=fg))
+            self.slots.append(items)
+            self.slot_texts.append(['', '', ''])
+
+        self.canvas.bind("<Button-1>", self._click)
+        self.canvas.bind("<MouseWheel>", lambda event: self.yview('scroll', -1 if event.delta > 0 else 1, 'units'))
+        self.canvas.bind("<Button-4>", lambda event: self.yview('scroll', -1, 'units')) # X11 wheel
+        self.canvas.bind("<Button-5>", lambda event: self.yview('scroll', 1, 'units'))
+
+    def set_moves(self, sans, black_first=False, first_move_number=1):
+        # Shows the list `sans`; the caller appends to it and calls moves_changed
+        self.sans = sans
+        self.black_first = black_first
+        self.first_move_number = first_move_number
+        self.first_row = 0
+        self.current = 0
+        self.render()
+
+    def rows(self):
+        return (len(self.sans) + self.black_first + 1) // 2
+
+    def _cell(self, ply):
+        # (row, column) of move `ply` (0-based), column 0 for White
+        return divmod(ply + self.black_first, 2)
+
+    def moves_changed(self):
+        # A move was added or taken back: follow the end of the game
+        self.current = len(self.sans)
+        self._scroll_to_current()
+        self.render()
+
+    def set_current(self, plies):
+        self.current = plies
+        self._scroll_to_current()
+        self.render()
+
+    def _scroll_to_current(self):
+        if not self.current:
+            return
+        row = self._cell(self.current - 1)[0]
+        if row < self.first_row:
+            self.first_row = row
+        elif row >= self.first_row + self.visible_rows:
+            self.first_row = row - self.visible_rows + 1
+
+    def yview(self, *args):
+        # Scrollbar protocol: ('moveto', fraction) or ('scroll', count, 'units' | 'pages')
+        rows = self.rows()
+        if args[0] == 'moveto':
+            first = round(float(args[1]) * rows)
+        elif args[0] == 'scroll':
+            step = self.visible_rows if args[2] == 'pages' else 1
+            first = self.first_row + int(args[1]) * step
+        else:
+            return
+        first = max(0, min(first, rows - self.visible_rows))
+        if first != self.first_row:
+            self.first_row = first
+            self.render()
+
+    def render(self):
+        sans, canvas = self.sans, self.canvas
+        for slot, items in enumerate(self.slots):
+            row = self.first_row + slot
+            texts = ['', '', '']
+            if row < self.rows():
+                texts[0] = f"{self.first_move_number + row}."
+                for column in range(2):
+                    ply = row * 2 + column - self.black_first
+                    if 0 <= ply < len(sans):
+                        texts[column + 1] = sans[ply]
+                    elif ply == -1:
+                        texts[column + 1] = '...'
+            shown = self.slot_texts[slot]
+            for i in range(3):
+                if shown[i] != texts[i]:
+                    canvas.itemconfigure(items[i], text=texts[i])
+                    shown[i] = texts[i]
+
+        row, column = self._cell(self.current - 1) if self.current else (-1, 0)
+        slot = row - self.first_row
+        if 0 <= slot < self.visible_rows:
+            x = NUMBER_WIDTH + column * self.move_width
+            canvas.coords(self.highlight_item, x, slot * ROW_HEIGHT + 1,
+                          x + self.move_width, (slot + 1) * ROW_HEIGHT - 1)
+            canvas.itemconfigure(self.highlight_item, state='normal')
+        else:
+            canvas.itemconfigure(self.highlight_item, state='hidden')
+
+        rows = self.rows()
+        if rows > self.visible_rows:
+            self.scrollbar.set(self.first_row / rows, (self.first_row + self.visible_rows) / rows)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _click(self, event):
+        row = self.first_row + event.y // ROW_HEIGHT
+        if event.x < NUMBER_WIDTH or self.on_select is None:
+            return
+        column = min((event.x - NUMBER_WIDTH) // self.move_width, 1)
+        ply = row * 2 + column - self.black_first
+        if 0 <= ply < len(self.sans):
+            self.on_select(ply + 1)
+
+
+def main():
+    # Appends every move of a long game (as play does) and then scrolls
+    # through all of it, timing both with the Tk redraw included
+    plies = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    root = tk.Tk()
+    view = MoveListView(root, 180, 200, ("Courier", 11), "#4A4A4A", "white", "#806000")
+    view.frame.pack()
+    sans = []
+    view.set_moves(sans)
+    start = time.perf_counter()
+    for ply in range(plies):
+        sans.append(f"Nf{ply % 8 + 1}")
+        view.moves_changed()
+        root.update_idletasks()
+    append_time = (time.perf_counter() - start) / plies
+    start = time.perf_counter()
+    for first in range(view.rows()):
+        view.yview('moveto', first / view.rows())
+        root.update_idletasks()
+    scroll_time = (time.perf_counter() - start) / max(view.rows(), 1)
+    root.destroy()
+    print(f"{plies} plies: append {append_time * 1e3:.3f} ms/move, scroll {scroll_time * 1e3:.3f} ms/row")
+
+
+if __name__ == "__main__":
+    main()
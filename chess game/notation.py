@@ -0,0 +1,105 @@
+# Standard Algebraic Notation (SAN) for Position moves, as used in PGN files:
+# 'e4', 'Nbd2', 'exd5', 'e8=Q+', 'O-O-O#'.
+
+import re
+
+from bitboard import SQUARE_COORDS
+from position import coords_name, coords_from_name
+
+SAN_LETTERS = {'knight': 'N', 'bishop': 'B', 'rook': 'R', 'queen': 'Q', 'king': 'K'}
+SAN_PIECES = {letter: piece for piece, letter in SAN_LETTERS.items()}
+
+_SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+class SANError(ValueError):
+    pass
+
+
+def move_san(position, move, legal_moves=None):
+    # SAN of a legal move in `position`, with its check or mate suffix
+    start, end, promotion = move
+    piece = position.piece_at(start)[1]
+    if legal_moves is None:
+        legal_moves = position.legal_moves()
+
+    if piece == 'king' and abs(start[0] - end[0]) == 2:
+        text = 'O-O' if end[0] < start[0] else 'O-O-O' # col 0 is the h-file
+    else:
+        capture = position.is_capture(move)
+        if piece == 'pawn':
+            text = coords_name(start)[0] + 'x' if capture else ''
+        else:
+            text = SAN_LETTERS[piece]
+            # Other pieces of the same kind that can reach the same square
+            rivals = [other[0] for other in legal_moves
+                      if other[1] == end and other[0] != start and
+                      position.piece_at(other[0])[1] == piece]
+            if rivals:
+                if all(rival[0] != start[0] for rival in rivals):
+                    text += coords_name(start)[0]
+                elif all(rival[1] != start[1] for rival in rivals):
+                    text += coords_name(start)[1]
+                else:
+                    text += coords_name(start)
+            if capture:
+                text += 'x'
+        text += coords_name(end)
+        if promotion:
+            text += '=' + SAN_LETTERS[promotion]
+
+    position.make_move(move)
+    if position.in_check():
+        text += '#' if not position.legal_moves() else '+'
+    position.unmake_move()
+    return text
+
+
+def parse_san(position, text):
+    # The legal move written as `text`; raises SANError if there is none or
+    # the text is ambiguous
+    san = text.rstrip('+#!?')
+    legal_moves = position.legal_moves()
+    if san in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        king = SQUARE_COORDS[position.king_square(position.turn)]
+        for move in legal_moves:
+            if move[0] == king and abs(move[0][0] - move[1][0]) == 2 and \
+                    (move[1][0] < king[0]) == (len(san) == 3):
+                return move
+        raise SANError(f"Illegal castling {text!r}")
+
+    match = _SAN_RE.match(san)
+    if match is None:
+        raise SANError(f"Unreadable move {text!r}")
+    letter, from_file, from_rank, target, promotion_letter = match.groups()
+    piece = SAN_PIECES[letter] if letter else 'pawn'
+    end = coords_from_name(target)
+    promotion = SAN_PIECES[promotion_letter] if promotion_letter else None
+
+    found = None
+    for move in legal_moves:
+        start = move[0]
+        if move[1] != end or move[2] != promotion:
+            continue
+        if position.piece_at(start)[1] != piece:
+            continue
+        name = coords_name(start)
+        if (from_file and name[0] != from_file) or (from_rank and name[1] != from_rank):
+            continue
+        if found is not None:
+            raise SANError(f"Ambiguous move {text!r}")
+        found = move
+    if found is None:
+        raise SANError(f"Illegal move {text!r}")
+    return found
+
+
+def moves_to_san(position, moves):
+    # SAN for a sequence of moves played from `position`, which is left as it was
+    sans = []
+    for move in moves:
+        sans.append(move_san(position, move))
+        position.make_move(move)
+    for _ in moves:
+        position.unmake_move()
+    return sans
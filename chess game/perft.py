@@ -0,0 +1,118 @@
+# Perft: counts the leaf nodes of the move tree to a fixed depth, to check the
+# move generator against published node counts and to time it.
+#
+#   python perft.py 4                       # start position, depth 4
+#   python perft.py 3 --fen "<fen>" --divide
+#   python perft.py --suite [--max-nodes N] # standard positions against reference counts
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource # Peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+from position import Position, START_FEN, move_text
+
+# Standard perft positions with their published node counts per depth
+REFERENCE_POSITIONS = [
+    ("Start position", START_FEN, [20, 400, 8902, 197281, 4865609]),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("Position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("Position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("Position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("Position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(position, depth):
+    if depth == 0:
+        return 1
+    moves = position.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def divide(position, depth):
+    # Node count below each root move, for bisecting a mismatch against another engine
+    counts = []
+    for move in position.legal_moves():
+        position.make_move(move)
+        counts.append((move_text(move), perft(position, depth - 1)))
+        position.unmake_move()
+    return counts
+
+
+def peak_memory_mb():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kB on Linux
+    return None
+
+
+def report(nodes, elapsed):
+    memory = peak_memory_mb()
+    memory_text = f"{memory:.1f} MB" if memory is not None else "n/a"
+    return f"{nodes} nodes in {elapsed:.2f}s ({int(nodes / max(elapsed, 1e-9))} nodes/sec, peak memory {memory_text})"
+
+
+def run_suite(max_nodes):
+    failures = 0
+    for name, fen, counts in REFERENCE_POSITIONS:
+        position = Position.from_fen(fen)
+        for depth, expected in enumerate(counts, start=1):
+            if expected > max_nodes:
+                break
+            start = time.perf_counter()
+            nodes = perft(position, depth)
+            elapsed = time.perf_counter() - start
+            status = "ok" if nodes == expected else f"MISMATCH (expected {expected})"
+            failures += nodes != expected
+            print(f"{name:<15} depth {depth}: {status:<28} {report(nodes, elapsed)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft move generator test and benchmark")
+    parser.add_argument("depth", type=int, nargs="?", default=3)
+    parser.add_argument("--fen", default=START_FEN, help="position to count from")
+    parser.add_argument("--divide", action="store_true", help="print the count below each root move")
+    parser.add_argument("--suite", action="store_true", help="check the standard positions")
+    parser.add_argument("--max-nodes", type=int, default=200000,
+                        help="with --suite, skip depths whose reference count is larger")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="measure peak Python heap with tracemalloc (slow)")
+    args = parser.parse_args()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    if args.suite:
+        sys.exit(1 if run_suite(args.max_nodes) else 0)
+
+    position = Position.from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(position, args.depth)
+        for text, nodes in counts:
+            print(f"{text}: {nodes}")
+        nodes = sum(nodes for _, nodes in counts)
+    else:
+        nodes = perft(position, args.depth)
+    print(f"perft {args.depth}: " + report(nodes, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
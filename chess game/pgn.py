@@ -0,0 +1,166 @@
+# PGN reading and writing.
+#
+# read_games() is a generator over a text stream: it holds one game at a time,
+# so archives of any size are read with constant memory. Comments, variations
+# and NAGs are skipped; the main line is kept as SAN text and only turned into
+# moves by replay(), so callers that just filter on headers do not pay for
+# move parsing.
+#
+#   python pgn.py games.pgn    # replays every game and reports games/sec
+
+import re
+import sys
+import time
+
+from notation import parse_san
+from position import Position, START_FEN
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+SEVEN_TAG_ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+_TAG_RE = re.compile(r'^\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_TOKEN_RE = re.compile(r'\{[^}]*\}?|;.*|\(|\)|\$\d+|[^\s{}();]+')
+_MOVE_NUMBER_RE = re.compile(r'^\d+\.+')
+
+
+class PGNGame:
+    def __init__(self, headers=None, moves=None, result='*'):
+        self.headers = headers if headers is not None else {} # Tag name -> value, in file order
+        self.moves = moves if moves is not None else [] # Main line in SAN
+        self.result = result
+
+    def start_fen(self):
+        return self.headers.get('FEN', START_FEN)
+
+    def replay(self):
+        # Yields (position, move) before each move is played; the position
+        # is reused, so copy anything that has to outlive the iteration
+        position = Position.from_fen(self.start_fen())
+        for san in self.moves:
+            move = parse_san(position, san)
+            yield position, move
+            position.make_move(move)
+
+
+def read_games(stream):
+    headers, moves = {}, []
+    in_movetext = False
+    depth = 0 # Variation nesting
+    open_comment = False
+    for line in stream:
+        if open_comment:
+            # Continuation of a {comment} from an earlier line
+            if '}' not in line:
+                continue
+            line = line[line.index('}') + 1:]
+            open_comment = False
+        stripped = line.strip()
+        if not stripped or stripped.startswith('%'):
+            continue
+        if stripped.startswith('[') and depth == 0:
+            if in_movetext:
+                # A header without a result token ends the previous game
+                yield PGNGame(headers, moves, headers.get('Result', '*'))
+                headers, moves, in_movetext = {}, [], False
+            match = _TAG_RE.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            continue
+
+        in_movetext = True
+        for token in _TOKEN_RE.findall(stripped):
+            if token[0] == '{':
+                open_comment = not token.endswith('}')
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth = max(depth - 1, 0)
+            elif depth or token[0] in ';$':
+                continue
+            elif token in RESULTS:
+                yield PGNGame(headers, moves, token)
+                headers, moves, in_movetext = {}, [], False
+            else:
+                move = _MOVE_NUMBER_RE.sub('', token)
+                if move:
+                    moves.append(move)
+    if in_movetext or headers:
+        yield PGNGame(headers, moves, headers.get('Result', '*'))
+
+
+def open_games(path):
+    # Games from a PGN file on disk, read lazily
+    with open(path, encoding='utf-8', errors='replace') as stream:
+        yield from read_games(stream)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_game(headers, sans, result='*', start_fen=START_FEN, first_move_number=1, black_first=False):
+    # PGN text for a game given as SAN moves; movetext lines are kept under 80 columns
+    tags = dict(headers)
+    tags['Result'] = result
+    if start_fen != START_FEN:
+        tags['SetUp'] = '1'
+        tags['FEN'] = start_fen
+    lines = []
+    for name in SEVEN_TAG_ROSTER:
+        lines.append(f'[{name} "{_escape(tags.pop(name, "?"))}"]')
+    for name, value in tags.items():
+        lines.append(f'[{name} "{_escape(value)}"]')
+    lines.append('')
+
+    tokens = []
+    number = first_move_number
+    white_to_move = not black_first
+    if black_first and sans:
+        tokens.append(f"{number}...")
+    for san in sans:
+        if white_to_move:
+            tokens.append(f"{number}.")
+        tokens.append(san)
+        if not white_to_move:
+            number += 1
+        white_to_move = not white_to_move
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+
+def write_game(stream, headers, sans, result='*', start_fen=START_FEN):
+    position = Position.from_fen(start_fen)
+    stream.write(format_game(headers, sans, result, start_fen, position.fullmove_number,
+                             position.turn == 'black'))
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: python pgn.py games.pgn")
+        sys.exit(1)
+    games = moves = errors = 0
+    start = time.perf_counter()
+    for game in open_games(sys.argv[1]):
+        games += 1
+        try:
+            for _ in game.replay():
+                moves += 1
+        except ValueError as error:
+            errors += 1
+            print(f"game {games}: {error}")
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"{games} games, {moves} moves, {errors} errors in {elapsed:.2f}s "
+          f"({games / elapsed:.1f} games/sec, {moves / elapsed:.0f} moves/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,662 @@
+# Headless chess rules for the Tk game in game.py. Position owns the piece
+# lists, move generation, captures, promotion and game termination, so games
+# can be played and analysed without creating a Tk root or canvas.
+#
+# Locations are (col, row) tuples exactly as drawn by ChessGame; a move is a
+# (start, end, promotion) tuple where promotion is a piece name or None.
+# Castling is written as the king's two-square move.
+#
+# Options are kept per piece as a bitboard of pseudo-legal targets together
+# with the piece's "reach" bitboard (see BitboardPosition.reach). make_move
+# only regenerates the pieces whose reach contains a square the move changed
+# and pushes an undo record, so unmake_move puts back exactly those entries
+# instead of recomputing both sides. The Zobrist key in `key` is updated the
+# same way.
+#
+# `squares` is a 64-byte mailbox (see EMPTY / piece codes below) and
+# `square_index` gives the list index of the piece on each square, so "what is
+# on this square" is one array read instead of a scan of the location lists.
+# Both are kept in sync by make/unmake; packed() stores a position in 72 bytes.
+#
+# legal_moves filters the cached targets in one pass: a check mask (the
+# squares that capture or block a single checker) and a pin ray per pinned
+# piece, so no move has to be made and tested for leaving the king in check.
+#
+# `key_history` counts how often each Zobrist key has been reached since the
+# position was set up; make/unmake adjust one entry, so a repetition check
+# is a dict lookup instead of a comparison against earlier boards.
+
+from array import array
+
+from bitboard import (BitboardPosition, COLORS, PIECE_TYPES, WHITE, PAWN, KNIGHT, ROOK, BISHOP, QUEEN, KING, PIECE_NAMES,
+                      FULL, PAWN_ATTACKS, BETWEEN, ROOK_RAYS, BISHOP_RAYS, SQUARE_COORDS, COORDS_SQUARE,
+                      square_of, iter_bits, lsb)
+from evaluation import PSQT_MG, PSQT_EG, PHASE_WEIGHTS, psqt_totals
+from zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EP_KEYS, compute_key, compute_pawn_key
+
+START_PIECES = ['rook', 'knight', 'bishop', 'king', 'queen', 'bishop', 'knight', 'rook',
+                'pawn', 'pawn', 'pawn', 'pawn', 'pawn', 'pawn', 'pawn', 'pawn']
+WHITE_START = [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0), (5, 0), (6, 0), (7, 0),
+               (0, 1), (1, 1), (2, 1), (3, 1), (4, 1), (5, 1), (6, 1), (7, 1)]
+BLACK_START = [(0, 7), (1, 7), (2, 7), (3, 7), (4, 7), (5, 7), (6, 7), (7, 7),
+               (0, 6), (1, 6), (2, 6), (3, 6), (4, 6), (5, 6), (6, 6), (7, 6)]
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_PIECES = {'p': 'pawn', 'n': 'knight', 'b': 'bishop', 'r': 'rook', 'q': 'queen', 'k': 'king'}
+FEN_LETTERS = 'pnbrqk' # Indexed by bitboard piece type
+PROMOTIONS = ('queen', 'rook', 'bishop', 'knight')
+
+# Mailbox codes: piece type + 1 for White, negated for Black
+EMPTY = 0
+PACKED_SIZE = 72
+DARK_SQUARES = 0xAA55AA55AA55AA55 # a1 is dark
+FIFTY_MOVE_PLIES = 100
+
+# Castling rights bits, in FEN order
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CASTLING_LETTERS = 'KQkq'
+
+# (right, king from, king to, rook from, rook to, squares that must be empty,
+#  squares the king passes that must not be attacked) per side to move
+CASTLING_MOVES = (
+    ((WHITE_KINGSIDE, 4, 6, 7, 5, 0x60, 0x60),
+     (WHITE_QUEENSIDE, 4, 2, 0, 3, 0x0E, 0x0C)),
+    ((BLACK_KINGSIDE, 60, 62, 63, 61, 0x60 << 56, 0x60 << 56),
+     (BLACK_QUEENSIDE, 60, 58, 56, 59, 0x0E << 56, 0x0C << 56)),
+)
+
+# Rights that survive a move from or to each square
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[4] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[7] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASK[0] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASK[60] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_MASK[63] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASK[56] = 15 & ~BLACK_QUEENSIDE
+
+
+def opponent(color):
+    return 'black' if color == 'white' else 'white'
+
+
+def coords_name(coords):
+    # (col, row) -> algebraic square name such as 'e4'
+    return 'abcdefgh'[7 - coords[0]] + str(coords[1] + 1)
+
+
+def coords_from_name(name):
+    return (7 - 'abcdefgh'.index(name[0]), int(name[1]) - 1)
+
+
+def move_text(move):
+    # Coordinate notation as used by UCI, e.g. 'e2e4' or 'e7e8q'
+    start, end, promotion = move
+    suffix = 'n' if promotion == 'knight' else promotion[0] if promotion else ''
+    return coords_name(start) + coords_name(end) + suffix
+
+
+class Position:
+    def __init__(self):
+        self.white_pieces = []
+        self.white_locations = []
+        self.black_pieces = []
+        self.black_locations = []
+        self.captured_pieces_white = [] # Names of pieces captured by white
+        self.captured_pieces_black = [] # Names of pieces captured by black
+        self.turn = 'white'
+        self.castling = 0 # Castling rights bits
+        self.ep_square = None # Square a pawn can capture en passant onto
+        self.halfmove_clock = 0 # Moves since the last capture or pawn move
+        self.fullmove_number = 1
+        self.winner = '' # 'white' or 'black'
+        self.game_over = False
+        self.end_condition = "Ongoing"
+        self.white_options = [] # Pseudo-legal target bitboard per piece
+        self.black_options = []
+        self.white_reach = [] # Reach bitboard per piece, parallel to white_options
+        self.black_reach = []
+        self.board = BitboardPosition()
+        self.squares = array('b', bytes(64)) # Mailbox piece code per square
+        self.square_index = array('b', [-1] * 64) # Index into the owner's piece lists
+        self.key = 0 # Zobrist key of the position
+        self.pawn_key = 0 # Zobrist key of the pawns only
+        self.key_history = {} # Times each key has been reached
+        self.psqt_mg = 0 # Material + piece-square score, White minus Black (see evaluation.py)
+        self.psqt_eg = 0
+        self.phase = 0 # Non-pawn material weight, for tapering between the two
+        self.undo_stack = []
+
+    @classmethod
+    def starting_position(cls):
+        position = cls()
+        position.setup_start()
+        return position
+
+    @classmethod
+    def from_fen(cls, fen):
+        position = cls()
+        position.set_fen(fen)
+        return position
+
+    def setup_start(self):
+        self._setup(list(START_PIECES), list(WHITE_START), list(START_PIECES), list(BLACK_START), 'white', 15)
+
+    def set_fen(self, fen):
+        # Raises ValueError for text that is not a usable FEN; missing
+        # trailing fields take their start-position defaults
+        fields = fen.split()
+        ranks = fields[0].split('/') if fields else []
+        if len(ranks) != 8:
+            raise ValueError(f"FEN needs 8 ranks: {fen!r}")
+        white_pieces, white_locations, black_pieces, black_locations = [], [], [], []
+        for rank_index, rank_text in enumerate(ranks):
+            row, file = 7 - rank_index, 0
+            for char in rank_text:
+                if char.isdigit():
+                    file += int(char)
+                    continue
+                if char.lower() not in FEN_PIECES or file > 7:
+                    raise ValueError(f"Bad rank {rank_text!r} in FEN: {fen!r}")
+                if char.isupper():
+                    white_pieces.append(FEN_PIECES[char.lower()])
+                    white_locations.append((7 - file, row))
+                else:
+                    black_pieces.append(FEN_PIECES[char])
+                    black_locations.append((7 - file, row))
+                file += 1
+            if file != 8:
+                raise ValueError(f"Bad rank {rank_text!r} in FEN: {fen!r}")
+        if white_pieces.count('king') != 1 or black_pieces.count('king') != 1:
+            raise ValueError(f"FEN needs one king per side: {fen!r}")
+        turn = 'black' if len(fields) > 1 and fields[1] == 'b' else 'white'
+        castling = 0
+        if len(fields) > 2:
+            for char in fields[2]:
+                if char in CASTLING_LETTERS:
+                    castling |= 1 << CASTLING_LETTERS.index(char)
+        ep_square = None
+        if len(fields) > 3 and fields[3] != '-':
+            ep_square = square_of(*coords_from_name(fields[3]))
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Bad move counters in FEN: {fen!r}") from None
+        self._setup(white_pieces, white_locations, black_pieces, black_locations, turn, castling, ep_square,
+                    halfmove_clock, fullmove_number)
+
+    def fen(self):
+        rows = []
+        for row in range(7, -1, -1):
+            text, empty = '', 0
+            for file in range(8):
+                piece = self.board.piece_at(row * 8 + file)
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    text, empty = text + str(empty), 0
+                letter = FEN_LETTERS[piece[1]]
+                text += letter.upper() if piece[0] == WHITE else letter
+            rows.append(text + (str(empty) if empty else ''))
+        castling = ''.join(letter for bit, letter in enumerate(CASTLING_LETTERS) if self.castling >> bit & 1)
+        ep = coords_name(SQUARE_COORDS[self.ep_square]) if self.ep_square is not None else '-'
+        return (f"{'/'.join(rows)} {self.turn[0]} {castling or '-'} {ep} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
+
+    def _setup(self, white_pieces, white_locations, black_pieces, black_locations, turn,
+               castling=0, ep_square=None, halfmove_clock=0, fullmove_number=1):
+        self.white_pieces = white_pieces
+        self.white_locations = white_locations
+        self.black_pieces = black_pieces
+        self.black_locations = black_locations
+        self.captured_pieces_white = []
+        self.captured_pieces_black = []
+        self.turn = turn
+        self.castling = castling
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.winner = ''
+        self.game_over = False
+        self.end_condition = "Ongoing"
+        self.undo_stack = []
+        self.board = BitboardPosition.from_lists(self.white_pieces, self.white_locations,
+                                                 self.black_pieces, self.black_locations)
+        self.squares = array('b', bytes(64))
+        self.square_index = array('b', [-1] * 64)
+        for sign, pieces, locations in ((1, self.white_pieces, self.white_locations),
+                                        (-1, self.black_pieces, self.black_locations)):
+            for i, (piece, loc) in enumerate(zip(pieces, locations)):
+                square = COORDS_SQUARE[loc]
+                self.squares[square] = sign * (PIECE_TYPES[piece] + 1)
+                self.square_index[square] = i
+        us = COLORS[turn]
+        if ep_square is not None and not PAWN_ATTACKS[us ^ 1][ep_square] & self.board.pieces[us][PAWN]:
+            ep_square = None # Only kept when a capture is possible, so equal positions share a key
+        self.ep_square = ep_square
+        self.key = compute_key(self.board, self.turn, self.castling, self.ep_square)
+        self.pawn_key = compute_pawn_key(self.board)
+        self.key_history = {self.key: 1}
+        self.psqt_mg, self.psqt_eg, self.phase = psqt_totals(self.board)
+        self.update_options()
+
+    def piece_at(self, coords):
+        # (color, piece name) on a square, or None
+        code = self.squares[COORDS_SQUARE[coords]]
+        if code == EMPTY:
+            return None
+        return ('white', PIECE_NAMES[code - 1]) if code > 0 else ('black', PIECE_NAMES[-code - 1])
+
+    def index_at(self, coords, color=None):
+        # Index of the piece on a square in its colour's lists, or None if the
+        # square is empty (or holds a piece of the other colour)
+        square = COORDS_SQUARE[coords]
+        code = self.squares[square]
+        if code == EMPTY or (color == 'white' and code < 0) or (color == 'black' and code > 0):
+            return None
+        return self.square_index[square]
+
+    def packed(self):
+        # Mailbox, side to move, castling, en passant square and move counters
+        # as 72 bytes; enough to rebuild the position with from_packed
+        ep = self.ep_square + 1 if self.ep_square is not None else 0
+        return (self.squares.tobytes() +
+                bytes((self.turn == 'black', self.castling, ep, min(self.halfmove_clock, 255))) +
+                self.fullmove_number.to_bytes(4, 'little'))
+
+    @classmethod
+    def from_packed(cls, data):
+        white_pieces, white_locations, black_pieces, black_locations = [], [], [], []
+        for square, code in enumerate(array('b', data[:64])):
+            if code > 0:
+                white_pieces.append(PIECE_NAMES[code - 1])
+                white_locations.append(SQUARE_COORDS[square])
+            elif code < 0:
+                black_pieces.append(PIECE_NAMES[-code - 1])
+                black_locations.append(SQUARE_COORDS[square])
+        turn, castling, ep, halfmove_clock = data[64:68]
+        position = cls()
+        position._setup(white_pieces, white_locations, black_pieces, black_locations,
+                         'black' if turn else 'white', castling, ep - 1 if ep else None,
+                         halfmove_clock, int.from_bytes(data[68:72], 'little'))
+        return position
+
+    def pieces_and_locations(self, color):
+        if color == 'white':
+            return self.white_pieces, self.white_locations
+        return self.black_pieces, self.black_locations
+
+    def options_for(self, color):
+        return self.white_options if color == 'white' else self.black_options
+
+    def reach_for(self, color):
+        return self.white_reach if color == 'white' else self.black_reach
+
+    def piece_options(self, color, piece, location):
+        color_index, piece_type, square = COLORS[color], PIECE_TYPES[piece], COORDS_SQUARE[location]
+        return (self.board.targets(color_index, piece_type, square),
+                self.board.reach(color_index, piece_type, square))
+
+    def update_options(self):
+        # Full regeneration, only needed after the board is set up
+        for color in ('white', 'black'):
+            pieces, locations = self.pieces_and_locations(color)
+            generated = [self.piece_options(color, piece, loc) for piece, loc in zip(pieces, locations)]
+            options = [moves for moves, _ in generated]
+            reach = [bb for _, bb in generated]
+            if color == 'white':
+                self.white_options, self.white_reach = options, reach
+            else:
+                self.black_options, self.black_reach = options, reach
+
+    def king_square(self, color):
+        return lsb(self.board.pieces[COLORS[color]][KING])
+
+    def checkers(self):
+        # Enemy pieces giving check to the side to move
+        us = COLORS[self.turn]
+        king = lsb(self.board.pieces[us][KING])
+        if king < 0:
+            return 0
+        return self.board.attackers_to(king, us ^ 1, self.board.occupied)
+
+    def in_check(self):
+        return self.checkers() != 0
+
+    def pins(self, us, king):
+        # Pinned square -> the ray it may still move along (up to and
+        # including the pinning piece)
+        board = self.board
+        enemy = board.pieces[us ^ 1]
+        snipers = ((ROOK_RAYS[king] & (enemy[ROOK] | enemy[QUEEN])) |
+                   (BISHOP_RAYS[king] & (enemy[BISHOP] | enemy[QUEEN])))
+        pinned = {}
+        for sniper in iter_bits(snipers):
+            between = BETWEEN[king][sniper] & board.occupied
+            if between and not between & (between - 1) and between & board.colors[us]:
+                pinned[lsb(between)] = BETWEEN[king][sniper] | (1 << sniper)
+        return pinned
+
+    def legal_moves(self):
+        if self.game_over:
+            return []
+        board = self.board
+        us = COLORS[self.turn]
+        them = us ^ 1
+        occupied = board.occupied
+        pieces, locations = self.pieces_and_locations(self.turn)
+        options = self.options_for(self.turn)
+        last_row = 7 if us == WHITE else 0
+        king = lsb(board.pieces[us][KING])
+        moves = []
+        if king < 0:
+            checkers, pinned = 0, {}
+        else:
+            checkers = board.attackers_to(king, them, occupied)
+            pinned = self.pins(us, king)
+        if not checkers:
+            check_mask = FULL
+        elif checkers & (checkers - 1):
+            check_mask = 0 # Double check: only the king may move
+        else:
+            check_mask = BETWEEN[king][lsb(checkers)] | checkers
+
+        for piece, start, targets in zip(pieces, locations, options):
+            if piece == 'king':
+                # The king itself is removed so it cannot hide behind its own square
+                safe = ~board.attacks_by(them, occupied ^ (1 << king))
+                for end_sq in iter_bits(targets & safe):
+                    moves.append((start, SQUARE_COORDS[end_sq], None))
+                continue
+            if not check_mask:
+                continue
+            start_sq = COORDS_SQUARE[start]
+            targets &= check_mask & pinned.get(start_sq, FULL)
+            if piece == 'pawn':
+                for end_sq in iter_bits(targets):
+                    end = SQUARE_COORDS[end_sq]
+                    if end[1] == last_row:
+                        moves.extend((start, end, promotion) for promotion in PROMOTIONS)
+                    else:
+                        moves.append((start, end, None))
+                if self.ep_square is not None and PAWN_ATTACKS[us][start_sq] >> self.ep_square & 1:
+                    if self._ep_is_legal(us, king, start_sq):
+                        moves.append((start, SQUARE_COORDS[self.ep_square], None))
+            else:
+                for end_sq in iter_bits(targets):
+                    moves.append((start, SQUARE_COORDS[end_sq], None))
+
+        if self.castling and not checkers:
+            for right, king_from, king_to, rook_from, _, empty, safe in CASTLING_MOVES[us]:
+                if (self.castling & right and king == king_from and not occupied & empty and
+                        board.pieces[us][ROOK] >> rook_from & 1 and
+                        not board.attacks_by(them, occupied) & safe):
+                    moves.append((SQUARE_COORDS[king_from], SQUARE_COORDS[king_to], None))
+        return moves
+
+    def _ep_is_legal(self, us, king, start_sq):
+        # Pins and checks through the two vacated squares are rare enough to
+        # test directly with the occupancy after the capture
+        captured_sq = self.ep_square - 8 if us == WHITE else self.ep_square + 8
+        occupied = (self.board.occupied ^ (1 << start_sq) ^ (1 << captured_sq)) | (1 << self.ep_square)
+        attackers = self.board.attackers_to(king, us ^ 1, occupied) & ~(1 << captured_sq)
+        return not attackers
+
+    def legal_targets(self, start):
+        # Destination squares of the legal moves from `start`, for highlighting
+        targets = []
+        for move in self.legal_moves():
+            if move[0] == start and move[1] not in targets:
+                targets.append(move[1])
+        return targets
+
+    def repetitions(self):
+        # Times the current position has occurred, this occurrence included
+        return self.key_history.get(self.key, 0)
+
+    def insufficient_material(self):
+        # Neither side can mate: bare kings, a single minor piece, or only
+        # bishops that all stand on squares of one colour
+        pieces = self.board.pieces
+        for color in range(2):
+            if pieces[color][PAWN] | pieces[color][ROOK] | pieces[color][QUEEN]:
+                return False
+        knights = pieces[0][KNIGHT] | pieces[1][KNIGHT]
+        bishops = pieces[0][BISHOP] | pieces[1][BISHOP]
+        if (knights | bishops).bit_count() <= 1:
+            return True
+        return not knights and (not bishops & DARK_SQUARES or not bishops & ~DARK_SQUARES & FULL)
+
+    def has_mating_material(self, color):
+        # False for a bare king or a king and one minor piece, which is taken
+        # as unable to mate; decides whether running out of time loses
+        pieces = self.board.pieces[COLORS[color]]
+        if pieces[PAWN] | pieces[ROOK] | pieces[QUEEN]:
+            return True
+        return (pieces[KNIGHT] | pieces[BISHOP]).bit_count() > 1
+
+    def check_game_over(self):
+        # Checkmate, stalemate or a draw by rule for the side to move; make_move
+        # leaves this to the caller so the search does not pay for an extra
+        # generation per node. Repetition and the fifty-move rule are applied
+        # as soon as they occur rather than waiting for a claim, and a mate on
+        # the hundredth ply still counts.
+        if self.game_over:
+            return True
+        if not self.legal_moves():
+            if self.in_check():
+                self.winner = opponent(self.turn)
+                self.end_condition = "Checkmate"
+            else:
+                self.end_condition = "Stalemate"
+        elif self.insufficient_material():
+            self.end_condition = "Insufficient Material"
+        elif self.repetitions() >= 3:
+            self.end_condition = "Threefold Repetition"
+        elif self.halfmove_clock >= FIFTY_MOVE_PLIES:
+            self.end_condition = "Fifty-Move Rule"
+        else:
+            return False
+        self.game_over = True
+        return True
+
+    def move_for(self, start, end, promotion='queen'):
+        # The move a click from `start` to `end` stands for, or None if illegal
+        for move in self.legal_moves():
+            if move[0] == start and move[1] == end and move[2] in (None, promotion):
+                return move
+        return None
+
+    def is_promotion(self, start, end):
+        return any(move[2] for move in self.legal_moves() if move[0] == start and move[1] == end)
+
+    def parse_move(self, text):
+        # The legal move written in coordinate notation, or None
+        for move in self.legal_moves():
+            if move_text(move) == text or (len(text) == 4 and move_text(move)[:4] == text):
+                return move
+        return None
+
+    def is_capture(self, move):
+        end_sq = COORDS_SQUARE[move[1]]
+        us = COLORS[self.turn]
+        if self.board.colors[us ^ 1] >> end_sq & 1:
+            return True
+        return end_sq == self.ep_square and self.board.pieces[us][PAWN] >> COORDS_SQUARE[move[0]] & 1 == 1
+
+    def make_move(self, move):
+        start, end, promotion = move
+        color = self.turn
+        other = opponent(color)
+        pieces, locations = self.pieces_and_locations(color)
+        opponent_pieces, opponent_locations = self.pieces_and_locations(other)
+        start_sq, end_sq = COORDS_SQUARE[start], COORDS_SQUARE[end]
+        color_index, other_index = COLORS[color], COLORS[other]
+        old_key, old_castling, old_ep = self.key, self.castling, self.ep_square
+        old_pawn_key = self.pawn_key
+        old_clock = self.halfmove_clock
+        old_psqt = (self.psqt_mg, self.psqt_eg, self.phase)
+
+        squares, square_index = self.squares, self.square_index
+        index = square_index[start_sq]
+        moved_piece = pieces[index]
+        touched = (1 << start_sq) | (1 << end_sq)
+        captured_sq = end_sq
+        if moved_piece == 'pawn' and end_sq == self.ep_square:
+            captured_sq = end_sq - 8 if color_index == WHITE else end_sq + 8
+        captured = None
+        if self.board.colors[other_index] >> captured_sq & 1:
+            captured_idx = square_index[captured_sq]
+            captured = (captured_idx, opponent_pieces.pop(captured_idx), opponent_locations.pop(captured_idx),
+                        self.options_for(other).pop(captured_idx), self.reach_for(other).pop(captured_idx))
+            squares[captured_sq] = EMPTY
+            square_index[captured_sq] = -1
+            for loc in opponent_locations[captured_idx:]: # Later pieces moved down one slot
+                square_index[COORDS_SQUARE[loc]] -= 1
+            self.board.remove(other_index, PIECE_TYPES[captured[1]], captured_sq)
+            captured_type = PIECE_TYPES[captured[1]]
+            self.key ^= PIECE_KEYS[other_index][captured_type][captured_sq]
+            self.psqt_mg -= PSQT_MG[other_index][captured_type][captured_sq]
+            self.psqt_eg -= PSQT_EG[other_index][captured_type][captured_sq]
+            self.phase -= PHASE_WEIGHTS[captured_type]
+            if captured_type == PAWN:
+                self.pawn_key ^= PIECE_KEYS[other_index][PAWN][captured_sq]
+            touched |= 1 << captured_sq
+            if color == 'white':
+                self.captured_pieces_white.append(captured[1])
+            else:
+                self.captured_pieces_black.append(captured[1])
+
+        locations[index] = end
+        if promotion:
+            pieces[index] = promotion
+        placed_type = PIECE_TYPES[pieces[index]]
+        self.board.remove(color_index, PIECE_TYPES[moved_piece], start_sq)
+        self.board.put(color_index, placed_type, end_sq)
+        moved_type = PIECE_TYPES[moved_piece]
+        self.key ^= (PIECE_KEYS[color_index][moved_type][start_sq] ^
+                     PIECE_KEYS[color_index][placed_type][end_sq] ^ SIDE_KEY)
+        self.psqt_mg += PSQT_MG[color_index][placed_type][end_sq] - PSQT_MG[color_index][moved_type][start_sq]
+        self.psqt_eg += PSQT_EG[color_index][placed_type][end_sq] - PSQT_EG[color_index][moved_type][start_sq]
+        self.phase += PHASE_WEIGHTS[placed_type] - PHASE_WEIGHTS[moved_type]
+        if moved_type == PAWN:
+            self.pawn_key ^= PIECE_KEYS[color_index][PAWN][start_sq]
+            if placed_type == PAWN:
+                self.pawn_key ^= PIECE_KEYS[color_index][PAWN][end_sq]
+        squares[start_sq] = EMPTY
+        square_index[start_sq] = -1
+        squares[end_sq] = placed_type + 1 if color_index == WHITE else -placed_type - 1
+        square_index[end_sq] = index
+
+        moved_indices = [index]
+        rook = None
+        if moved_piece == 'king' and abs(end_sq - start_sq) == 2:
+            rook_from, rook_to = (start_sq + 3, start_sq + 1) if end_sq > start_sq else (start_sq - 4, start_sq - 1)
+            rook_index = square_index[rook_from]
+            locations[rook_index] = SQUARE_COORDS[rook_to]
+            squares[rook_to], squares[rook_from] = squares[rook_from], EMPTY
+            square_index[rook_to], square_index[rook_from] = rook_index, -1
+            self.board.remove(color_index, ROOK, rook_from)
+            self.board.put(color_index, ROOK, rook_to)
+            self.key ^= PIECE_KEYS[color_index][ROOK][rook_from] ^ PIECE_KEYS[color_index][ROOK][rook_to]
+            self.psqt_mg += PSQT_MG[color_index][ROOK][rook_to] - PSQT_MG[color_index][ROOK][rook_from]
+            self.psqt_eg += PSQT_EG[color_index][ROOK][rook_to] - PSQT_EG[color_index][ROOK][rook_from]
+            touched |= (1 << rook_from) | (1 << rook_to)
+            moved_indices.append(rook_index)
+            rook = (rook_index, SQUARE_COORDS[rook_from])
+
+        self.castling &= CASTLING_MASK[start_sq] & CASTLING_MASK[end_sq]
+        self.ep_square = None
+        if moved_piece == 'pawn' and abs(end_sq - start_sq) == 16:
+            ep_square = (start_sq + end_sq) // 2
+            if PAWN_ATTACKS[color_index][ep_square] & self.board.pieces[other_index][PAWN]:
+                self.ep_square = ep_square
+        self.key ^= CASTLING_KEYS[old_castling] ^ CASTLING_KEYS[self.castling]
+        if old_ep is not None:
+            self.key ^= EP_KEYS[old_ep & 7]
+        if self.ep_square is not None:
+            self.key ^= EP_KEYS[self.ep_square & 7]
+
+        self.halfmove_clock = 0 if moved_piece == 'pawn' or captured is not None else old_clock + 1
+        if color == 'black':
+            self.fullmove_number += 1
+
+        changed = self._refresh(touched, color, moved_indices)
+        self.undo_stack.append((start, index, moved_piece, captured, changed, rook, old_key, old_castling, old_ep,
+                                old_clock, old_psqt, old_pawn_key, self.winner, self.game_over, self.end_condition))
+        self.turn = other
+        key_history = self.key_history
+        key_history[self.key] = key_history.get(self.key, 0) + 1
+        return captured[1] if captured is not None else None
+
+    def unmake_move(self):
+        count = self.key_history[self.key] - 1
+        if count:
+            self.key_history[self.key] = count
+        else:
+            del self.key_history[self.key]
+        (start, index, moved_piece, captured, changed, rook, self.key, self.castling, self.ep_square,
+         self.halfmove_clock, (self.psqt_mg, self.psqt_eg, self.phase), self.pawn_key,
+         self.winner, self.game_over, self.end_condition) = self.undo_stack.pop()
+        color = self.turn = opponent(self.turn)
+        if color == 'black':
+            self.fullmove_number -= 1
+        other = opponent(color)
+        pieces, locations = self.pieces_and_locations(color)
+        squares, square_index = self.squares, self.square_index
+        start_sq, end_sq = COORDS_SQUARE[start], COORDS_SQUARE[locations[index]]
+
+        self.board.remove(COLORS[color], PIECE_TYPES[pieces[index]], end_sq)
+        self.board.put(COLORS[color], PIECE_TYPES[moved_piece], start_sq)
+        pieces[index] = moved_piece
+        locations[index] = start
+        squares[end_sq] = EMPTY
+        square_index[end_sq] = -1
+        squares[start_sq] = PIECE_TYPES[moved_piece] + 1 if color == 'white' else -PIECE_TYPES[moved_piece] - 1
+        square_index[start_sq] = index
+        if rook is not None:
+            rook_index, rook_start = rook
+            rook_sq, rook_start_sq = COORDS_SQUARE[locations[rook_index]], COORDS_SQUARE[rook_start]
+            self.board.remove(COLORS[color], ROOK, rook_sq)
+            self.board.put(COLORS[color], ROOK, rook_start_sq)
+            locations[rook_index] = rook_start
+            squares[rook_start_sq], squares[rook_sq] = squares[rook_sq], EMPTY
+            square_index[rook_start_sq], square_index[rook_sq] = rook_index, -1
+
+        # Changed entries are indexed after the capture, so restore them first
+        for changed_color, i, options, reach in reversed(changed):
+            self.options_for(changed_color)[i] = options
+            self.reach_for(changed_color)[i] = reach
+
+        if captured is not None:
+            captured_idx, captured_piece, captured_loc, options, reach = captured
+            opponent_pieces, opponent_locations = self.pieces_and_locations(other)
+            opponent_pieces.insert(captured_idx, captured_piece)
+            opponent_locations.insert(captured_idx, captured_loc)
+            self.options_for(other).insert(captured_idx, options)
+            self.reach_for(other).insert(captured_idx, reach)
+            captured_sq = COORDS_SQUARE[captured_loc]
+            self.board.put(COLORS[other], PIECE_TYPES[captured_piece], captured_sq)
+            squares[captured_sq] = PIECE_TYPES[captured_piece] + 1 if other == 'white' else -PIECE_TYPES[captured_piece] - 1
+            square_index[captured_sq] = captured_idx
+            for loc in opponent_locations[captured_idx + 1:]:
+                square_index[COORDS_SQUARE[loc]] += 1
+            if color == 'white':
+                self.captured_pieces_white.pop()
+            else:
+                self.captured_pieces_black.pop()
+
+    def _refresh(self, touched, mover, moved_indices):
+        # Regenerate the options of every piece whose reach covers a touched
+        # square, plus the pieces that moved, returning the old entries for
+        # the undo record
+        changed = []
+        for color in ('white', 'black'):
+            pieces, locations = self.pieces_and_locations(color)
+            options, reach = self.options_for(color), self.reach_for(color)
+            for i, bb in enumerate(reach):
+                if bb & touched or (color == mover and i in moved_indices):
+                    changed.append((color, i, options[i], bb))
+                    options[i], reach[i] = self.piece_options(color, pieces[i], locations[i])
+        return changed
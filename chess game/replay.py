@@ -0,0 +1,117 @@
+# Move record of a game with random access to the position after any ply,
+# for the move list and replay controls in game.py.
+#
+# GameHistory keeps the moves and their SAN, plus a keyframe (Position.packed()
+# and the captured-piece lists) every KEYFRAME_INTERVAL plies. Its viewing
+# position is separate from the game's own, so stepping through the record
+# never disturbs the game or the engine. seek() reaches a ply by the cheaper
+# of two routes: make/unmake moves from where the viewing position is now, or
+# rebuild the nearest keyframe at or before the target and play forward from
+# there. Either way a jump costs at most about KEYFRAME_INTERVAL moves, not a
+# replay from the start.
+#
+#   python replay.py [plies]   # random seeks in a random game vs replaying from the start
+
+import random
+import sys
+import time
+
+from position import Position
+
+KEYFRAME_INTERVAL = 16
+KEYFRAME_COST = 20 # Rebuilding a keyframe (from_packed), counted in make/unmake moves
+
+
+def _snapshot(position):
+    return (position.packed(), tuple(position.captured_pieces_white), tuple(position.captured_pieces_black))
+
+
+class GameHistory:
+    def __init__(self, start, interval=KEYFRAME_INTERVAL):
+        self.interval = interval
+        self.moves = []
+        self.sans = []
+        self.keyframes = [_snapshot(start)] # keyframes[i] is the position after ply i * interval
+        self.black_first = start.turn == 'black'
+        self.first_move_number = start.fullmove_number
+        self.position = None # Viewing position, at ply `ply`
+        self.ply = 0
+        self.base = 0 # Earliest ply the viewing position can unmake back to
+        self._load(0)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def push(self, move, san, position):
+        # Records a move already played; `position` is the game's position after it
+        self.moves.append(move)
+        self.sans.append(san)
+        if len(self.moves) % self.interval == 0:
+            self.keyframes.append(_snapshot(position))
+
+    def _load(self, index):
+        packed, captured_white, captured_black = self.keyframes[index]
+        self.position = Position.from_packed(packed)
+        self.position.captured_pieces_white = list(captured_white)
+        self.position.captured_pieces_black = list(captured_black)
+        self.ply = self.base = index * self.interval
+
+    def seek(self, ply):
+        # The viewing position after `ply` moves (clamped to the record)
+        ply = max(0, min(ply, len(self.moves)))
+        keyframe = ply // self.interval
+        stepping = abs(ply - self.ply) if ply >= self.base else None
+        if stepping is None or KEYFRAME_COST + ply - keyframe * self.interval < stepping:
+            self._load(keyframe)
+        position, moves = self.position, self.moves
+        while self.ply > ply:
+            position.unmake_move()
+            self.ply -= 1
+        while self.ply < ply:
+            position.make_move(moves[self.ply])
+            self.ply += 1
+        return position
+
+    def move_label(self, ply):
+        # '12.' before a White move and '12...' before a Black one, for the move `ply` (0-based)
+        index = ply + self.black_first
+        number = self.first_move_number + index // 2
+        return f"{number}." if index % 2 == 0 else f"{number}..."
+
+
+def main():
+    plies = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rng = random.Random(0)
+    game = Position.starting_position()
+    history = GameHistory(game)
+    fens = [game.fen()]
+    while len(history) < plies:
+        legal = game.legal_moves()
+        if not legal:
+            game = Position.starting_position() # Keep going from a fresh game; only the timing matters
+            history = GameHistory(game)
+            fens = [game.fen()]
+            continue
+        move = rng.choice(legal)
+        game.make_move(move)
+        history.push(move, '', game)
+        fens.append(game.fen())
+
+    targets = [rng.randrange(len(history) + 1) for _ in range(2000)]
+    start = time.perf_counter()
+    for ply in targets:
+        assert history.seek(ply).fen() == fens[ply]
+    seek_time = (time.perf_counter() - start) / len(targets)
+
+    start = time.perf_counter()
+    for ply in targets[:200]:
+        position = Position.starting_position()
+        for move in history.moves[:ply]:
+            position.make_move(move)
+    replay_time = (time.perf_counter() - start) / 200
+    print(f"{len(history)} plies: seek {seek_time * 1e3:.3f} ms, replay from the start {replay_time * 1e3:.3f} ms "
+          f"({replay_time / max(seek_time, 1e-9):.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
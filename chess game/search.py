@@ -0,0 +1,266 @@
+# Computer opponent for the chess game: negamax alpha-beta over Position with
+# iterative deepening inside a per-move time budget, quiescence search and
+# move ordering by MVV-LVA captures, killer moves and the history heuristic.
+# Results are shared between iterations and moves through a transposition table.
+# Repeated positions and positions past the fifty-move limit score as draws.
+# With tablebases, positions of up to MAX_PIECES pieces are scored exactly
+# instead of searched, and such a root position is answered without a search.
+#
+#   python search.py [seconds]    # searches the start position and prints nodes/sec
+
+import sys
+import time
+
+from bitboard import COORDS_SQUARE
+from evaluation import evaluate, PAWN_TABLE
+from position import Position, FIFTY_MOVE_PLIES
+from tablebase import MAX_PIECES
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_PLY = 64
+MATE_BOUND = MATE_SCORE - 256 # Scores beyond this are mates, tablebase mates can be longer than MAX_PLY
+CHECK_EVERY = 1024 # Nodes between clock checks
+TT_SIZE_MB = 16
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchResult:
+    def __init__(self, best_move=None, score=0, depth=0, nodes=0, elapsed=0.0, pv=None):
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.pv = pv or []
+
+    @property
+    def nps(self):
+        return int(self.nodes / self.elapsed) if self.elapsed > 0 else 0
+
+
+def score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def tablebase_score(value, ply):
+    # Search score of a tablebase value found `ply` plies from the root
+    if value > 0:
+        return MATE_SCORE - ply - value
+    if value < 0:
+        return -MATE_SCORE + ply - value - 1
+    return 0
+
+
+class Searcher:
+    def __init__(self, tt=None, tablebases=None):
+        self.tt = tt if tt is not None else TranspositionTable(TT_SIZE_MB)
+        self.tablebases = tablebases
+        self.tablebase_hits = 0
+        self.nodes = 0
+        self.deadline = None
+        self.stop_flag = None # Anything with is_set(); checked with the clock to cancel a search
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {} # (start, end) -> cutoff bonus
+        self.pv_table = [[] for _ in range(MAX_PLY + 1)]
+        self.root_undo_depth = 0
+
+    def search(self, position, time_limit=2.0, max_depth=MAX_PLY, info_callback=None, start_depth=1):
+        # Iterative deepening: each finished depth seeds the move ordering of
+        # the next one, and the last finished depth is played if time runs out
+        self.nodes = 0
+        self.tablebase_hits = 0
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {}
+        self.tt.new_search()
+        self.root_undo_depth = len(position.undo_stack)
+        start_time = time.perf_counter()
+        self.deadline = start_time + time_limit if time_limit else None
+        result = SearchResult()
+        root_moves = position.legal_moves()
+        if not root_moves:
+            return result
+        result.best_move = root_moves[0]
+        if self.tablebases is not None:
+            probed = self.tablebases.best_move(position)
+            if probed is not None:
+                result.best_move, value = probed
+                result.pv = [result.best_move]
+                result.score = tablebase_score(value, 0)
+                result.elapsed = time.perf_counter() - start_time
+                if info_callback is not None:
+                    info_callback(result)
+                return result
+
+        for depth in range(start_depth, max_depth + 1):
+            try:
+                score = self.negamax(position, depth, -INFINITY, INFINITY, 0, result.pv)
+            except SearchTimeout:
+                # Unwind the moves the interrupted search left on the board
+                while len(position.undo_stack) > self.root_undo_depth:
+                    position.unmake_move()
+                break
+            result.score = score
+            result.depth = depth
+            result.pv = list(self.pv_table[0])
+            if result.pv:
+                result.best_move = result.pv[0]
+            result.nodes = self.nodes
+            result.elapsed = time.perf_counter() - start_time
+            if info_callback is not None:
+                info_callback(result)
+            if abs(score) >= MATE_BOUND:
+                break # Forced result found
+            if time_limit and result.elapsed > time_limit / 2:
+                break # The next depth would not finish in time
+
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start_time
+        return result
+
+    def negamax(self, position, depth, alpha, beta, ply, pv_hint):
+        self.pv_table[ply] = []
+        if self.tablebases is not None and ply > 0 and position.board.occupied.bit_count() <= MAX_PIECES:
+            value = self.tablebases.probe(position)
+            if value is not None:
+                self.tablebase_hits += 1
+                return tablebase_score(value, ply)
+        if ply > 0 and (position.key_history[position.key] > 1 or position.halfmove_clock >= FIFTY_MOVE_PLIES):
+            return 0 # A repetition is scored as the draw it can be turned into
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiescence(position, alpha, beta, ply)
+        self.count_node()
+
+        original_alpha = alpha
+        pv_move = pv_hint[ply] if ply < len(pv_hint) else None
+        entry = self.tt.probe(position.key)
+        if entry is not None:
+            tt_move, tt_score, tt_depth, tt_flag = entry
+            if pv_move is None:
+                pv_move = tt_move
+            if tt_depth >= depth and ply > 0:
+                tt_score = score_from_tt(tt_score, ply)
+                if (tt_flag == EXACT or (tt_flag == LOWER and tt_score >= beta) or
+                        (tt_flag == UPPER and tt_score <= alpha)):
+                    return tt_score
+
+        moves = position.legal_moves()
+        if not moves:
+            # Checkmate or stalemate
+            return -MATE_SCORE + ply if position.in_check() else 0
+
+        best_score = -INFINITY
+        best_move = None
+        for move in self.order_moves(position, moves, ply, pv_move):
+            capture = position.make_move(move)
+            score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1, pv_hint if move == pv_move else [])
+            position.unmake_move()
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+            if alpha >= beta:
+                if capture is None:
+                    self.store_killer(move, ply)
+                    key = (move[0], move[1])
+                    self.history[key] = self.history.get(key, 0) + depth * depth
+                break
+
+        if best_score >= beta:
+            flag = LOWER
+        elif best_score > original_alpha:
+            flag = EXACT
+        else:
+            flag = UPPER
+        self.tt.store(position.key, best_move, score_to_tt(best_score, ply), depth, flag)
+        return best_score
+
+    def quiescence(self, position, alpha, beta, ply):
+        self.count_node()
+        if position.in_check():
+            # No standing pat in check: every evasion is searched
+            moves = position.legal_moves()
+            if not moves:
+                return -MATE_SCORE + ply
+            if ply >= MAX_PLY:
+                return evaluate(position)
+        else:
+            # Stand pat before generating moves: most quiet nodes cut off here
+            stand_pat = evaluate(position)
+            if stand_pat >= beta or ply >= MAX_PLY:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+            moves = [move for move in position.legal_moves() if position.is_capture(move) or move[2] == 'queen']
+        for move in self.order_moves(position, moves, ply, None):
+            position.make_move(move)
+            score = -self.quiescence(position, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def order_moves(self, position, moves, ply, pv_move):
+        squares = position.squares
+        killers = self.killers[ply] if ply < MAX_PLY else [None, None]
+
+        def score(move):
+            if move == pv_move:
+                return 10000000
+            victim = squares[COORDS_SQUARE[move[1]]]
+            if victim:
+                # MVV-LVA: most valuable victim first, cheapest attacker breaks ties
+                return 1000000 + abs(victim) * 10 - abs(squares[COORDS_SQUARE[move[0]]])
+            if move == killers[0]:
+                return 900000
+            if move == killers[1]:
+                return 800000
+            return self.history.get((move[0], move[1]), 0)
+
+        return sorted(moves, key=score, reverse=True)
+
+    def store_killer(self, move, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    def count_node(self):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+            if self.stop_flag is not None and self.stop_flag.is_set():
+                raise SearchTimeout()
+
+
+def print_info(result):
+    pv = " ".join(f"{m[0]}-{m[1]}" for m in result.pv)
+    print(f"depth {result.depth} score {result.score} nodes {result.nodes} nps {result.nps} "
+          f"time {result.elapsed:.2f}s pv {pv}")
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    result = Searcher().search(Position.starting_position(), time_limit=seconds, info_callback=print_info)
+    print(f"best {result.best_move} after {result.nodes} nodes, {result.nps} nodes/sec, "
+          f"pawn table hit rate {PAWN_TABLE.hit_rate:.1%}")
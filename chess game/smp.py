@@ -0,0 +1,156 @@
+# Lazy SMP: several processes search the same position at once and share one
+# transposition table in a multiprocessing.shared_memory block. Helpers start
+# at staggered depths so they fill the table ahead of the main search, which
+# then finds more cutoffs and hash moves. The main search runs in the calling
+# process and its result is the one played; helpers are stopped when it ends.
+# Helpers get the position as Position.packed() bytes taken before the main
+# search starts, since a Queue pickles its items later, on a feeder thread.
+# All helpers share one stop event, so a helper that has not answered after a
+# search is terminated and replaced before the event is cleared for the next:
+# otherwise its old search would run on unbounded, writing stale entries.
+#
+#   python smp.py [depth] [workers ...]    # time-to-depth benchmark, e.g. smp.py 5 1 2 4 8
+
+import multiprocessing
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+
+from position import Position
+from search import Searcher, MAX_PLY, TT_SIZE_MB
+from transposition import TranspositionTable, table_bytes
+
+REPLY_TIMEOUT = 5.0 # Seconds to wait for a stopped helper's node count
+
+
+def helper_main(shm_name, index, requests, replies, stop):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    searcher = Searcher(TranspositionTable(buffer=shm.buf))
+    searcher.stop_flag = stop
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        search_id, packed, max_depth = request
+        searcher.nodes = 0
+        try:
+            searcher.search(Position.from_packed(packed), time_limit=None,
+                            max_depth=MAX_PLY if max_depth is None else max_depth + 1, start_depth=1 + index % 2)
+        finally:
+            replies.put((search_id, index, searcher.nodes)) # Even after an error, so the caller is never left waiting
+    del searcher # Drop the views on the buffer before closing it
+    shm.close()
+
+
+class LazySMP:
+    def __init__(self, workers=2, tt_size_mb=TT_SIZE_MB):
+        self.context = multiprocessing.get_context('spawn')
+        self.shm = shared_memory.SharedMemory(create=True, size=table_bytes(tt_size_mb))
+        self.tt = TranspositionTable(buffer=self.shm.buf)
+        self.searcher = Searcher(self.tt)
+        self.stop = self.context.Event()
+        self.replies = self.context.Queue()
+        self.search_id = 0
+        self.helpers = [self.start_helper(index) for index in range(workers - 1)] # The caller is the first worker
+
+    def start_helper(self, index):
+        requests = self.context.Queue()
+        process = self.context.Process(target=helper_main, daemon=True,
+                                       args=(self.shm.name, index, requests, self.replies, self.stop))
+        process.start()
+        return process, requests
+
+    def search(self, position, time_limit=None, max_depth=MAX_PLY, info_callback=None):
+        self.stop.clear() # Safe: every helper answered its last search or has been replaced
+        self.search_id += 1
+        packed = position.packed() # Taken now: the main search below changes `position` in place
+        for _, requests in self.helpers:
+            requests.put((self.search_id, packed, max_depth))
+        try:
+            result = self.searcher.search(position, time_limit=time_limit, max_depth=max_depth,
+                                          info_callback=info_callback)
+        finally:
+            self.stop.set()
+        result.nodes += self.collect_replies()
+        return result
+
+    def collect_replies(self):
+        # Node counts of the helpers for the current search; a helper that
+        # died or does not answer in time counts as 0 and is replaced, and
+        # replies left over from an earlier search are dropped
+        nodes = 0
+        waiting = set(range(len(self.helpers)))
+        deadline = time.monotonic() + REPLY_TIMEOUT
+        while waiting:
+            try:
+                search_id, index, helper_nodes = self.replies.get(timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Empty:
+                break
+            if search_id == self.search_id:
+                nodes += helper_nodes
+                waiting.discard(index)
+        for index in waiting:
+            process, _ = self.helpers[index]
+            process.terminate()
+            process.join(timeout=5)
+            self.helpers[index] = self.start_helper(index)
+        return nodes
+
+    def clear(self):
+        self.tt.clear()
+
+    def close(self):
+        for _, requests in self.helpers:
+            requests.put(None)
+        for process, _ in self.helpers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        del self.searcher
+        self.tt.table.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Fixed benchmark suite: positions reached from the start by these moves
+BENCH_SUITE = [
+    [],
+    ["e2e4", "e7e5", "g1f3", "b8c6", "f1c4", "g8f6"],
+    ["d2d4", "d7d5", "c2c4", "e7e6", "b1c3", "g8f6", "c1g5", "f8e7"],
+    ["e2e4", "c7c5", "g1f3", "d7d6", "d2d4", "c5d4", "f3d4", "g8f6", "b1c3", "a7a6"],
+]
+
+
+def bench_position(moves):
+    position = Position.starting_position()
+    for text in moves:
+        position.make_move(position.parse_move(text))
+    return position
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    worker_counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4, 8]
+    print(f"Lazy SMP time-to-depth {depth} over {len(BENCH_SUITE)} positions "
+          f"({multiprocessing.cpu_count()} CPUs available)")
+    print(f"{'workers':>7} {'time':>8} {'nodes':>10} {'nodes/sec':>10} {'speedup':>8}")
+    baseline = None
+    for workers in worker_counts:
+        smp = LazySMP(workers)
+        total_time = total_nodes = 0
+        for moves in BENCH_SUITE:
+            smp.clear()
+            position = bench_position(moves)
+            start = time.perf_counter()
+            result = smp.search(position, max_depth=depth)
+            total_time += time.perf_counter() - start
+            total_nodes += result.nodes
+        smp.close()
+        baseline = baseline or total_time
+        print(f"{workers:>7} {total_time:>7.2f}s {total_nodes:>10} {int(total_nodes / total_time):>10} "
+              f"{baseline / total_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,543 @@
+# Endgame tablebases for positions with three or four pieces.
+#
+# generate_table() solves one material signature ("KQvK", "KRvKP", ...) by
+# retrograde analysis. Every placement of the pieces gets an index; one pass
+# over all of them finds the mates, the stalemates and the results of the
+# captures and promotions, which leave the table for smaller ones that are
+# solved first. Results then spread backwards one ply at a time by un-making
+# moves from the positions decided at the previous distance, so every entry
+# ends up with its exact distance to mate. Each entry is one signed byte for
+# the side to move:
+#   0 draw,  n > 0 mates in n plies,  n < 0 is mated in -n - 1 plies
+# Castling and en passant are ignored, as in other tablebases, so positions
+# where either is possible are not probed.
+#
+# Only the orientation with the stronger side as White is stored; a position
+# with the colors swapped is probed through its mirror image. On disk a table
+# is cut into blocks of BLOCK_ENTRIES entries that are zlib-compressed one by
+# one behind an offset index: Tablebases memory-maps the files and
+# decompresses only the block a probe lands in, keeping the most recently
+# used blocks in an LRU cache.
+#
+#   python tablebase.py generate KQvK KRvK KPvK [--dir assets/tablebases]
+#   python tablebase.py probe [--fen "<fen>"] [--dir assets/tablebases]
+
+import argparse
+import mmap
+import os
+import struct
+import time
+import zlib
+from array import array
+from collections import OrderedDict, defaultdict
+
+from bitboard import (WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, KNIGHT_ATTACKS, KING_ATTACKS,
+                      PAWN_ATTACKS, PAWN_PUSHES, PAWN_DOUBLE_PUSHES, RANK_1, RANK_8, rook_attacks,
+                      bishop_attacks, queen_attacks, iter_bits)
+from position import Position, START_FEN, move_text
+
+MAX_PIECES = 4
+BLOCK_ENTRIES = 8192
+CACHE_BLOCKS = 256 # Decompressed blocks kept by a Tablebases, 2 MB at the default block size
+MAGIC = b'CTB1'
+HEADER = struct.Struct('<4s8sII') # magic, signature, entries, entries per block
+EXTENSION = '.ctb'
+DEFAULT_TABLEBASES = os.path.join('assets', 'tablebases')
+
+PIECE_LETTERS = 'PNBRQK' # Indexed by piece type
+SIGNATURE_ORDER = (KING, QUEEN, ROOK, BISHOP, KNIGHT, PAWN)
+_ORDER = {ptype: rank for rank, ptype in enumerate(SIGNATURE_ORDER)}
+_STRENGTH = {KING: 0, QUEEN: 9, ROOK: 5, BISHOP: 3, KNIGHT: 3, PAWN: 1}
+PROMOTION_TYPES = (QUEEN, ROOK, BISHOP, KNIGHT)
+PROMOTION_NAMES = {QUEEN: 'queen', ROOK: 'rook', BISHOP: 'bishop', KNIGHT: 'knight'}
+# Nobody can be mated, so these need no table
+DRAWN_SIGNATURES = ('KvK', 'KBvK', 'KNvK')
+
+# Solver states
+UNKNOWN, WON, LOST, DRAWN, ILLEGAL = range(5)
+
+
+def signature_of(white_types, black_types):
+    def side(types):
+        return ''.join(PIECE_LETTERS[ptype] for ptype in sorted(types, key=_ORDER.get))
+    return side(white_types) + 'v' + side(black_types)
+
+
+def parse_signature(signature):
+    # ([white piece types], [black piece types]), kings first
+    try:
+        white, black = signature.upper().split('V')
+        types = ([PIECE_LETTERS.index(letter) for letter in white],
+                 [PIECE_LETTERS.index(letter) for letter in black])
+    except ValueError:
+        raise ValueError(f"Bad material signature {signature!r}") from None
+    for side in types:
+        if side.count(KING) != 1:
+            raise ValueError(f"Bad material signature {signature!r}")
+        side.sort(key=_ORDER.get)
+    if len(types[0]) + len(types[1]) > MAX_PIECES:
+        raise ValueError(f"{signature} has more than {MAX_PIECES} pieces")
+    return types
+
+
+def canonical_signature(signature):
+    # The orientation that is stored: the side with more material is White
+    white, black = parse_signature(signature)
+    strength = (sum(_STRENGTH[t] for t in white), signature_of(white, []))
+    if strength < (sum(_STRENGTH[t] for t in black), signature_of(black, [])):
+        white, black = black, white
+    return signature_of(white, black)
+
+
+def child_signatures(signature):
+    # Signatures a capture or a promotion can lead to, in either orientation
+    white, black = parse_signature(signature)
+    found = set()
+    for side, other in ((white, black), (black, white)):
+        for i, ptype in enumerate(side):
+            if ptype == KING:
+                continue
+            found.add(canonical_signature(signature_of(side[:i] + side[i + 1:], other)))
+            if ptype == PAWN:
+                for promoted in PROMOTION_TYPES:
+                    found.add(canonical_signature(signature_of(side[:i] + [promoted] + side[i + 1:], other)))
+    return sorted(found - set(DRAWN_SIGNATURES))
+
+
+class TableLayout:
+    # Index of a placement: the white king square (mirrored into one half of
+    # the board, or one quarter without pawns), then 6 bits per other piece,
+    # then the side to move
+    def __init__(self, signature):
+        self.signature = signature
+        white, black = parse_signature(signature)
+        self.pieces = [(WHITE, KING), (BLACK, KING)] + [(WHITE, t) for t in white[1:]] + [(BLACK, t) for t in black[1:]]
+        self.count = len(self.pieces)
+        self.has_pawns = any(ptype == PAWN for _, ptype in self.pieces)
+        self.king_squares = [sq for sq in range(64) if sq & 7 < 4 and (self.has_pawns or sq >> 3 < 4)]
+        self.king_index = [-1] * 64
+        for i, sq in enumerate(self.king_squares):
+            self.king_index[sq] = i
+        self.size = len(self.king_squares) * 64 ** (self.count - 1) * 2
+
+    def encode(self, squares, side):
+        king = squares[0]
+        flip = 7 if king & 7 > 3 else 0
+        if not self.has_pawns and king >> 3 > 3:
+            flip |= 56
+        index = self.king_index[king ^ flip]
+        for sq in squares[1:]:
+            index = index * 64 + (sq ^ flip)
+        return index * 2 + side
+
+    def decode(self, index):
+        side = index & 1
+        index >>= 1
+        squares = [0] * self.count
+        for i in range(self.count - 1, 0, -1):
+            index, squares[i] = divmod(index, 64)
+        squares[0] = self.king_squares[index]
+        return squares, side
+
+    def arrange(self, pieces):
+        # Squares in layout order for [(color, type, square)] of this signature
+        return [sq for _, _, sq in sorted(pieces, key=lambda p: (p[1] != KING, p[0], _ORDER[p[1]]))]
+
+
+def _attacks(color, ptype, sq, occupied):
+    if ptype == PAWN:
+        return PAWN_ATTACKS[color][sq]
+    if ptype == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if ptype == BISHOP:
+        return bishop_attacks(sq, occupied)
+    if ptype == ROOK:
+        return rook_attacks(sq, occupied)
+    if ptype == QUEEN:
+        return queen_attacks(sq, occupied)
+    return KING_ATTACKS[sq]
+
+
+def _attacked(pieces, squares, target, by_color, occupied, skip=-1):
+    # Whether a piece of by_color (other than pieces[skip]) attacks target
+    bit = 1 << target
+    for i, (color, ptype) in enumerate(pieces):
+        if color == by_color and i != skip and _attacks(color, ptype, squares[i], occupied) & bit:
+            return True
+    return False
+
+
+def _targets(color, ptype, sq, occupied, own):
+    if ptype != PAWN:
+        return _attacks(color, ptype, sq, occupied) & ~own
+    targets = PAWN_ATTACKS[color][sq] & occupied & ~own
+    push = PAWN_PUSHES[color][sq]
+    if push and not push & occupied:
+        targets |= push
+        double = PAWN_DOUBLE_PUSHES[color][sq]
+        if not double & occupied:
+            targets |= double
+    return targets
+
+
+def _retro_targets(color, ptype, sq, occupied):
+    # Squares the piece on sq could have come from without capturing
+    if ptype != PAWN:
+        return _attacks(color, ptype, sq, occupied) & ~occupied
+    back = PAWN_PUSHES[color ^ 1][sq] & ~(RANK_1 | RANK_8) & ~occupied
+    if back and sq >> 3 == (3 if color == WHITE else 4):
+        back |= PAWN_PUSHES[color ^ 1][sq - 8 if color == WHITE else sq + 8] & ~occupied
+    return back
+
+
+def _legal(pieces, squares, side):
+    occupied = 0
+    for (_, ptype), sq in zip(pieces, squares):
+        bit = 1 << sq
+        if occupied & bit or (ptype == PAWN and bit & (RANK_1 | RANK_8)):
+            return False
+        occupied |= bit
+    # The side that just moved cannot be in check
+    return not _attacked(pieces, squares, squares[side ^ 1], side, occupied)
+
+
+def generate_table(signature, tablebases):
+    # Solves `signature` (canonical orientation) and returns its values as a
+    # bytearray; the tables of child_signatures() must already be in
+    # `tablebases`
+    layout = TableLayout(signature)
+    pieces = layout.pieces
+    count = layout.count
+    size = layout.size
+    state = bytearray(size)
+    dist = array('H', bytes(2 * size))
+    remaining = bytearray(size) # Moves that stay in the table and are not known to lose
+    longest = array('H', bytes(2 * size)) # Longest loss through a capture or promotion
+    escape = bytearray(size) # A capture or promotion draws
+    buckets = defaultdict(list) # Distance -> positions decided at it
+
+    for index in range(size):
+        squares, side = layout.decode(index)
+        if not _legal(pieces, squares, side):
+            state[index] = ILLEGAL
+            continue
+        occupied = 0
+        own = [0, 0]
+        for (color, _), sq in zip(pieces, squares):
+            occupied |= 1 << sq
+            own[color] |= 1 << sq
+        king = squares[side]
+        moves = in_table = best_win = loss = 0
+        draw = False
+        for i in range(count):
+            color, ptype = pieces[i]
+            if color != side:
+                continue
+            start = squares[i]
+            for target in iter_bits(_targets(color, ptype, start, occupied, own[color])):
+                bit = 1 << target
+                captured = squares.index(target) if occupied & bit else -1
+                after = squares[:]
+                after[i] = target
+                if _attacked(pieces, after, target if i == side else king, side ^ 1,
+                             occupied ^ (1 << start) | bit, captured):
+                    continue
+                moves += 1
+                promotions = PROMOTION_TYPES if ptype == PAWN and bit & (RANK_1 | RANK_8) else None
+                if captured < 0 and promotions is None:
+                    in_table += 1
+                    continue
+                rest = [(c, t, sq) for j, ((c, t), sq) in enumerate(zip(pieces, after)) if j != captured and j != i]
+                for promoted in promotions or (ptype,):
+                    value = tablebases.value(rest + [(color, promoted, target)], side ^ 1)
+                    if value is None:
+                        raise ValueError(f"{signature} needs the tables {', '.join(child_signatures(signature))}")
+                    if value < 0:
+                        if not best_win or value > best_win:
+                            best_win = value # -value plies to mate
+                    elif value > 0:
+                        loss = max(loss, value + 1)
+                    else:
+                        draw = True
+        if not moves:
+            if _attacked(pieces, squares, king, side ^ 1, occupied):
+                state[index] = LOST
+                buckets[0].append(index)
+            else:
+                state[index] = DRAWN
+        elif best_win:
+            state[index] = WON
+            dist[index] = -best_win
+            buckets[-best_win].append(index)
+        elif not in_table and not draw:
+            state[index] = LOST
+            dist[index] = loss
+            buckets[loss].append(index)
+        else:
+            remaining[index] = in_table
+            longest[index] = loss
+            escape[index] = draw
+
+    distance = 0
+    while buckets:
+        for index in buckets.pop(distance, ()):
+            if dist[index] != distance:
+                continue # Superseded by a shorter win
+            squares, side = layout.decode(index)
+            won = state[index] == WON
+            mover = side ^ 1
+            occupied = 0
+            for sq in squares:
+                occupied |= 1 << sq
+            for i in range(count):
+                color, ptype = pieces[i]
+                if color != mover:
+                    continue
+                target = squares[i]
+                for start in iter_bits(_retro_targets(color, ptype, target, occupied)):
+                    before = squares[:]
+                    before[i] = start
+                    before_occupied = occupied ^ (1 << target) | (1 << start)
+                    if _attacked(pieces, before, squares[side], mover, before_occupied):
+                        continue # The side now to move would have been left in check
+                    previous = layout.encode(before, mover)
+                    previous_state = state[previous]
+                    if won:
+                        # This move lets the opponent win; lost once every move does
+                        if previous_state != UNKNOWN:
+                            continue
+                        remaining[previous] -= 1
+                        if not remaining[previous] and not escape[previous]:
+                            state[previous] = LOST
+                            dist[previous] = max(distance + 1, longest[previous])
+                            buckets[dist[previous]].append(previous)
+                    elif previous_state == UNKNOWN or (previous_state == WON and dist[previous] > distance + 1):
+                        state[previous] = WON
+                        dist[previous] = distance + 1
+                        buckets[distance + 1].append(previous)
+        distance += 1
+
+    values = bytearray(size)
+    for index in range(size):
+        if state[index] == WON:
+            values[index] = min(dist[index], 127)
+        elif state[index] == LOST:
+            values[index] = -(min(dist[index], 127) + 1) & 0xFF
+    return values
+
+
+def write_table(path, signature, values):
+    blocks = [zlib.compress(bytes(values[start:start + BLOCK_ENTRIES]), 9)
+              for start in range(0, len(values), BLOCK_ENTRIES)]
+    offsets = array('Q')
+    offset = HEADER.size + 8 * (len(blocks) + 1)
+    for block in blocks:
+        offsets.append(offset)
+        offset += len(block)
+    offsets.append(offset)
+    if offsets.itemsize != 8 or struct.pack('=H', 1) != struct.pack('<H', 1):
+        raise RuntimeError("Tablebase files need a little-endian platform with 8-byte array('Q')")
+    with open(path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, signature.encode('ascii'), len(values), BLOCK_ENTRIES))
+        out.write(offsets.tobytes())
+        for block in blocks:
+            out.write(block)
+
+
+class TableFile:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, signature, self.entries, self.block_entries = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a tablebase file")
+        self.signature = signature.rstrip(b'\0').decode('ascii')
+        self.layout = TableLayout(self.signature)
+        blocks = -(-self.entries // self.block_entries)
+        self.offsets = array('Q')
+        self.offsets.frombytes(self.data[HEADER.size:HEADER.size + 8 * (blocks + 1)])
+
+    def block(self, number):
+        return zlib.decompress(self.data[self.offsets[number]:self.offsets[number + 1]])
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class Tablebases:
+    def __init__(self, directory=DEFAULT_TABLEBASES, cache_blocks=CACHE_BLOCKS):
+        self.directory = directory
+        self.tables = {} # Canonical signature -> TableFile
+        self.cache = OrderedDict() # (signature, block) -> decompressed bytes, oldest first
+        self.cache_blocks = cache_blocks
+        self.hits = 0
+        self.misses = 0
+        if os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(EXTENSION):
+                    self.add(os.path.join(directory, name))
+
+    def add(self, path):
+        table = TableFile(path)
+        old = self.tables.pop(table.signature, None)
+        if old is not None:
+            old.close()
+            for key in [key for key in self.cache if key[0] == table.signature]:
+                del self.cache[key]
+        self.tables[table.signature] = table
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables.clear()
+        self.cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _entry(self, table, index):
+        number, offset = divmod(index, table.block_entries)
+        key = (table.signature, number)
+        block = self.cache.get(key)
+        if block is None:
+            self.misses += 1
+            block = table.block(number)
+            self.cache[key] = block
+            if len(self.cache) > self.cache_blocks:
+                self.cache.popitem(last=False)
+        else:
+            self.hits += 1
+            self.cache.move_to_end(key)
+        value = block[offset]
+        return value - 256 if value > 127 else value
+
+    def value(self, pieces, side):
+        # Value for `side` to move with [(color, type, square)] on the board,
+        # or None without a table
+        signature = signature_of([t for c, t, _ in pieces if c == WHITE], [t for c, t, _ in pieces if c == BLACK])
+        if signature in DRAWN_SIGNATURES:
+            return 0
+        table = self.tables.get(signature)
+        if table is None:
+            # Probe the color-swapped mirror image
+            pieces = [(color ^ 1, ptype, sq ^ 56) for color, ptype, sq in pieces]
+            side ^= 1
+            signature = signature_of([t for c, t, _ in pieces if c == WHITE], [t for c, t, _ in pieces if c == BLACK])
+            if signature in DRAWN_SIGNATURES:
+                return 0
+            table = self.tables.get(signature)
+            if table is None:
+                return None
+        return self._entry(table, table.layout.encode(table.layout.arrange(pieces), side))
+
+    def probe(self, position):
+        # Value for the side to move in a Position, or None when no table covers it
+        board = position.board
+        if board.occupied.bit_count() > MAX_PIECES or position.castling or position.ep_square is not None:
+            return None
+        pieces = [(color, ptype, sq) for color in (WHITE, BLACK) for ptype in range(6)
+                  for sq in iter_bits(board.pieces[color][ptype])]
+        return self.value(pieces, WHITE if position.turn == 'white' else BLACK)
+
+    def best_move(self, position):
+        # (move, value) keeping the best result in the fewest plies when
+        # winning and the most when losing, or None when a table is missing
+        value = self.probe(position)
+        if value is None:
+            return None
+        best = None
+        for move in position.legal_moves():
+            position.make_move(move)
+            reply = self.probe(position)
+            position.unmake_move()
+            if reply is None:
+                return None
+            # Rank by result first, then by distance in the right direction
+            rank = (2, reply) if reply < 0 else (1, 0) if reply == 0 else (0, reply)
+            if best is None or rank > best[0]:
+                best = (rank, move)
+        return (best[1], value) if best is not None else None
+
+    @property
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+
+def open_tablebases(directory=DEFAULT_TABLEBASES):
+    # A Tablebases over the tables in `directory`, or None if it has none
+    tablebases = Tablebases(directory)
+    if not tablebases.tables:
+        tablebases.close()
+        return None
+    return tablebases
+
+
+def describe(value):
+    if value is None:
+        return "not in the tablebases"
+    if value > 0:
+        return f"win, mate in {value} plies"
+    if value < 0:
+        return f"loss, mated in {-value - 1} plies"
+    return "draw"
+
+
+def generate(signatures, directory=DEFAULT_TABLEBASES, log=print):
+    # Writes the tables for `signatures` and everything they depend on,
+    # skipping tables that already exist in `directory`
+    os.makedirs(directory, exist_ok=True)
+    with Tablebases(directory, cache_blocks=4096) as tablebases:
+        def solve(signature):
+            signature = canonical_signature(signature)
+            if signature in tablebases.tables or signature in DRAWN_SIGNATURES:
+                return
+            for child in child_signatures(signature):
+                solve(child)
+            start = time.perf_counter()
+            values = generate_table(signature, tablebases)
+            path = os.path.join(directory, signature + EXTENSION)
+            write_table(path, signature, values)
+            tablebases.add(path)
+            elapsed = time.perf_counter() - start
+            wins = sum(1 for v in values if 0 < v < 128)
+            losses = sum(1 for v in values if v >= 128)
+            longest = max((v for v in values if v < 128), default=0)
+            log(f"{signature}: {len(values)} positions in {elapsed:.1f}s ({len(values) / elapsed:.0f}/sec), "
+                f"{wins} wins, {losses} losses, longest mate {longest} plies, "
+                f"{os.path.getsize(path)} bytes on disk")
+
+        for signature in signatures:
+            solve(signature)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    parser.add_argument('--dir', default=DEFAULT_TABLEBASES)
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('generate')
+    build.add_argument('signatures', nargs='+', help="material such as KQvK or KRvKP")
+    probe = commands.add_parser('probe')
+    probe.add_argument('--fen', default=START_FEN)
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        generate(args.signatures, args.dir)
+        return
+    position = Position.from_fen(args.fen)
+    with Tablebases(args.dir) as tablebases:
+        value = tablebases.probe(position)
+        print(f"{args.fen}: {describe(value)}")
+        found = tablebases.best_move(position)
+        if found is not None:
+            print(f"best move {move_text(found[0])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Fixed-size transposition table for the search. Entries live in one flat
+# array('Q') rather than a dict of objects, so memory is bounded by the MB
+# budget given up front. Each bucket holds two entries: slot 0 is
+# depth-preferred (only overwritten by deeper or newer results), slot 1 is
+# always replaced.
+#
+# The table can also sit on an external buffer such as a
+# multiprocessing.shared_memory block, so several search processes share it
+# (see smp.py). Writes are not locked; instead the first word of an entry is
+# the key XOR-ed with the data word, so an entry torn by two concurrent writers
+# simply fails to match on probe.
+#
+# An entry is two 64-bit words: key ^ data and a packed data word
+#   bits  0-15  move (from square, to square, promotion)
+#   bits 16-37  score + SCORE_OFFSET
+#   bits 38-45  depth
+#   bits 46-47  bound flag
+#   bits 48-55  search age
+
+from array import array
+
+from bitboard import PIECE_NAMES, PIECE_TYPES, square_of, coords_of
+
+EXACT, LOWER, UPPER = 1, 2, 3
+SCORE_OFFSET = 1 << 21
+ENTRY_BYTES = 16
+BUCKET_ENTRIES = 2
+
+
+def encode_move(move):
+    if move is None:
+        return 0
+    start, end, promotion = move
+    promo = PIECE_TYPES[promotion] + 1 if promotion else 0
+    return square_of(*start) | (square_of(*end) << 6) | (promo << 12)
+
+
+def decode_move(code):
+    if not code:
+        return None
+    promo = code >> 12
+    return (coords_of(code & 63), coords_of((code >> 6) & 63), PIECE_NAMES[promo - 1] if promo else None)
+
+
+def table_bytes(size_mb=None, available=None):
+    # Largest power-of-two bucket count (so the index is a mask) within the budget
+    available = available if available is not None else int(size_mb * 1024 * 1024)
+    buckets = max(1, available // (ENTRY_BYTES * BUCKET_ENTRIES))
+    buckets = 1 << (buckets.bit_length() - 1)
+    return buckets * BUCKET_ENTRIES * ENTRY_BYTES
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16, buffer=None):
+        if buffer is None:
+            self.table = array('Q', bytes(table_bytes(size_mb)))
+        else:
+            usable = table_bytes(available=len(buffer))
+            self.table = memoryview(buffer)[:usable].cast('Q')
+        self.mask = len(self.table) // (BUCKET_ENTRIES * 2) - 1
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    @property
+    def size_bytes(self):
+        return len(self.table) * self.table.itemsize
+
+    def clear(self):
+        memoryview(self.table).cast('B')[:] = bytes(self.size_bytes)
+        self.age = 0
+        self.probes = self.hits = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key):
+        # Returns (move, score, depth, flag) or None
+        self.probes += 1
+        base = (key & self.mask) * (BUCKET_ENTRIES * 2)
+        table = self.table
+        for slot in range(base, base + BUCKET_ENTRIES * 2, 2):
+            data = table[slot + 1]
+            if table[slot] ^ data == key:
+                if data:
+                    self.hits += 1
+                    return (decode_move(data & 0xFFFF), ((data >> 16) & 0x3FFFFF) - SCORE_OFFSET,
+                            (data >> 38) & 0xFF, (data >> 46) & 3)
+        return None
+
+    def store(self, key, move, score, depth, flag):
+        data = (encode_move(move) | ((score + SCORE_OFFSET) << 16) | (min(depth, 255) << 38) |
+                (flag << 46) | (self.age << 48))
+        base = (key & self.mask) * (BUCKET_ENTRIES * 2)
+        table = self.table
+        old = table[base + 1]
+        same_key = table[base] ^ old == key
+        if same_key or not old or old >> 48 != self.age or depth >= (old >> 38) & 0xFF:
+            if same_key and move is None:
+                data |= old & 0xFFFF # Keep the best move we already knew
+            table[base] = key ^ data
+            table[base + 1] = data
+        else:
+            table[base + 2] = key ^ data
+            table[base + 3] = data
+
+    def hashfull(self):
+        # Permille of sampled depth-preferred slots written during the current search
+        sample = min(1000, (self.mask + 1))
+        used = sum(1 for i in range(sample)
+                   if self.table[i * BUCKET_ENTRIES * 2 + 1] and
+                   self.table[i * BUCKET_ENTRIES * 2 + 1] >> 48 == self.age)
+        return used * 1000 // sample
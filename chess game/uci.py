@@ -0,0 +1,199 @@
+# UCI (Universal Chess Interface) front-end for the engine in search.py, so
+# it can be driven by any chess GUI or match runner without Tk:
+#
+#   python uci.py
+#
+# Commands are read from stdin one line at a time. A `go` starts the search
+# on a thread and returns at once, so `stop`, `isready` and `quit` are
+# answered while it runs; the search thread prints the info lines and the
+# final bestmove. Supported: uci, isready, setoption (Hash, OwnBook,
+# TablebasePath), ucinewgame, position [startpos | fen ...] [moves ...],
+# go [wtime btime winc binc movestogo movetime depth infinite], stop, quit.
+
+import os
+import sys
+import threading
+
+from book import OpeningBook, DEFAULT_BOOK
+from clock import time_for_move
+from position import Position, START_FEN, move_text
+from search import Searcher, MATE_SCORE, MATE_BOUND, MAX_PLY, TT_SIZE_MB
+from tablebase import Tablebases, DEFAULT_TABLEBASES
+from transposition import TranspositionTable
+
+ENGINE_NAME = "Chess-Game"
+ENGINE_AUTHOR = "HujaifaBytes"
+MOVE_OVERHEAD = 0.05 # Seconds kept back per move for process and pipe latency
+
+
+def score_text(score):
+    # 'cp 35' or 'mate 3' / 'mate -2' (moves, not plies)
+    if score >= MATE_BOUND:
+        return f"mate {(MATE_SCORE - score + 1) // 2}"
+    if score <= -MATE_BOUND:
+        return f"mate -{(MATE_SCORE + score) // 2}"
+    return f"cp {score}"
+
+
+class UCIEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock() # The search thread prints too
+        self.searcher = Searcher()
+        self.position = Position.starting_position()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.own_book = True
+        self.book = OpeningBook(DEFAULT_BOOK) if os.path.exists(DEFAULT_BOOK) else None
+        self.set_tablebases(DEFAULT_TABLEBASES)
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def set_tablebases(self, directory):
+        if self.searcher.tablebases is not None:
+            self.searcher.tablebases.close()
+        tablebases = Tablebases(directory)
+        self.searcher.tablebases = tablebases if tablebases.tables else None
+
+    def run(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line.split()):
+                break
+        self.stop_search()
+
+    def handle(self, tokens):
+        # Returns False on quit; unknown commands are ignored as the protocol asks
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {TT_SIZE_MB} min 1 max 1024")
+            self.send("option name OwnBook type check default true")
+            self.send(f"option name TablebasePath type string default {DEFAULT_TABLEBASES}")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'setoption':
+            self.stop_search()
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.searcher.tt.clear()
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop_search()
+            self.go(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'quit':
+            return False
+        return True
+
+    def set_option(self, args):
+        # setoption name <name words> [value <value words>]
+        text = ' '.join(args)
+        name, _, value = text.partition(' value ')
+        name = name.removeprefix('name ').strip().lower()
+        value = value.strip()
+        try:
+            if name == 'hash':
+                self.searcher.tt = TranspositionTable(max(1, int(value)))
+            elif name == 'ownbook':
+                self.own_book = value.lower() == 'true'
+            elif name == 'tablebasepath':
+                self.set_tablebases(value)
+        except ValueError:
+            self.send(f"info string bad value for option {name}: {value}")
+
+    def set_position(self, args):
+        if 'moves' in args:
+            split = args.index('moves')
+            spec, moves = args[:split], args[split + 1:]
+        else:
+            spec, moves = args, []
+        try:
+            if spec[:1] == ['fen']:
+                position = Position.from_fen(' '.join(spec[1:]))
+            else:
+                position = Position.from_fen(START_FEN)
+        except ValueError as e:
+            self.send(f"info string invalid position: {e}")
+            return
+        for text in moves:
+            move = position.parse_move(text)
+            if move is None:
+                self.send(f"info string illegal move {text}, ignoring the rest")
+                break
+            position.make_move(move)
+        self.position = position
+
+    def go(self, args):
+        options = {}
+        for i, token in enumerate(args):
+            if token in ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'movetime', 'depth') and i + 1 < len(args):
+                options[token] = int(args[i + 1])
+        if 'movetime' in options:
+            time_limit = max(options['movetime'] / 1000 - MOVE_OVERHEAD, 0.01)
+        elif 'wtime' in options or 'btime' in options:
+            side = 'w' if self.position.turn == 'white' else 'b'
+            time_left = max(options.get(side + 'time', 0) / 1000 - MOVE_OVERHEAD, 0.0)
+            time_limit = time_for_move(time_left, options.get(side + 'inc', 0) / 1000, options.get('movestogo'))
+        else:
+            time_limit = None # depth, infinite or a bare go: search until stopped or the depth is done
+        max_depth = min(options.get('depth', MAX_PLY), MAX_PLY)
+        infinite = 'infinite' in args
+        if infinite:
+            time_limit, max_depth = None, MAX_PLY
+
+        self.stop_event.clear()
+        self.searcher.stop_flag = self.stop_event
+        # Every command that changes the position stops the search first
+        self.thread = threading.Thread(target=self._search, args=(self.position, time_limit, max_depth, infinite),
+                                       daemon=True)
+        self.thread.start()
+
+    def _search(self, position, time_limit, max_depth, infinite=False):
+        # With go infinite the bestmove may only follow a stop, even when the
+        # search ends early on a forced mate or a tablebase hit
+        if self.own_book and self.book is not None and not infinite:
+            move = self.book.choose(position)
+            if move is not None:
+                self.send(f"bestmove {move_text(move)}")
+                return
+
+        def send_info(result):
+            pv = ' '.join(move_text(move) for move in result.pv)
+            self.send(f"info depth {result.depth} score {score_text(result.score)} nodes {result.nodes} "
+                      f"nps {result.nps} time {int(result.elapsed * 1000)} hashfull {self.searcher.tt.hashfull()} "
+                      f"tbhits {self.searcher.tablebase_hits} pv {pv}")
+
+        result = self.searcher.search(position, time_limit=time_limit, max_depth=max_depth, info_callback=send_info)
+        if infinite:
+            self.stop_event.wait()
+        if result.best_move is None:
+            self.send("bestmove 0000") # No legal move: mate or stalemate
+        elif len(result.pv) > 1:
+            self.send(f"bestmove {move_text(result.best_move)} ponder {move_text(result.pv[1])}")
+        else:
+            self.send(f"bestmove {move_text(result.best_move)}")
+
+    def stop_search(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+
+def main():
+    UCIEngine().run()
+
+
+if __name__ == "__main__":
+    main()
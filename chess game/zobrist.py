@@ -0,0 +1,36 @@
+# Zobrist keys for chess positions. Position keeps its key up to date on every
+# make/unmake by XOR-ing the entries for the squares a move changes.
+
+import random
+
+from bitboard import WHITE, BLACK, PAWN, iter_bits
+
+_rng = random.Random(0x5EED) # Fixed seed so keys are stable between runs and processes
+
+PIECE_KEYS = [[[_rng.getrandbits(64) for _ in range(64)] for _ in range(6)] for _ in range(2)]
+SIDE_KEY = _rng.getrandbits(64) # XOR-ed in when Black is to move
+CASTLING_KEYS = [_rng.getrandbits(64) for _ in range(16)] # Indexed by the castling rights bits
+EP_KEYS = [_rng.getrandbits(64) for _ in range(8)] # Indexed by the en passant file
+
+
+def compute_key(board, turn, castling=0, ep_square=None):
+    key = 0
+    for color in (WHITE, BLACK):
+        for piece_type in range(6):
+            for square in iter_bits(board.pieces[color][piece_type]):
+                key ^= PIECE_KEYS[color][piece_type][square]
+    if turn == 'black':
+        key ^= SIDE_KEY
+    key ^= CASTLING_KEYS[castling]
+    if ep_square is not None:
+        key ^= EP_KEYS[ep_square & 7]
+    return key
+
+
+def compute_pawn_key(board):
+    # Key of the pawns alone, for the pawn-structure cache in evaluation.py
+    key = 0
+    for color in (WHITE, BLACK):
+        for square in iter_bits(board.pieces[color][PAWN]):
+            key ^= PIECE_KEYS[color][PAWN][square]
+    return key